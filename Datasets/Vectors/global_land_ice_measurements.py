@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
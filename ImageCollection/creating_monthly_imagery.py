@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
@@ -53,16 +66,13 @@ Date_window = ee.Number(30)
 
 # Create list of dates for time series
 n_months = Date_End.difference(Date_Start, 'month').round()
-print("Number of months:", n_months.getInfo())
-dates = ee.List.sequence(0, n_months, 1)
-print(dates.getInfo())
+months = ee.List.sequence(0, n_months, 1)
 
 def make_datelist(n):
     return Date_Start.advance(n, 'month')
 
 
-dates = dates.map(make_datelist)
-print(dates.getInfo())
+dates = months.map(make_datelist)
 
 
 def fnc(d1):
@@ -83,9 +93,21 @@ def fnc(d1):
 
 
 list_of_images = dates.map(fnc)
-print('list_of_images', list_of_images.getInfo())
 mt = ee.ImageCollection(list_of_images)
-print(mt.getInfo())
+
+# Fetch all values in one request instead of one request per print.
+info = ee.Dictionary({
+    'n_months': n_months,
+    'months': months,
+    'dates': dates,
+    'list_of_images': list_of_images,
+    'mt': mt,
+}).getInfo()
+print("Number of months:", info['n_months'])
+print(info['months'])
+print(info['dates'])
+print('list_of_images', info['list_of_images'])
+print(info['mt'])
 # Map.addLayer(mt, {}, 'mt')
 
 
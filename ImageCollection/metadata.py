@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
@@ -50,27 +63,38 @@ collection = ee.ImageCollection('LANDSAT/LC08/C01/T1_TOA') \
     .filter(ee.Filter.eq('WRS_PATH', 44)) \
     .filter(ee.Filter.eq('WRS_ROW', 34)) \
     .filterDate('2014-03-01', '2014-08-01')
-print('Collection: ', collection.getInfo())
 
 # Get the number of images.
 count = collection.size()
-print('Count: ', count.getInfo())
 
 # Get the date range of images in the collection.
 range = collection.reduceColumns(ee.Reducer.minMax(), ["system:time_start"])
-print('Date range: ', ee.Date(range.get('min')).getInfo(), ee.Date(range.get('max')).getInfo())
 
 # Get statistics for a property of the images in the collection.
 sunStats = collection.aggregate_stats('SUN_ELEVATION')
-print('Sun elevation statistics: ', sunStats.getInfo())
 
 # Sort by a cloud cover property, get the least cloudy image.
 image = ee.Image(collection.sort('CLOUD_COVER').first())
-print('Least cloudy image: ', image.getInfo())
 
 # Limit the collection to the 10 most recent images.
 recent = collection.sort('system:time_start', False).limit(10)
-print('Recent images: ', recent.getInfo())
+
+# Fetch all metadata in one request instead of one request per value.
+info = ee.Dictionary({
+    'collection': collection,
+    'count': count,
+    'min_date': ee.Date(range.get('min')),
+    'max_date': ee.Date(range.get('max')),
+    'sun_stats': sunStats,
+    'image': image,
+    'recent': recent,
+}).getInfo()
+print('Collection: ', info['collection'])
+print('Count: ', info['count'])
+print('Date range: ', info['min_date'], info['max_date'])
+print('Sun elevation statistics: ', info['sun_stats'])
+print('Least cloudy image: ', info['image'])
+print('Recent images: ', info['recent'])
 
 
 
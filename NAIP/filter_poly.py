@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
@@ -54,15 +67,21 @@ polys = ee.Geometry.Polygon(
           [-99.30267333984375, 46.77321343419932]]])
 
 centroid = polys.centroid()
-lng, lat = centroid.getInfo()['coordinates']
-print("lng = {}, lat = {}".format(lng, lat))
-
-lng_lat = ee.Geometry.Point(lng, lat)
 naip = collection.filterBounds(polys)
 naip_2015 = naip.filterDate('2015-01-01', '2015-12-31')
 ppr = naip_2015.mosaic()
 
-count = naip_2015.size().getInfo()
+# Fetch the centroid and the image names in one request instead of one request per value.
+info = ee.Dictionary({
+    'centroid': centroid.coordinates(),
+    'names': naip_2015.aggregate_array('system:index'),
+}).getInfo()
+lng, lat = info['centroid']
+print("lng = {}, lat = {}".format(lng, lat))
+
+lng_lat = ee.Geometry.Point(lng, lat)
+names = info['names']
+count = len(names)
 print("Count: ", count)
 
 # print(naip_2015.size().getInfo())
@@ -74,9 +93,8 @@ print("Count: ", count)
 downConfig = {'scale': 30, "maxPixels": 1.0E13, 'driveFolder': 'image'}  # scale means resolution.
 img_lst = naip_2015.toList(100)
 
-for i in range(0, count):
+for i, name in enumerate(names):
     image = ee.Image(img_lst.get(i))
-    name = image.get('system:index').getInfo()
     # print(name)
     task = ee.batch.Export.image(image, name, downConfig)
     task.start()
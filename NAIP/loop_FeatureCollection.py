@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
@@ -57,11 +70,17 @@ fromFT = ee.FeatureCollection('ft:1CLldB-ULPyULBT2mxoRNv7enckVF0gCQoD2oH7XP')
 # print(count)
 polys = fromFT.geometry()
 centroid = polys.centroid()
-lng, lat = centroid.getInfo()['coordinates']
+
+# Fetch the centroid and the watershed names in one request instead of one request per value.
+info = ee.Dictionary({
+    'centroid': centroid.coordinates(),
+    'values': fromFT.reduceColumns(ee.Reducer.toList(2), ['system:index', 'name']).get('list'),
+}).getInfo()
+lng, lat = info['centroid']
 # print("lng = {}, lat = {}".format(lng, lat))
 
 
-values = fromFT.reduceColumns(ee.Reducer.toList(2), ['system:index', 'name']).getInfo()['list']
+values = info['values']
 # print(values)
 Map.setCenter(lng, lat, 10)
 
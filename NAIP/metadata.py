@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
@@ -69,21 +82,16 @@ naip_2015 = naip.filterDate('2010-01-01', '2015-12-31')
 
 image = ee.Image('USDA/NAIP/DOQQ/m_4609915_sw_14_1_20100629')
 bandNames = image.bandNames()
-print('Band names: ', bandNames.getInfo())
 
 b_nir = image.select('N')
 
 proj = b_nir.projection()
-print('Projection: ', proj.getInfo())
 
 props = b_nir.propertyNames()
-print(props.getInfo())
 
 img_date = ee.Date(image.get('system:time_start'))
-print('Timestamp: ', img_date.getInfo())
 
 id = image.get('system:index')
-print(id.getInfo())
 
 # print(image.getInfo())
 
@@ -93,14 +101,31 @@ vis = {'bands': ['N', 'R', 'G']}
 
 
 size = naip_2015.toList(100).length()
-print("Number of images: ", size.getInfo())
 
 count = naip_2015.size()
-print("Count: ", count.getInfo())
 
 dates = ee.List(naip_2015.get('date_range'))
 date_range = ee.DateRange(dates.get(0),dates.get(1))
-print("Date range: ", date_range.getInfo())
+
+# Fetch all values in one request instead of one request per value.
+info = ee.Dictionary({
+    'band_names': bandNames,
+    'projection': proj,
+    'properties': props,
+    'timestamp': img_date,
+    'id': id,
+    'size': size,
+    'count': count,
+    'date_range': date_range,
+}).getInfo()
+print('Band names: ', info['band_names'])
+print('Projection: ', info['projection'])
+print(info['properties'])
+print('Timestamp: ', info['timestamp'])
+print(info['id'])
+print("Number of images: ", info['size'])
+print("Count: ", info['count'])
+print("Date range: ", info['date_range'])
 
 
 # %%
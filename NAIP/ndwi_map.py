@@ -15,18 +15,31 @@ The following script checks if the geemap package has been installed. If not, it
 """
 
 # %%
-# Installs geemap package
+# Installs geemap package if it is not found. The check does not import geemap.
+import sys
 import subprocess
+import importlib.util
 
-try:
-    import geemap
-except ImportError:
+if importlib.util.find_spec('geemap') is None:
     print('Installing geemap ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
+    subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'geemap'])
 
 # %%
 import ee
-import geemap
+
+# Checks whether this notebook is running on Google Colab, which does not support ipyleaflet
+try:
+    import google.colab
+    import geemap.eefolium as geemap
+except ImportError:
+    import geemap
+
+# Authenticates and initializes Earth Engine
+try:
+    ee.Initialize()
+except Exception as e:
+    ee.Authenticate()
+    ee.Initialize()
 
 # %%
 """
@@ -55,15 +68,21 @@ polys = fromFT.geometry()
 #           [-99.30267333984375, 46.77321343419932]]])
 
 centroid = polys.centroid()
-lng, lat = centroid.getInfo()['coordinates']
-print("lng = {}, lat = {}".format(lng, lat))
-
-lng_lat = ee.Geometry.Point(lng, lat)
 naip = collection.filterBounds(polys)
 naip_2015 = naip.filterDate('2015-01-01', '2015-12-31')
 ppr = naip_2015.mosaic()
 
-count = naip_2015.size().getInfo()
+# Fetch the centroid and both counts in one request instead of one request per value.
+info = ee.Dictionary({
+    'centroid': centroid.coordinates(),
+    'count': naip_2015.size(),
+    'watersheds': fromFT.size(),
+}).getInfo()
+lng, lat = info['centroid']
+print("lng = {}, lat = {}".format(lng, lat))
+
+lng_lat = ee.Geometry.Point(lng, lat)
+count = info['count']
 print("Count: ", count)
 
 # print(naip_2015.size().getInfo())
@@ -113,7 +132,7 @@ taskParams = {
     'fileFormat': 'KML'
 }
 
-count = fromFT.size().getInfo()
+count = info['watersheds']
 Map.setCenter(lng, lat, 10)
 
 for i in range(2, 2 + count):
@@ -0,0 +1,265 @@
+''' Build the notebook gallery incrementally, like make.
+
+Every artifact is a node with its input files and the nodes it depends on:
+
+    X.js + template.py  ->  X.py, X_qgis.py, X.ipynb  ->  executed X.ipynb
+
+A node is rebuilt when the hash of its inputs or the signature of one of its dependencies changed since the last build,
+when one of its outputs is missing, or when a node it depends on is rebuilt. Independent nodes are built in parallel.
+
+Usage: python build_gallery.py [--in_dir ../JavaScripts] [--jobs 4] [--dry-run] [--no-execute]
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import json
+import time
+import queue
+import hashlib
+import argparse
+import multiprocessing
+from pathlib import Path
+
+from convert_js_to_python import (converter_version, file_hash, read_manifest, write_manifest, _convert_file,
+                                  js_to_targets, execute_notebook, write_notebook)
+
+
+class Node(object):
+    """An artifact of the gallery build.
+
+    Args:
+        name (str): Unique name of the node, e.g., the path of its first output relative to the build folder.
+        outputs (list): File paths written by the action.
+        action (tuple): The function building the node and its arguments.
+        inputs (list, optional): Input file paths. Defaults to [].
+        deps (list, optional): Nodes that must be built first. Defaults to [].
+        version (str, optional): Changes to the version invalidate the node, e.g., a hash of the converter. Defaults to ''.
+    """
+
+    def __init__(self, name, outputs, action, inputs=None, deps=None, version=''):
+        self.name = name
+        self.outputs = outputs
+        self.action = action
+        self.inputs = inputs or []
+        self.deps = deps or []
+        self.version = version
+        self._signature = None
+
+    def signature(self):
+        """The hash of the version, the input files and the signatures of the dependencies."""
+        if self._signature is None:
+            sha = hashlib.sha256(self.version.encode('utf-8'))
+            for in_file in self.inputs:
+                sha.update(file_hash(in_file).encode('ascii') if os.path.exists(in_file) else b'missing')
+            for dep in self.deps:
+                sha.update(dep.signature().encode('ascii'))
+            self._signature = sha.hexdigest()
+        return self._signature
+
+
+def execute_notebook_cached(in_file, cache_dir=None, compact=False, budget=None):
+    """Execute a Jupyter notebook in place, reusing the outputs in the execution cache if its code cells are unchanged.
+
+    Args:
+        in_file (str): Input Jupyter notebook.
+        cache_dir (str, optional): Folder of the execution cache. Defaults to None, which disables the cache.
+        compact (bool, optional): Whether to compact the notebook after execution (see compact_notebooks.py). Defaults to False.
+        budget (int, optional): Maximum size of the compacted notebook in bytes. Defaults to None.
+    """
+    cache = None
+    hit = False
+    if cache_dir is not None:
+        from execution_cache import ExecutionCache
+        cache = ExecutionCache(cache_dir)
+        with open(in_file, encoding='utf-8') as f:
+            notebook = json.load(f)
+        hit = cache.get(notebook)
+        if hit:
+            write_notebook(notebook, in_file)
+
+    if not hit:
+        if not execute_notebook(in_file):
+            raise RuntimeError('Failed to execute {}'.format(in_file))
+
+        if cache is not None:
+            with open(in_file, encoding='utf-8') as f:
+                cache.put(json.load(f))
+
+    if compact:
+        from compact_notebooks import compact_notebook
+        compact_notebook(in_file, budget=budget)
+
+
+def gallery_nodes(in_dir, template_file, github_username=None, github_repo=None, execute=True, cache_dir=None,
+                  compact=False, budget=None):
+    """Create the build nodes of all Earth Engine JavaScripts in a folder recursively.
+
+    Args:
+        in_dir (str): The folder containing Earth Engine JavaScripts.
+        template_file (str): Input Jupyter notebook template.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+        execute (bool, optional): Whether to execute the notebooks. Defaults to True.
+        cache_dir (str, optional): Folder of the execution cache. Defaults to None.
+        compact (bool, optional): Whether to compact the executed notebooks. Defaults to False.
+        budget (int, optional): Maximum size of each compacted notebook in bytes. Defaults to None.
+
+    Returns:
+        list: The nodes, each after the nodes it depends on.
+    """
+    version = '{} {} {}'.format(converter_version(), github_username, github_repo)
+    nodes = []
+    for in_file in sorted(str(f) for f in Path(in_dir).rglob('*.js')):
+        base = os.path.splitext(in_file)[0]
+        convert = Node(os.path.relpath(base + '.py', in_dir),
+                       [base + '.py', base + '_qgis.py', base + '.ipynb'],
+                       (js_to_targets, (in_file, template_file, github_username, github_repo)),
+                       inputs=[in_file, template_file], version=version)
+        nodes.append(convert)
+
+        if execute:
+            nodes.append(Node(os.path.relpath(base + '.ipynb', in_dir) + ' (executed)',
+                              [base + '.ipynb'],
+                              (execute_notebook_cached, (base + '.ipynb', cache_dir, compact, budget)),
+                              deps=[convert], version='compact {}'.format(budget) if compact else ''))
+    return nodes
+
+
+def stale_nodes(nodes, state):
+    """Find the nodes that need to be rebuilt.
+
+    Args:
+        nodes (list): The nodes, each after the nodes it depends on.
+        state (dict): The signature of each node at its last successful build, keyed by node name.
+
+    Returns:
+        list: The stale nodes, in the same order as nodes.
+    """
+    stale = set()
+    for node in nodes:
+        if (state.get(node.name) != node.signature()
+                or not all(os.path.exists(out_file) for out_file in node.outputs)
+                or any(dep.name in stale for dep in node.deps)):
+            stale.add(node.name)
+
+    return [node for node in nodes if node.name in stale]
+
+
+def build(nodes, state_file, processes=None, dry_run=False):
+    """Rebuild the stale nodes, running independent nodes in a pool of worker processes.
+
+    Args:
+        nodes (list): The nodes, each after the nodes it depends on.
+        state_file (str): File path of the build state.
+        processes (int, optional): Number of worker processes. Use None for the number of CPUs. Defaults to None.
+        dry_run (bool, optional): Only print the nodes that would be rebuilt. Defaults to False.
+
+    Returns:
+        list: List of (node name, error) tuples for the nodes that failed to build.
+    """
+    state = read_manifest(state_file)
+    todo = stale_nodes(nodes, state)
+    print('{}/{} nodes are out of date'.format(len(todo), len(nodes)))
+    if dry_run:
+        for node in todo:
+            print('  {}'.format(node.name))
+        return []
+    if not todo:
+        return []
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(todo)))
+
+    # number of stale dependencies each stale node waits for
+    todo_names = set(node.name for node in todo)
+    waiting = {node.name: sum(1 for dep in node.deps if dep.name in todo_names) for node in todo}
+    dependents = {}
+    for node in todo:
+        for dep in node.deps:
+            if dep.name in todo_names:
+                dependents.setdefault(dep.name, []).append(node)
+
+    done = queue.Queue()
+    failures = []
+    finished = 0
+    count = len(todo)
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(processes)
+
+    def submit(node):
+        pool.apply_async(_convert_file, (node.action,),
+                         callback=lambda result: done.put((node, result[1], result[2])),
+                         error_callback=lambda e: done.put((node, repr(e), 0)))
+
+    def skip(node, reason):
+        # nodes depending on a failed node are not built
+        failures.append((node.name, reason))
+        for dependent in dependents.get(node.name, []):
+            skip(dependent, 'Skipped because {} failed'.format(node.name))
+
+    try:
+        running = 0
+        for node in todo:
+            if waiting[node.name] == 0:
+                submit(node)
+                running += 1
+
+        while running:
+            node, error, elapsed = done.get()
+            running -= 1
+            finished += 1
+            if error is None:
+                state[node.name] = node.signature()
+                print('Built {}/{}: {} ({:.3f} s)'.format(finished, count, node.name, elapsed))
+                for dependent in dependents.get(node.name, []):
+                    waiting[dependent.name] -= 1
+                    if waiting[dependent.name] == 0:
+                        submit(dependent)
+                        running += 1
+            else:
+                print('Failed {}/{}: {}'.format(finished, count, node.name))
+                state.pop(node.name, None)
+                skip(node, error)
+    finally:
+        pool.close()
+        pool.join()
+        write_manifest(state_file, state)
+
+    elapsed = time.perf_counter() - start
+    print('Built {}/{} nodes in {:.2f} s ({} processes)'.format(count - len(failures), count, elapsed, processes))
+    if failures:
+        print('{} nodes failed to build:'.format(len(failures)))
+        for name, error in failures:
+            print('  {}: {}'.format(name, error.splitlines()[-1] if error else ''))
+
+    return failures
+
+
+if __name__ == '__main__':
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--in_dir', type=str, default=os.path.join(root_dir, 'JavaScripts'),
+                        help="Folder containing Earth Engine JavaScripts")
+    parser.add_argument('--template', type=str, default=os.path.join(root_dir, 'Template', 'template.py'),
+                        help="Jupyter notebook template")
+    parser.add_argument('--github_username', type=str, default='giswqs', help="GitHub username")
+    parser.add_argument('--github_repo', type=str, default='earthengine-py-notebooks', help="GitHub repo name")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="Number of worker processes (defaults to the number of CPUs)")
+    parser.add_argument('--dry-run', action='store_true', help="Only show the nodes that would be rebuilt")
+    parser.add_argument('--no-execute', action='store_true', help="Do not execute the notebooks")
+    parser.add_argument('--compact', action='store_true', help="Compact the executed notebooks")
+    parser.add_argument('--budget', type=int, default=None, help="Maximum size of each compacted notebook in bytes")
+    args = parser.parse_args()
+
+    in_dir = os.path.abspath(args.in_dir)
+    nodes = gallery_nodes(in_dir, os.path.abspath(args.template), args.github_username, args.github_repo,
+                          execute=not args.no_execute, cache_dir=os.path.join(in_dir, '.execution_cache'),
+                          compact=args.compact, budget=args.budget)
+    build(nodes, os.path.join(in_dir, '.gallery_build.json'), args.jobs, args.dry_run)
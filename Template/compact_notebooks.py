@@ -0,0 +1,324 @@
+''' Make executed Jupyter notebooks smaller and faster to load.
+
+Compaction has three steps:
+
+1. Widget state saved in the notebook metadata (e.g., the ipyleaflet Map of each example) is deduplicated:
+   identical widget models are merged and models not displayed by any output are dropped.
+2. Large base64 outputs (images, PDFs) are moved to content-addressed sidecar files that load lazily, in a 'blobs'
+   folder next to the notebooks. It is not a hidden folder, so GitHub, nbviewer and Voila serve the files.
+3. The size of the notebook is checked against a budget, and the largest cells of notebooks over it are reported.
+
+Usage: python compact_notebooks.py [--in_dir ../JavaScripts] [--budget 1000000]
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import re
+import sys
+import json
+import base64
+import hashlib
+import argparse
+from pathlib import Path
+
+from convert_js_to_python import write_notebook
+
+
+# Folder of the sidecar files, next to the notebooks.
+BLOB_DIR = 'blobs'
+
+WIDGET_STATE = 'application/vnd.jupyter.widget-state+json'
+WIDGET_VIEW = 'application/vnd.jupyter.widget-view+json'
+MODEL_REF = re.compile(r'IPY_MODEL_([0-9a-zA-Z_-]+)')
+
+# base64 encoded output types that can be moved to sidecar files, and the file extension for each
+BLOB_TYPES = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'application/pdf': '.pdf',
+}
+
+
+def code_outputs(notebook):
+    for cell in notebook['cells']:
+        if cell['cell_type'] == 'code':
+            for output in cell.get('outputs', []):
+                yield output
+
+
+def displayed_models(notebook):
+    """Find the widget models displayed by the outputs of a notebook.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+
+    Returns:
+        set: The model ids.
+    """
+    model_ids = set()
+    for output in code_outputs(notebook):
+        view = output.get('data', {}).get(WIDGET_VIEW)
+        if view and 'model_id' in view:
+            model_ids.add(view['model_id'])
+    return model_ids
+
+
+def dedupe_widget_state(notebook):
+    """Merge identical widget models and drop the models no output displays, updating the notebook in place.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+
+    Returns:
+        int: Number of removed widget models.
+    """
+    widgets = notebook.get('metadata', {}).get('widgets', {}).get(WIDGET_STATE)
+    if not widgets or not widgets.get('state'):
+        return 0
+
+    state = widgets['state']
+    count = len(state)
+    replaced = {}
+
+    # Merging two models can make the models referring to them identical, so merge until nothing changes.
+    while True:
+        seen = {}
+        duplicates = {}
+        for model_id in sorted(state):
+            key = json.dumps(state[model_id], sort_keys=True)
+            if key in seen:
+                duplicates[model_id] = seen[key]
+            else:
+                seen[key] = model_id
+        if not duplicates:
+            break
+
+        for model_id in duplicates:
+            del state[model_id]
+        for model_id, original in duplicates.items():
+            replaced[model_id] = original
+        text = MODEL_REF.sub(lambda m: 'IPY_MODEL_' + duplicates.get(m.group(1), m.group(1)), json.dumps(state))
+        state = json.loads(text)
+
+    # the outputs display the merged models
+    for output in code_outputs(notebook):
+        view = output.get('data', {}).get(WIDGET_VIEW)
+        if view and 'model_id' in view:
+            model_id = view['model_id']
+            while model_id in replaced:
+                model_id = replaced[model_id]
+            view['model_id'] = model_id
+
+    # keep the displayed models and the models they refer to
+    keep = set()
+    todo = [model_id for model_id in displayed_models(notebook) if model_id in state]
+    while todo:
+        model_id = todo.pop()
+        if model_id in keep:
+            continue
+        keep.add(model_id)
+        for ref in MODEL_REF.findall(json.dumps(state[model_id])):
+            if ref in state and ref not in keep:
+                todo.append(ref)
+
+    widgets['state'] = {model_id: state[model_id] for model_id in sorted(keep)}
+    return count - len(widgets['state'])
+
+
+def move_blobs(notebook, blob_dir, rel_dir, min_size=10000):
+    """Move large base64 outputs to content-addressed sidecar files, updating the notebook in place.
+    Each moved output is replaced with an HTML element loading the sidecar file lazily.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+        blob_dir (str): The folder of the sidecar files.
+        rel_dir (str): The path of blob_dir relative to the notebook, used in the HTML elements.
+        min_size (int, optional): Outputs smaller than this (in base64 characters) stay in the notebook. Defaults to 10000.
+
+    Returns:
+        int: Number of bytes moved out of the notebook.
+    """
+    moved = 0
+    for output in code_outputs(notebook):
+        data = output.get('data')
+        if not data:
+            continue
+
+        for mime_type, ext in BLOB_TYPES.items():
+            value = data.get(mime_type)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                value = ''.join(value)
+            if len(value) < min_size:
+                continue
+
+            blob = base64.b64decode(value)
+            name = hashlib.sha256(blob).hexdigest() + ext
+            blob_file = os.path.join(blob_dir, name)
+            if not os.path.exists(blob_file):
+                os.makedirs(blob_dir, exist_ok=True)
+                with open(blob_file, 'wb') as f:
+                    f.write(blob)
+
+            src = '/'.join([rel_dir, name])
+            if mime_type.startswith('image/'):
+                html = '<img src="{}" loading="lazy"/>'.format(src)
+            else:
+                html = '<a href="{}">{}</a>'.format(src, name)
+
+            del data[mime_type]
+            data.setdefault('text/html', html)
+            output.setdefault('metadata', {}).setdefault('sidecar', {})[mime_type] = src
+            moved += len(value)
+
+    return moved
+
+
+def restore_blobs(notebook, nb_dir):
+    """Move the outputs in sidecar files back into a notebook, updating it in place.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+        nb_dir (str): The folder containing the notebook.
+
+    Returns:
+        int: Number of restored outputs.
+    """
+    restored = 0
+    for output in code_outputs(notebook):
+        sidecar = output.get('metadata', {}).pop('sidecar', None)
+        if not sidecar:
+            continue
+        data = output['data']
+        for mime_type, src in sidecar.items():
+            with open(os.path.join(nb_dir, src), 'rb') as f:
+                data[mime_type] = base64.b64encode(f.read()).decode('ascii')
+            if data.get('text/html', '').startswith(('<img src="{}"'.format(src), '<a href="{}"'.format(src))):
+                del data['text/html']
+            restored += 1
+    return restored
+
+
+def cell_sizes(notebook):
+    """Compute the size of each cell and of the notebook metadata as saved in the notebook file.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+
+    Returns:
+        list: List of (label, size in bytes) tuples. Cells are labelled 'cell N', counting from 1.
+    """
+    sizes = [('cell {}'.format(index + 1), len(json.dumps(cell, indent=2).encode('utf-8')))
+             for index, cell in enumerate(notebook['cells'])]
+    sizes.append(('metadata', len(json.dumps(notebook.get('metadata', {}), indent=2).encode('utf-8'))))
+    return sizes
+
+
+def check_budget(notebook, budget):
+    """Check the size of a notebook against a budget.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+        budget (int): Maximum size of the notebook in bytes.
+
+    Returns:
+        list: The largest parts of a notebook over the budget, as (label, size) tuples, in decreasing size until
+            removing them would bring the notebook within the budget. Empty if the notebook is within the budget.
+    """
+    size = len(json.dumps(notebook, indent=2).encode('utf-8'))
+    if size <= budget:
+        return []
+
+    over = []
+    for label, part_size in sorted(cell_sizes(notebook), key=lambda item: -item[1]):
+        over.append((label, part_size))
+        size -= part_size
+        if size <= budget:
+            break
+    return over
+
+
+def compact_notebook(in_file, blob_dir=None, min_blob_size=10000, budget=None):
+    """Compact an executed notebook in place.
+
+    Args:
+        in_file (str): Input Jupyter notebook.
+        blob_dir (str, optional): Folder of the sidecar files. Defaults to a BLOB_DIR folder next to the notebook.
+        min_blob_size (int, optional): Base64 outputs smaller than this stay in the notebook. Defaults to 10000.
+        budget (int, optional): Maximum size of the notebook in bytes. Defaults to None, which does not check the size.
+
+    Returns:
+        tuple: The size of the notebook before and after compaction in bytes, and the parts over the budget (see check_budget).
+    """
+    in_file = str(in_file)
+    nb_dir = os.path.dirname(os.path.abspath(in_file))
+    if blob_dir is None:
+        blob_dir = os.path.join(nb_dir, BLOB_DIR)
+
+    with open(in_file, encoding='utf-8') as f:
+        text = f.read()
+    notebook = json.loads(text)
+
+    dedupe_widget_state(notebook)
+    move_blobs(notebook, blob_dir, os.path.relpath(blob_dir, nb_dir).replace(os.sep, '/'), min_blob_size)
+
+    compacted = json.dumps(notebook, indent=2)
+    if compacted != text:
+        write_notebook(notebook, in_file)
+
+    over = check_budget(notebook, budget) if budget else []
+    if over:
+        print('{} is {:.0f} KB, over the {:.0f} KB budget. Largest parts: {}'.format(
+            in_file, len(compacted.encode('utf-8')) / 1000, budget / 1000,
+            ', '.join('{} ({:.0f} KB)'.format(label, size / 1000) for label, size in over)))
+
+    return len(text.encode('utf-8')), len(compacted.encode('utf-8')), over
+
+
+def compact_notebook_dir(in_dir, min_blob_size=10000, budget=None):
+    """Compact all executed notebooks in a folder recursively.
+
+    Args:
+        in_dir (str): Input folder containing notebooks.
+        min_blob_size (int, optional): Base64 outputs smaller than this stay in the notebooks. Defaults to 10000.
+        budget (int, optional): Maximum size of each notebook in bytes. Defaults to None, which does not check the size.
+
+    Returns:
+        list: List of (in_file, parts over the budget) tuples for the notebooks over the budget.
+    """
+    files = sorted(str(f) for f in Path(in_dir).rglob('*.ipynb') if '.ipynb_checkpoints' not in f.parts)
+    before = after = 0
+    over_budget = []
+    for in_file in files:
+        size_before, size_after, over = compact_notebook(in_file, min_blob_size=min_blob_size, budget=budget)
+        before += size_before
+        after += size_after
+        if over:
+            over_budget.append((in_file, over))
+
+    print('Compacted {} notebooks from {:.1f} MB to {:.1f} MB'.format(len(files), before / 1e6, after / 1e6))
+    if budget:
+        print('{} notebooks are over the {:.0f} KB budget'.format(len(over_budget), budget / 1000))
+    return over_budget
+
+
+if __name__ == '__main__':
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--in_dir', type=str, default=os.path.join(root_dir, 'JavaScripts'),
+                        help="Folder containing executed Jupyter notebooks")
+    parser.add_argument('--min_blob_size', type=int, default=10000,
+                        help="Base64 outputs smaller than this stay in the notebook")
+    parser.add_argument('--budget', type=int, default=None,
+                        help="Maximum size of each notebook in bytes")
+    args = parser.parse_args()
+    if compact_notebook_dir(args.in_dir, args.min_blob_size, args.budget):
+        sys.exit(1)
@@ -8,12 +8,21 @@ To convert all Earth Engine JavaScripts in a folder recursively: js_to_python_di
 # Authors: Dr. Qiusheng Wu (https://wetlands.io)
 # License: MIT
 
+import io
 import os
+import re
 import glob
+import json
+import time
+import hashlib
+import importlib.util
 import random
 import string
 import argparse
+import traceback
+import contextlib
 import subprocess
+import multiprocessing
 from pathlib import Path
 from collections import deque
 
@@ -32,6 +41,28 @@ def random_string(string_length=3):
     return ''.join(random.choice(letters) for i in range(string_length))
 
 
+def callback_names(text, prefix='func_'):
+    """Generate names for the callback functions extracted from a script. 
+
+    The names only depend on the script, so converting the same script twice gives the same output.
+    
+    Args:
+        text (str): The source code of the script.
+        prefix (str, optional): Prefix of the names. Defaults to 'func_'.
+    
+    Yields:
+        str: Unique names such as 'func_abc'.
+    """
+    rng = random.Random(text)
+    letters = string.ascii_lowercase
+    used = set()
+    while True:
+        name = prefix + ''.join(rng.choice(letters) for i in range(3))
+        if name not in used:
+            used.add(name)
+            yield name
+
+
 def find_matching_bracket(lines, start_line_index, start_char_index, matching_char='{'):
     """Find the position of the matching closing bracket from a list of lines.
 
@@ -89,6 +120,181 @@ def find_matching_bracket(lines, start_line_index, start_char_index, matching_ch
     return matching_line_index, matching_char_index
 
 
+class BracketIndex(object):
+    """A structural index that maps every opening bracket ({, ( and [) in a list of lines to its matching closing bracket.
+
+    The index is built in one pass and answers the same queries as find_matching_bracket() without rescanning the lines.
+    Rewrite the lines through update_line(), delete_char() and relocate() to keep the index valid.
+
+    Args:
+        lines (list): The input list of lines. The list is shared with the caller, not copied.
+    """
+
+    pattern = re.compile(r'[{}()\[\]]')
+    closing_chars = {'}': '{', ')': '(', ']': '['}
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.build()
+
+    def build(self):
+        """(Re)build the index from the current lines.
+        """
+        self.nodes = []
+        self.dirty = None
+        self.stale = False
+        stacks = {'{': [], '(': [], '[': []}
+
+        for line_index, line in enumerate(self.lines):
+            nodes = {}
+            for match in self.pattern.finditer(line):
+                node = _Bracket(line_index, match.start(), match.group())
+                nodes[node.char_index] = node
+                if node.char in stacks:
+                    stacks[node.char].append(node)
+                else:
+                    stack = stacks[self.closing_chars[node.char]]
+                    if stack:
+                        node.partner = stack.pop()
+                        node.partner.partner = node
+            self.nodes.append(nodes)
+
+    def match(self, line_index, char_index, matching_char='{'):
+        """Find the position of the matching closing bracket.
+
+        Args:
+            line_index (int): The line index where the starting bracket is located.
+            char_index (int): The position index of the starting bracket.
+            matching_char (str, optional): The starting bracket to search for. Defaults to '{'.
+
+        Returns:
+            matching_line_index (int): The line index where the matching closing bracket is located.
+            matching_char_index (int): The position index of the matching closing bracket.
+        """
+        if self.stale or (self.dirty is not None and (line_index, char_index) <= self.dirty):
+            self.build()
+
+        node = self.nodes[line_index].get(char_index)
+        if node is None or node.char != matching_char:
+            return find_matching_bracket(self.lines, line_index, char_index, matching_char)
+        if node.partner is None:
+            return -1, -1
+
+        return node.partner.line_index, node.partner.char_index
+
+    def update_line(self, line_index, line):
+        """Replace a line, keeping its brackets in the index if they are unchanged.
+
+        Args:
+            line_index (int): The index of the line to replace.
+            line (str): The new line.
+        """
+        self.lines[line_index] = line
+        if self.stale:
+            return
+
+        nodes = sorted(self.nodes[line_index].items())
+        matches = list(self.pattern.finditer(line))
+        if [node.char for _, node in nodes] != [match.group() for match in matches]:
+            self.stale = True
+            return
+
+        self.nodes[line_index] = {}
+        for (_, node), match in zip(nodes, matches):
+            node.char_index = match.start()
+            self.nodes[line_index][node.char_index] = node
+
+    def delete_char(self, line_index, char_index):
+        """Delete a character from a line, shifting the brackets that follow it.
+
+        Args:
+            line_index (int): The index of the line.
+            char_index (int): The position index of the character to delete.
+        """
+        line = self.lines[line_index]
+        self.lines[line_index] = line[:char_index] + line[char_index+1:]
+        if line_index < 0 or char_index < 0:
+            self.stale = True
+        if self.stale:
+            return
+
+        nodes = {}
+        for index, node in self.nodes[line_index].items():
+            if index < char_index:
+                nodes[index] = node
+            elif index > char_index:
+                node.char_index = index - 1
+                nodes[index - 1] = node
+            elif node.partner is not None:
+                # Brackets before the opening bracket of the broken pair may now match elsewhere.
+                opening = node.partner if node.char in self.closing_chars else node
+                position = (opening.line_index, opening.char_index)
+                if self.dirty is None or position > self.dirty:
+                    self.dirty = position
+                node.partner.partner = None
+        self.nodes[line_index] = nodes
+
+    def is_closed(self, start, end):
+        """Check whether every bracket between two positions is matched by a bracket between them.
+
+        Args:
+            start (tuple): The (line_index, char_index) of the first character.
+            end (tuple): The (line_index, char_index) of the last character.
+
+        Returns:
+            bool: True if no bracket between start and end is matched outside of them.
+        """
+        if self.stale:
+            return False
+
+        for line_index in range(start[0], end[0] + 1):
+            for char_index, node in self.nodes[line_index].items():
+                if start <= (line_index, char_index) <= end:
+                    partner = node.partner
+                    if partner is None or not start <= (partner.line_index, partner.char_index) <= end:
+                        return False
+        return True
+
+    def relocate(self, lines, sources):
+        """Move the index to a new list of lines assembled from pieces of the current lines.
+
+        Args:
+            lines (list): The new list of lines.
+            sources (list): For each new line, a list of (line_index, start, end, offset) tuples telling that
+                the characters start:end of the current line line_index are located at offset in the new line.
+        """
+        self.lines = lines
+        if self.stale:
+            return
+
+        new_nodes = []
+        for line_index, segments in enumerate(sources):
+            nodes = {}
+            for src_line_index, start, end, offset in segments:
+                for index, node in self.nodes[src_line_index].items():
+                    if start <= index < end:
+                        node.line_index = line_index
+                        node.char_index = index - start + offset
+                        nodes[node.char_index] = node
+            new_nodes.append(nodes)
+
+        self.nodes = new_nodes
+        if self.dirty is not None:
+            self.stale = True
+
+
+class _Bracket(object):
+    """A bracket in a BracketIndex."""
+
+    __slots__ = ('line_index', 'char_index', 'char', 'partner')
+
+    def __init__(self, line_index, char_index, char):
+        self.line_index = line_index
+        self.char_index = char_index
+        self.char = char
+        self.partner = None
+
+
 # extract parameters and wrap them with single/double quotes if needed.
 def format_params(line, sep=':'):
     """Format keys in a dictionary and adds quotes to the keys. 
@@ -227,54 +433,195 @@ def convert_for_loop(line):
     return new_line
 
 
-def check_map_functions(input_lines):
+def check_map_functions(input_lines, brackets=None, names=None):
     """Extract Earth Engine map function
     
     Args:
         input_lines (list): List of Earth Engine JavaScrips
+        brackets (BracketIndex, optional): The bracket index of input_lines. It is moved to the output lines. Defaults to None.
+        names (generator, optional): Names of the extracted functions. Defaults to callback_names() of input_lines.
     
     Returns:
         list: Output JavaScript with map function
     """    
+    if brackets is None:
+        brackets = BracketIndex(input_lines)
+    if names is None:
+        names = callback_names(''.join(input_lines))
+
     output_lines = []
+    sources = []        # where the brackets of each output line come from in the input lines
+    offsets = {}        # input lines replaced by the remainder of themselves after a map function
     for index, line in enumerate(input_lines):
 
         if ('.map(function' in line) or ('.map (function') in line:
 
+            offset = offsets.get(index, 0)
             bracket_index = line.index("{")
-            matching_line_index, matching_char_index = find_matching_bracket(input_lines, index, bracket_index)
+            if brackets.stale:
+                matching_line_index, matching_char_index = find_matching_bracket(input_lines, index, bracket_index)
+            else:
+                matching_line_index, matching_char_index = brackets.match(index, offset + bracket_index)
+                if matching_line_index == index:
+                    matching_char_index -= offset
+                elif matching_line_index == -1 or not brackets.is_closed(
+                        (index, offset + line.index('function')), (matching_line_index, matching_char_index)):
+                    # the map function can not be moved without changing how the brackets around it match
+                    brackets.stale = True
+            matching_line_index = matching_line_index % len(input_lines)
 
             func_start_index = line.index('function')
-            func_name = 'func_' + random_string()
+            func_name = next(names)
             func_header = line[func_start_index:].replace('function', 'function ' + func_name)
             output_lines.append('\n')
+            sources.append([])
             output_lines.append(func_header)
+            segments = []
+            start = offset + func_start_index
+            for piece_index, piece in enumerate(line[func_start_index:].split('function')):
+                if piece_index > 0:
+                    start += len('function')
+                segments.append((index, start, start + len(piece), len(segments) * len(' ' + func_name) + start - offset - func_start_index))
+                start += len(piece)
+            sources.append(segments)
 
             for sub_index, tmp_line in enumerate(input_lines[index+1: matching_line_index]):
                 output_lines.append(tmp_line)
+                sources.append([(index+1+sub_index, 0, len(tmp_line), 0)])
                 input_lines[index+1+sub_index] = ''                
 
             header_line = line[:func_start_index] + func_name 
             header_line = header_line.rstrip()
+            header_sources = [(index, offset, offset + func_start_index, 0)]
 
+            matching_offset = offsets.get(matching_line_index, 0)
             func_footer = input_lines[matching_line_index][:matching_char_index+1]
             output_lines.append(func_footer)
+            sources.append([(matching_line_index, matching_offset, matching_offset + matching_char_index + 1, 0)])
 
-            footer_line = input_lines[matching_line_index][matching_char_index+1:].strip()
+            footer_line = input_lines[matching_line_index][matching_char_index+1:]
+            footer_start = matching_offset + matching_char_index + 1 + len(footer_line) - len(footer_line.lstrip())
+            footer_line = footer_line.strip()
+            footer_sources = [(matching_line_index, footer_start, footer_start + len(footer_line), 0)]
             if footer_line == ')' or footer_line == ');':
+                header_sources.append((matching_line_index, footer_start, footer_start + len(footer_line), len(header_line)))
+                footer_sources = []
                 header_line = header_line + footer_line
                 footer_line = ''
 
             input_lines[matching_line_index] = footer_line
+            offsets[matching_line_index] = footer_start
+
+            if matching_line_index == index:    # the map function and its header share the same brackets
+                brackets.stale = True
 
             output_lines.append(header_line)
+            sources.append(header_sources)
             output_lines.append(footer_line)
+            sources.append(footer_sources)
         else: 
-            output_lines.append(line)            
+            output_lines.append(line)
+            offset = offsets.get(index, 0)
+            sources.append([(index, offset, offset + len(line), 0)])
+
+    brackets.relocate(output_lines, sources)
 
     return output_lines
 
 
+def js_lines_to_python(lines):
+    """Convert the lines of an Earth Engine JavaScript to Python.
+
+    Args:
+        lines (list): List of lines of the JavaScript.
+
+    Returns:
+        str: The Python script without the import statements.
+    """
+    output_lines = ["\n"]
+    lines = list(lines)
+    brackets = BracketIndex(lines)
+    lines = check_map_functions(lines, brackets)
+
+    for index, line in enumerate(lines):
+
+        if ('/* color' in line) and ('*/' in line):
+            line = line[:line.index('/*')].lstrip() + line[(line.index('*/')+2):]
+                
+        if ("= function" in line) or ("=function" in line) or line.strip().startswith("function"):
+            bracket_index = line.index("{")
+            matching_line_index, matching_char_index = brackets.match(index, bracket_index)
+
+            line = line[:bracket_index] + line[bracket_index+1:]
+            if matching_line_index == index:
+                line = line[:matching_char_index] + \
+                    line[matching_char_index+1:]
+            else:
+                brackets.delete_char(matching_line_index, matching_char_index)
+
+            line = line.replace(" = function", "").replace(
+                "=function", '').replace("function ", '')
+            line = " " * (len(line) - len(line.lstrip())) + "def " + line.strip() + ":"
+        elif "{" in line:
+            bracket_index = line.index("{")
+            matching_line_index, matching_char_index = brackets.match(index, bracket_index)
+            if (matching_line_index == index) and (':' in line):
+                pass
+            elif ('for (' in line) or ('for(' in line):
+                line = convert_for_loop(line)
+                brackets.update_line(index, line)
+                bracket_index = line.index("{")
+                matching_line_index, matching_char_index = brackets.match(index, bracket_index)
+                brackets.delete_char(matching_line_index, matching_char_index)
+                line = line.replace('{', '')
+
+        if line is None:
+            line = ''
+
+        line = line.replace("//", "#")
+        line = line.replace("var ", "", 1)
+        line = line.replace("/*", '#')
+        line = line.replace("*/", '#')
+        line = line.replace("true", "True").replace("false", "False")
+        line = line.replace("null", "{}")
+        line = line.replace(".or", ".Or")
+        line = line.replace(".and", '.And')
+        line = line.replace(".not", '.Not')
+        line = line.replace('visualize({', 'visualize(**{')
+        line = line.replace('Math.PI', 'math.pi')
+        line = line.replace('Math.', 'math.')
+        line = line.replace('= new', '=')
+        line = line.rstrip()
+
+        if line.endswith("+"):
+            line = line + " \\"
+        elif line.endswith(";"):
+            line = line[:-1]             
+                
+        if line.lstrip().startswith('*'):
+            line = line.replace('*', '#')
+
+        if (":" in line) and (not line.strip().startswith("#")) and (not line.strip().startswith('def')) and (not line.strip().startswith(".")):
+            line = format_params(line)
+
+        if index < (len(lines) - 1) and line.lstrip().startswith("#") and lines[index+1].lstrip().startswith("."):
+            line = ''               
+
+        if line.lstrip().startswith("."):
+            if "#" in line:
+                line = line[:line.index("#")]
+            # join with the previous non-empty line without copying the whole output
+            while len(output_lines) > 1 and not output_lines[-1].strip():
+                output_lines.pop()
+            output_lines[-1] = output_lines[-1].rstrip()
+            output_lines.append(" " + "\\" + "\n" + line + "\n")
+        else:
+            output_lines.append(line + "\n")
+
+
+    return ''.join(output_lines)
+
+
 # Convert GEE JavaScripts to Python
 def js_to_python(in_file, out_file=None, use_qgis=True, github_repo=None):
     """Convert an Earth Engine JavaScript to Python script.
@@ -330,104 +677,152 @@ def js_to_python(in_file, out_file=None, use_qgis=True, github_repo=None):
     if is_python:   # only update the GitHub URL if it is already a GEE Python script
         output = github_url + ''.join(map(str, lines))
     else:             # deal with JavaScript
+        print('Processing {}'.format(in_file))
+        header = github_url + "import ee \n" + qgis_import_str + math_import_str
+        output = header + js_lines_to_python(lines)
 
-        header = github_url + "import ee \n" + qgis_import_str + math_import_str 
-        function_defs = []
-        output = header + "\n"
+    out_dir = os.path.dirname(out_file)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
 
-        with open(in_file) as f:
-            lines = f.readlines()
+    with open(out_file, 'w') as f:
+        f.write(output)
 
-            print('Processing {}'.format(in_file))
-            lines = check_map_functions(lines)
+    return output
 
-            for index, line in enumerate(lines):
 
-                if ('/* color' in line) and ('*/' in line):
-                    line = line[:line.index('/*')].lstrip() + line[(line.index('*/')+2):]
-                
-                if ("= function" in line) or ("=function" in line) or line.strip().startswith("function"):
-                    bracket_index = line.index("{")
-                    matching_line_index, matching_char_index = find_matching_bracket(
-                        lines, index, bracket_index)
-
-                    line = line[:bracket_index] + line[bracket_index+1:]
-                    if matching_line_index == index:
-                        line = line[:matching_char_index] + \
-                            line[matching_char_index+1:]
-                    else:
-                        tmp_line = lines[matching_line_index]
-                        lines[matching_line_index] = tmp_line[:matching_char_index] + \
-                            tmp_line[matching_char_index+1:]
-
-                    line = line.replace(" = function", "").replace(
-                        "=function", '').replace("function ", '')
-                    line = " " * (len(line) - len(line.lstrip())) + "def " + line.strip() + ":"
-                elif "{" in line:
-                    bracket_index = line.index("{")
-                    matching_line_index, matching_char_index = find_matching_bracket(
-                        lines, index, bracket_index)
-                    if (matching_line_index == index) and (':' in line):
-                        pass
-                    elif ('for (' in line) or ('for(' in line):
-                        line = convert_for_loop(line)
-                        lines[index] = line
-                        bracket_index = line.index("{")
-                        matching_line_index, matching_char_index = find_matching_bracket(lines, index, bracket_index)
-                        tmp_line = lines[matching_line_index]
-                        lines[matching_line_index] = tmp_line[:matching_char_index] + tmp_line[matching_char_index+1:]
-                        line = line.replace('{', '')
-
-                if line is None:
-                    line = ''
-
-                line = line.replace("//", "#")
-                line = line.replace("var ", "", 1)
-                line = line.replace("/*", '#')
-                line = line.replace("*/", '#')
-                line = line.replace("true", "True").replace("false", "False")
-                line = line.replace("null", "{}")
-                line = line.replace(".or", ".Or")
-                line = line.replace(".and", '.And')
-                line = line.replace(".not", '.Not')
-                line = line.replace('visualize({', 'visualize(**{')
-                line = line.replace('Math.PI', 'math.pi')
-                line = line.replace('Math.', 'math.')
-                line = line.replace('= new', '=')
-                line = line.rstrip()
-
-                if line.endswith("+"):
-                    line = line + " \\"
-                elif line.endswith(";"):
-                    line = line[:-1]             
-                
-                if line.lstrip().startswith('*'):
-                    line = line.replace('*', '#')
+def converter_version():
+    """Get the version of the converter, i.e., a hash of the converter source code.
 
-                if (":" in line) and (not line.strip().startswith("#")) and (not line.strip().startswith('def')) and (not line.strip().startswith(".")):
-                    line = format_params(line)
+    Returns:
+        str: The SHA-256 hex digest of convert_js_to_python.py.
+    """
+    return file_hash(os.path.abspath(__file__))
 
-                if index < (len(lines) - 1) and line.lstrip().startswith("#") and lines[index+1].lstrip().startswith("."):
-                    line = ''               
 
-                if line.lstrip().startswith("."):
-                    if "#" in line:
-                        line = line[:line.index("#")]
-                    output = output.rstrip() + " " + "\\" + "\n" + line + "\n"
-                else:
-                    output += line + "\n"
+def file_hash(in_file):
+    """Get the SHA-256 hex digest of a file.
 
-    out_dir = os.path.dirname(out_file)
-    if not os.path.exists(out_dir):
+    Args:
+        in_file (str): The input file path.
+
+    Returns:
+        str: The hex digest.
+    """
+    with open(in_file, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def read_manifest(manifest_file):
+    """Read the manifest of an incremental conversion.
+
+    Args:
+        manifest_file (str): File path of the manifest.
+
+    Returns:
+        dict: The entry of each output file, keyed by its path relative to the manifest folder.
+    """
+    if not os.path.exists(manifest_file):
+        return {}
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except ValueError:
+        print('The manifest {} is invalid. All files will be converted.'.format(manifest_file))
+        return {}
+    return manifest.get('files', {})
+
+
+def write_manifest(manifest_file, files):
+    """Write the manifest of an incremental conversion.
+
+    Args:
+        manifest_file (str): File path of the manifest.
+        files (dict): The entry of each output file, keyed by its path relative to the manifest folder.
+    """
+    out_dir = os.path.dirname(manifest_file)
+    if out_dir and not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    with open(out_file, 'w') as f:
-        f.write(output)
+    tmp_file = manifest_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'files': files}, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
 
-    return output
+
+def _convert_file(task):
+    """Run one conversion in a worker, capturing its output and any error.
+
+    Args:
+        task (tuple): The conversion function and its arguments. The first argument is the input file path.
+
+    Returns:
+        tuple: The input file path, the error message (None if the conversion succeeded) and the wall time in seconds.
+    """
+    function, args = task
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args)
+        error = None
+    except Exception:
+        error = traceback.format_exc().rstrip()
+
+    return args[0], error, time.perf_counter() - start
 
 
-def js_to_python_dir(in_dir, out_dir=None, use_qgis=True, github_repo=None):
+def _convert_files(function, tasks, processes=1):
+    """Run a conversion function over a list of files, optionally in a pool of worker processes.
+
+    Args:
+        function (function): The conversion function, e.g., js_to_python.
+        tasks (list): List of argument tuples of the function. The first argument is the input file path.
+        processes (int, optional): Number of worker processes. Use None for the number of CPUs. Defaults to 1.
+
+    Returns:
+        list: List of (in_file, error) tuples for the files that failed to convert.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(tasks)))
+
+    count = len(tasks)
+    failures = []
+    start = time.perf_counter()
+    tasks = [(function, args) for args in tasks]
+
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap(_convert_file, tasks, chunksize=max(1, count // (processes * 8)))
+    else:
+        pool = None
+        results = map(_convert_file, tasks)
+
+    try:
+        # results are streamed back in the same (sorted) order as the input files
+        for index, (in_file, error, elapsed) in enumerate(results):
+            if error is None:
+                print('Processing {}/{}: {} ({:.3f} s)'.format(index+1, count, in_file, elapsed))
+            else:
+                print('Failed {}/{}: {}'.format(index+1, count, in_file))
+                failures.append((in_file, error))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    print('Converted {}/{} files in {:.2f} s ({:.1f} files/s, {} processes)'.format(
+        count - len(failures), count, elapsed, count / elapsed if elapsed > 0 else 0, processes))
+    if failures:
+        print('{} files failed to convert:'.format(len(failures)))
+        for in_file, error in failures:
+            print('  {}: {}'.format(in_file, error.splitlines()[-1]))
+
+    return failures
+
+
+def js_to_python_dir(in_dir, out_dir=None, use_qgis=True, github_repo=None, processes=1, incremental=False):
     """Convert all Earth Engine JavaScripts in a folder recursively to Python scripts
 
     Args:
@@ -435,17 +830,51 @@ def js_to_python_dir(in_dir, out_dir=None, use_qgis=True, github_repo=None):
         out_dir (str, optional): The output folder containing Earth Engine Python scripts. Defaults to None.
         use_qgis (bool, optional): Whether to add "from ee_plugin import Map \n" to the output script. Defaults to True.
         github_repo (str, optional): GitHub repo url. Defaults to None.
+        processes (int, optional): Number of worker processes. Use None for the number of CPUs. Defaults to 1.
+        incremental (bool, optional): Whether to skip the scripts whose source and converter have not changed 
+            since the last run, as recorded in out_dir/.js_to_python.json. Defaults to False.
 
+    Returns:
+        list: List of (in_file, error) tuples for the scripts that failed to convert.
     """
     if out_dir is None:
         out_dir = in_dir
 
-    for in_file in Path(in_dir).rglob('*.js'):
+    manifest_file = os.path.join(out_dir, '.js_to_python.json')
+    manifest = {}
+    entries = {}
+    if incremental:
+        manifest = read_manifest(manifest_file)
+        version = converter_version()
+        options = [use_qgis, github_repo]
+
+    tasks = []
+    keys = {}
+    up_to_date = 0
+    for in_file in sorted(Path(in_dir).rglob('*.js')):
         out_file = os.path.splitext(in_file)[0] + ".py"
         out_file = out_file.replace(in_dir, out_dir)
-        js_to_python(in_file, out_file, use_qgis, github_repo)
+        if incremental:
+            key = os.path.relpath(out_file, out_dir)
+            entry = {'source': file_hash(in_file), 'converter': version, 'options': options}
+            entries[key] = entry
+            keys[str(in_file)] = key
+            if manifest.get(key) == entry and os.path.exists(out_file):
+                up_to_date += 1
+                continue
+        tasks.append((str(in_file), out_file, use_qgis, github_repo))
+
+    failures = _convert_files(js_to_python, tasks, processes)
+
+    if incremental:
+        for in_file, _ in failures:
+            entries.pop(keys[in_file])
+        write_manifest(manifest_file, entries)
+        print('{} JavaScripts were up to date'.format(up_to_date))
     # print("Ouput Python script folder: {}".format(out_dir))
 
+    return failures
+
 
 # def dict_key_str(line):
 
@@ -469,20 +898,157 @@ def remove_qgis_import(in_file):
     Returns:
         list: List of lines  'from ee_plugin import Map' removed.
     """    
-    start_index = 0
     with open(in_file) as f:
         lines = f.readlines()
-        for index, line in enumerate(lines):
-            if 'from ee_plugin import Map' in line:
-                start_index = index
+        return remove_qgis_import_lines(lines)
+
+
+def remove_qgis_import_lines(lines):
+    """Remove 'from ee_plugin import Map' and the lines before it from the lines of an Earth Engine Python script.
+    
+    Args:
+        lines (list): List of lines of the Python script.
+    
+    Returns:
+        list: List of lines after 'from ee_plugin import Map', or None if the script does not import it.
+    """    
+    start_index = 0
+    for index, line in enumerate(lines):
+        if 'from ee_plugin import Map' in line:
+            start_index = index
+
+            i = 1
+            while True:
+                line_tmp = lines[start_index + i].strip()
+                if line_tmp != '':
+                    return lines[start_index + i:]
+                else:
+                    i = i + 1
+
+
+def template_sections(lines):
+    """Find where the header ends and the footer starts in the lines of a notebook template or of a notebook script made from it.
+
+    Args:
+        lines (list): List of lines.
+
+    Returns:
+        tuple: The index of the first line after the header and the index of the first line of the footer. Both are 0 if not found.
+    """
+    header_end_index = 0
+    footer_start_index = 0
+    for index, line in enumerate(lines):
+        if '## Add Earth Engine Python script' in line:
+            header_end_index = index + 5
+        if '## Display Earth Engine data layers' in line:
+            footer_start_index = index - 3
+
+    return header_end_index, footer_start_index
+
+
+class NotebookTemplate(object):
+    """A notebook template parsed into its header and footer, loaded once and reloaded only when the file changes.
 
-                i = 1
-                while True:
-                    line_tmp = lines[start_index + i].strip()
-                    if line_tmp != '':
-                        return lines[start_index + i:]
-                    else:
-                        i = i + 1
+    Args:
+        template_file (str): Input notebook template file path.
+    """
+
+    def __init__(self, template_file):
+        self.template_file = template_file
+        self.stat = None
+        self.sha = None
+        self.load()
+
+    def load(self):
+        """Read and parse the template file.
+
+        Returns:
+            bool: True if the content of the template changed.
+        """
+        stat = os.stat(self.template_file)
+        with open(self.template_file) as f:
+            text = f.read()
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+
+        sha = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        if sha == self.sha:
+            return False
+        self.sha = sha
+
+        template_lines = io.StringIO(text).readlines()
+        header_end_index, footer_start_index = template_sections(template_lines)
+
+        self.header = template_lines[:header_end_index]
+        self.footer = ['\n'] + template_lines[footer_start_index:]
+        self.header_text = ''.join(self.header)
+        self.footer_text = ''.join(self.footer)
+        self.github_headers = {}
+        return True
+
+    def refresh(self):
+        """Reload the template if its modification time or size changed and its content hash differs.
+
+        Returns:
+            bool: True if the content of the template changed.
+        """
+        stat = os.stat(self.template_file)
+        if (stat.st_mtime_ns, stat.st_size) == self.stat:
+            return False
+        return self.load()
+
+    def github_header(self, in_file, github_username=None, github_repo=None):
+        """Get the header with the GitHub, nbviewer and Colab links pointing to a notebook.
+        Unlike the module-level github_header(), which takes and returns a list of lines, this returns the header as
+        a single string.
+
+        Args:
+            in_file (str): File path of the Earth Engine Python script in the GitHub repo.
+            github_username (str, optional): GitHub username. Defaults to None.
+            github_repo (str, optional): GitHub repo name. Defaults to None.
+
+        Returns:
+            str: The header text, with the same links as ''.join(github_header(...)).
+        """
+        if (github_username is None) or (github_repo is None):
+            return self.header_text
+
+        # The username and repo substitutions are done once per run. Only the notebook path differs between notebooks.
+        parts = self.github_headers.get((github_username, github_repo))
+        if parts is None:
+            header = self.header_text.replace('giswqs', github_username)
+            header = header.replace('earthengine-py-notebooks', github_repo)
+            parts = header.split('Template/template.ipynb')
+            self.github_headers[(github_username, github_repo)] = parts
+
+        out_py_path = str(in_file).split('/')
+        index = out_py_path.index(github_repo)
+        out_py_relative_path = '/'.join(out_py_path[index+1:])
+        out_ipynb_relative_path = out_py_relative_path.replace('.py', '.ipynb')
+
+        return out_ipynb_relative_path.join(parts)
+
+
+_templates = {}
+
+
+def load_template(template_file):
+    """Get a parsed notebook template. The template is parsed once per run and reparsed when the file changes.
+    
+    Args:
+        template_file (str): Input notebook template file path.
+    
+    Returns:
+        NotebookTemplate: The parsed template.
+    """    
+    key = os.path.abspath(template_file)
+    template = _templates.get(key)
+    if template is None:
+        template = NotebookTemplate(template_file)
+        _templates[key] = template
+    else:
+        template.refresh()
+
+    return template
 
 
 def template_header(in_template):
@@ -494,19 +1060,7 @@ def template_header(in_template):
     Returns:
         list: List of lines.
     """    
-    header = []
-    template_lines = []
-    header_end_index = 0
-
-    with open(in_template) as f:
-        template_lines = f.readlines()
-        for index, line in enumerate(template_lines):
-           if '## Add Earth Engine Python script' in line:
-                header_end_index = index + 5
-
-    header = template_lines[:header_end_index]
-
-    return header
+    return list(load_template(in_template).header)
 
 
 def template_footer(in_template):
@@ -518,19 +1072,110 @@ def template_footer(in_template):
     Returns:
         list: List of lines.
     """    
-    footer = []
-    template_lines = []
-    footer_start_index = 0
+    return list(load_template(in_template).footer)
 
-    with open(in_template) as f:
-        template_lines = f.readlines()
-        for index, line in enumerate(template_lines):
-            if '## Display Earth Engine data layers' in line:
-                footer_start_index = index - 3
 
-    footer = ['\n'] + template_lines[footer_start_index:]
+def github_header(header, in_file, github_username=None, github_repo=None):
+    """Point the GitHub, nbviewer and Colab links in the notebook template header to a notebook.
+    
+    Args:
+        header (list): List of lines of the template header.
+        in_file (str): File path of the Earth Engine Python script in the GitHub repo.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+    
+    Returns:
+        list: List of lines.
+    """    
+    if (github_username is None) or (github_repo is None):
+        return header
+
+    out_py_path = str(in_file).split('/')
+    index = out_py_path.index(github_repo)
+    out_py_relative_path = '/'.join(out_py_path[index+1:])
+    out_ipynb_relative_path = out_py_relative_path.replace('.py', '.ipynb')
+
+    new_header = []
+    for line in header:
+        line = line.replace('giswqs', github_username)
+        line = line.replace('earthengine-py-notebooks', github_repo)
+        line = line.replace('Template/template.ipynb', out_ipynb_relative_path)
 
-    return footer
+        new_header.append(line)
+
+    return new_header
+
+
+def py_to_notebook(text):
+    """Convert a Python script with '# %%' cell markers to a Jupyter notebook. 
+    Cells are split like ipynb-py-convert does, and cells starting with triple quotes become markdown cells.
+    
+    Args:
+        text (str): The Python script.
+    
+    Returns:
+        dict: The notebook in nbformat 4.
+    """    
+    header_comment = '# %%\n'
+    if text.startswith(header_comment):
+        text = text[len(header_comment):]
+
+    cells = []
+    for chunk in text.split('\n\n' + header_comment):
+        cell_type = 'code'
+        if chunk.startswith("'''"):
+            chunk = chunk.strip("'\n")
+            cell_type = 'markdown'
+        elif chunk.startswith('"""'):
+            chunk = chunk.strip('"\n')
+            cell_type = 'markdown'
+
+        cell = {
+            'cell_type': cell_type,
+            'metadata': {},
+            'source': chunk.splitlines(True),
+        }
+        if cell_type == 'code':
+            cell.update({'outputs': [], 'execution_count': None})
+
+        cells.append(cell)
+
+    notebook = {
+        'cells': cells,
+        'metadata': {
+            'anaconda-cloud': {},
+            'kernelspec': {
+                'display_name': 'Python 3',
+                'language': 'python',
+                'name': 'python3'},
+            'language_info': {
+                'codemirror_mode': {'name': 'ipython', 'version': 3},
+                'file_extension': '.py',
+                'mimetype': 'text/x-python',
+                'name': 'python',
+                'nbconvert_exporter': 'python',
+                'pygments_lexer': 'ipython3',
+                'version': '3.6.1'}},
+        'nbformat': 4,
+        'nbformat_minor': 1
+    }
+
+    return notebook
+
+
+def write_notebook(notebook, out_file):
+    """Save a notebook to a file.
+    
+    Args:
+        notebook (dict): The notebook.
+        out_file (str): Output Jupyter notebook.
+    """    
+    out_dir = os.path.dirname(out_file)
+    if out_dir and not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    with open(out_file, 'w', encoding='utf-8') as f:
+        json.dump(notebook, f, indent=2)
 
 
 def py_to_ipynb(in_file, template_file, out_file=None, github_username=None, github_repo=None):
@@ -545,50 +1190,20 @@ def py_to_ipynb(in_file, template_file, out_file=None, github_username=None, git
     """    
     if out_file is None:
         out_file = in_file.replace('.py', '.ipynb')
-    out_py_file = in_file.replace(".py", "_nb.py")
 
     content = remove_qgis_import(in_file)
-    header = template_header(template_file)
-    footer = template_footer(template_file)
-
-    if (github_username is not None) and (github_repo is not None):
-
-        out_py_path = str(in_file).split('/')
-        index = out_py_path.index(github_repo)
-        out_py_relative_path = '/'.join(out_py_path[index+1:])
-        out_ipynb_relative_path = out_py_relative_path.replace('.py', '.ipynb')
-
-        new_header = []
-        for line in header:
-            line = line.replace('giswqs', github_username)
-            line = line.replace('earthengine-py-notebooks', github_repo)
-            line = line.replace('Template/template.ipynb', out_ipynb_relative_path)
-
-            new_header.append(line)
-        header = new_header
+    template = load_template(template_file)
+    header = template.github_header(in_file, github_username, github_repo)
 
     if content != None:
-        out_text = header + content + footer 
+        out_text = header + ''.join(content) + template.footer_text
     else:
-        out_text = header + footer
-
-    if not os.path.exists(os.path.dirname(out_py_file)):
-        os.makedirs(os.path.dirname(out_py_file))
+        out_text = header + template.footer_text
 
-    with open(out_py_file, 'w') as f:
-        f.writelines(out_text)    
-
-    try:
-        command = 'ipynb-py-convert ' + out_py_file + ' ' + out_file
-        print(os.popen(command).read().rstrip())
-    except:
-        print('Please install ipynb-py-convert using the following command:\n')
-        print('pip install ipynb-py-convert')
-
-    os.remove(out_py_file)
+    write_notebook(py_to_notebook(out_text), out_file)
 
 
-def py_to_ipynb_dir(in_dir, template_file, out_dir=None, github_username=None, github_repo=None):
+def py_to_ipynb_dir(in_dir, template_file, out_dir=None, github_username=None, github_repo=None, processes=1):
     """Convert Earth Engine Python scripts in a folder recursively to Jupyter notebooks.
     
     Args:
@@ -597,45 +1212,179 @@ def py_to_ipynb_dir(in_dir, template_file, out_dir=None, github_username=None, g
         out_dir str, optional): Ouput folder. Defaults to None.
         github_username (str, optional): GitHub username. Defaults to None.
         github_repo (str, optional): GitHub repo name. Defaults to None.
+        processes (int, optional): Number of worker processes. Use None for the number of CPUs. Defaults to 1.
+
+    Returns:
+        list: List of (in_file, error) tuples for the scripts that failed to convert.
     """    
-    files = list(Path(in_dir).rglob('*.py'))
+    files = sorted(Path(in_dir).rglob('*.py'))
     if out_dir is None:
         out_dir = in_dir
 
+    tasks = []
     for file in files:
         in_file = str(file)
         out_file = in_file.replace(in_dir, out_dir).replace('.py', '.ipynb')
-        py_to_ipynb(in_file, template_file, out_file, github_username, github_repo)
+        tasks.append((in_file, template_file, out_file, github_username, github_repo))
+
+    return _convert_files(py_to_ipynb, tasks, processes)
+
+
+def js_to_targets(in_file, template_file, github_username=None, github_repo=None):
+    """Convert an Earth Engine JavaScript to a Python script (X.py), a QGIS Python script (X_qgis.py) and a Jupyter notebook (X.ipynb).
+    The JavaScript is read and converted once, and all three files are written from the same result.
+    
+    Args:
+        in_file (str): File path of the input JavaScript (X.js).
+        template_file (str): Input Jupyter notebook template.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+    
+    Returns:
+        list: File paths of the Python script, the QGIS Python script and the Jupyter notebook.
+    """    
+    in_file = str(in_file)
+    out_py_file = os.path.splitext(in_file)[0] + '.py'
+    out_qgis_file = os.path.splitext(in_file)[0] + '_qgis.py'
+    out_ipynb_file = os.path.splitext(in_file)[0] + '.ipynb'
+
+    with open(in_file) as f:
+        lines = f.readlines()
+
+    print('Processing {}'.format(in_file))
+    math_import_str = ""
+    if use_math(lines):
+        math_import_str = "import math\n"
+    qgis_script = "import ee \n" + "from ee_plugin import Map \n" + math_import_str + js_lines_to_python(lines)
+
+    content = remove_qgis_import_lines(qgis_script.splitlines(True))
+    if content is None:
+        content = []
+
+    template = load_template(template_file)
+    header = template.github_header(out_py_file, github_username, github_repo)
+    nb_script = header + ''.join(content) + template.footer_text
+
+    with open(out_qgis_file, 'w') as f:
+        f.write(qgis_script)
+    with open(out_py_file, 'w') as f:
+        f.write(nb_script)
+    write_notebook(py_to_notebook(nb_script), out_ipynb_file)
+
+    return [out_py_file, out_qgis_file, out_ipynb_file]
+
+
+def js_to_targets_dir(in_dir, template_file, github_username=None, github_repo=None, processes=1):
+    """Convert all Earth Engine JavaScripts in a folder recursively to Python scripts, QGIS Python scripts and Jupyter notebooks.
+    The output files are saved next to the JavaScripts.
+    
+    Args:
+        in_dir (str): The input folder containing Earth Engine JavaScripts.
+        template_file (str): Input Jupyter notebook template.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+        processes (int, optional): Number of worker processes. Use None for the number of CPUs. Defaults to 1.
+
+    Returns:
+        list: List of (in_file, error) tuples for the scripts that failed to convert.
+    """
+    tasks = []
+    for in_file in sorted(Path(in_dir).rglob('*.js')):
+        tasks.append((str(in_file), template_file, github_username, github_repo))
+
+    return _convert_files(js_to_targets, tasks, processes)
 
 
 def execute_notebook(in_file):
     """Execute a Jupyter notebook and save output cells 
+    With nbclient installed, the performance of each code cell is saved in its metadata (see kernel_pool.py).
     
     Args:
         in_file (str): Input Jupyter notebook.
+
+    Returns:
+        bool: True if the notebook was executed without errors.
     """    
+    if importlib.util.find_spec('nbclient') is not None:
+        from kernel_pool import execute_notebook as execute_profiled
+
+        error = execute_profiled(in_file)
+        if error is not None:
+            print('Failed to execute {}: {}'.format(in_file, error))
+        return error is None
+
     command = 'jupyter nbconvert --to notebook --execute ' + in_file + ' --inplace'
-    print(os.popen(command).read().rstrip())
+    output = os.popen(command)
+    print(output.read().rstrip())
+    return output.close() is None
 
 
-def execute_notebook_dir(in_dir):
+def execute_notebook_dir(in_dir, kernels=None, use_cache=True, cache_dir=None, max_cache_size=500 * 1024 * 1024, compact=False, budget=None):
     """Execute all Jupyter notebooks in the given directory recursively and save output cells.
+    Notebooks whose code cells are unchanged since a successful run get their outputs from the execution cache (see execution_cache.py) without starting a kernel.
     
     Args:
         in_dir (str): Input folder containing notebooks.
+        kernels (int, optional): Number of warm kernels used to execute notebooks concurrently (see kernel_pool.py). Defaults to None, which executes notebooks one by one with nbconvert.
+        use_cache (bool, optional): Whether to use the execution cache. Defaults to True.
+        cache_dir (str, optional): Folder of the execution cache. Defaults to in_dir/.execution_cache.
+        max_cache_size (int, optional): Maximum size of the execution cache in bytes. Defaults to 500 MB.
+        compact (bool, optional): Whether to compact the notebooks after execution (see compact_notebooks.py). Defaults to False.
+        budget (int, optional): Maximum size of each compacted notebook in bytes. Notebooks over it are reported. Defaults to None.
     """
-    files = list(Path(in_dir).rglob('*.ipynb'))
-    count = len(files)
-    if files is not None:
-        for index, file in enumerate(files):
-            in_file = str(file)
+    files = [str(f) for f in sorted(Path(in_dir).rglob('*.ipynb'))]
+    all_files = files
+
+    cache = None
+    if use_cache:
+        from execution_cache import ExecutionCache
+        if cache_dir is None:
+            cache_dir = os.path.join(in_dir, '.execution_cache')
+        cache = ExecutionCache(cache_dir, max_cache_size)
+
+        pending = []
+        for in_file in files:
+            with open(in_file, encoding='utf-8') as f:
+                notebook = json.load(f)
+            cached = json.loads(json.dumps(notebook))
+            if cache.get(cached):
+                if cached != notebook:
+                    write_notebook(cached, in_file)
+            else:
+                pending.append(in_file)
+        print('Execution cache: {} hits, {} notebooks to execute'.format(len(files) - len(pending), len(pending)))
+        files = pending
+
+    if kernels:
+        from kernel_pool import execute_notebooks
+        results = execute_notebooks(files, kernels=kernels)
+        executed = [in_file for in_file, error, _ in results if error is None]
+    else:
+        executed = []
+        count = len(files)
+        for index, in_file in enumerate(files):
             print('Processing {}/{} ...'.format(index+1, count))
-            execute_notebook(in_file)
+            if execute_notebook(in_file):
+                executed.append(in_file)
+
+    if cache is not None:
+        for in_file in executed:
+            with open(in_file, encoding='utf-8') as f:
+                cache.put(json.load(f))
+
+    if compact:
+        # the cache keeps the full outputs, so compaction runs after they are stored
+        from compact_notebooks import compact_notebook
+        for in_file in all_files:
+            compact_notebook(in_file, budget=budget)
 
 
 
 if __name__ == '__main__':
 
+    # To rebuild only the files that are out of date, use build_gallery.py instead.
+    # To rebuild the files derived from a script whenever it is saved, use watch_gallery.py.
+
     ## Convert an Earth Engine JavaScript to Python script.
     root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     in_file_path = os.path.join(root_dir, "JavaScripts/Image/NormalizedDifference.js")  # change this path to your JavaScript file
@@ -646,7 +1395,7 @@ if __name__ == '__main__':
     # Convert all Earth Engine JavaScripts in a folder recursively to Python scripts.
     in_dir = os.path.join(root_dir, "JavaScripts")
     out_dir = os.path.join(root_dir, "JavaScripts")
-    js_to_python_dir(in_dir, out_dir, use_qgis=True)
+    js_to_python_dir(in_dir, out_dir, use_qgis=True, processes=None, incremental=True)
     print("Python scripts saved at: {}".format(out_dir))
 
     # Convert an Earth Engine Python script to Jupyter notebook.
@@ -3,6 +3,8 @@ import glob
 import datetime
 from pathlib import Path
 
+from convert_js_to_python import load_template, py_to_notebook, write_notebook
+
 
 def extract_py_script(in_file):
     start_index = 0
@@ -28,25 +30,10 @@ def extract_template(in_file, template_file):
     # print(index)
     out_py_script_path = '/'.join(out_py_path[index+1:])
 
-    header = []
-    footer = []
-
-    template_lines = []
-    header_end_index = 0
-    footer_start_index = 0
-
-    with open(template_file) as f:
-        template_lines = f.readlines()
-        for index, line in enumerate(template_lines):
-            # line = line.replace('Template/template', out_py_script_path[:-3])
-            # header.append(line)
-            if '## Add Earth Engine Python script' in line:
-                header_end_index = index + 5
-            if '## Display Earth Engine data layers' in line:
-                footer_start_index = index - 3
-
-    header = template_lines[:header_end_index]
-    footer = ['\n'] + template_lines[footer_start_index:]
+    # the template is parsed once per run, not once per script
+    template = load_template(template_file)
+    header = template.header
+    footer = template.footer
 
     header_tmp = []
     for line in header:
@@ -132,9 +119,7 @@ for index, filename in enumerate(files):
     print('{}/{}: {}'.format(i, len(files), out_nb_path))
     i = i + 1
     
-    cmd = 'ipynb-py-convert ' + out_py_script_path + ' ' + out_nb_path
-    # print(cmd)
-    print(os.popen(cmd).read().rstrip())
+    write_notebook(py_to_notebook(''.join(out_text)), out_nb_path)
 
     cmd2 = 'jupyter nbconvert --to notebook --execute ' + out_nb_path + ' --inplace'
     print(os.popen(cmd2).read().rstrip())
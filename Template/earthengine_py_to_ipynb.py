@@ -1,18 +1,10 @@
 """The example shows you how to convert all Earth Engine Python scripts in a GitHub repo to Jupyter notebooks.
 """
-import subprocess
-
-try:
-    import geemap
-except ImportError:
-    print('geemap package not installed. Installing ...')
-    subprocess.check_call(["python", '-m', 'pip', 'install', 'geemap'])
-
 import os
-from geemap.conversion import *
-
 import subprocess
 
+from convert_js_to_python import py_to_ipynb_dir
+
 try:
     from git import Repo
 except ImportError:
@@ -38,8 +30,8 @@ if not os.path.exists(repo_dir):
     Repo.clone_from(git_url, repo_dir)
 
 # # Convert all Earth Engine Python scripts in a folder recursively to Jupyter notebooks.
-nb_template = get_nb_template()  # Get the notebook template from the package folder.
-py_to_ipynb_dir(repo_dir, nb_template, out_dir, github_username='giswqs', github_repo=out_repo_name)
+nb_template = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'template.py')
+py_to_ipynb_dir(repo_dir, nb_template, out_dir, github_username='giswqs', github_repo=out_repo_name, processes=None)
 
 # execute_notebook_dir(out_dir)
 
@@ -0,0 +1,368 @@
+''' Evaluate Earth Engine objects concurrently with asyncio.
+
+getInfo(), getThumbURL() and getDownloadURL() block until the server answers, so independent requests wait on each
+other. ee_eval() runs them on a bounded thread pool and returns an awaitable, so they can be gathered:
+
+    import ee_async
+    ee_async.initialize(max_workers=8)
+    size, thumbnail = await asyncio.gather(
+        ee_async.ee_eval(collection.size()),
+        ee_async.ee_eval(image, 'getThumbURL', {'min': 0, 'max': 3000}),
+    )
+
+At most max_workers requests are in flight; further calls wait for a free slot instead of piling up in the queue of the
+thread pool. initialize() gives the ee client an HTTP connection pool as large as the thread pool, so the connections
+to each host are reused instead of opened for each request.
+
+To compare serial and concurrent evaluation against a local stand-in server: python ee_async.py --requests 100
+In a notebook: await ee_async.benchmark(requests=100, latency=0.2)
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+_executor = None
+_max_workers = 8
+_semaphores = {}
+_lock = threading.Lock()
+
+
+class SessionHttp(object):
+    """An httplib2-like HTTP transport for the ee client, sending requests through a requests.Session.
+
+    Args:
+        session (requests.Session): The session, see pooled_session().
+        timeout (float, optional): Timeout of a request in seconds. Defaults to None.
+    """
+
+    def __init__(self, session, timeout=None):
+        self.session = session
+        self.timeout = timeout
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None, **kwargs):
+        import httplib2
+        import requests
+
+        try:
+            response = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout)
+        except requests.exceptions.ConnectionError as e:
+            # converted to the errors retried by the ee client
+            raise ConnectionError(e)
+        except requests.exceptions.Timeout as e:
+            raise TimeoutError(e)
+        headers = dict(response.headers)
+        headers['status'] = response.status_code
+        return httplib2.Response(headers), response.content
+
+
+def pooled_session(max_connections=8):
+    """Create a requests.Session keeping up to max_connections open connections to each host.
+
+    Args:
+        max_connections (int, optional): Maximum number of connections kept open per host. Defaults to 8.
+
+    Returns:
+        requests.Session: The session.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    # the default pool keeps 10 connections per host, the others are closed after each request
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def set_max_workers(max_workers):
+    """Set the number of requests in flight at the same time.
+
+    Args:
+        max_workers (int): The number of threads of the pool.
+    """
+    global _executor, _max_workers
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = None
+        _max_workers = max_workers
+        _semaphores.clear()
+
+
+def initialize(max_workers=8, timeout=None, **kwargs):
+    """Initialize Earth Engine with a connection pool sized for max_workers concurrent requests.
+
+    Args:
+        max_workers (int, optional): Number of requests in flight at the same time. Defaults to 8.
+        timeout (float, optional): Timeout of a request in seconds. Defaults to None.
+        **kwargs: Other arguments of ee.Initialize(), e.g., project.
+    """
+    import ee
+
+    set_max_workers(max_workers)
+    ee.Initialize(http_transport=SessionHttp(pooled_session(max_workers), timeout), **kwargs)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(_max_workers, thread_name_prefix='ee_eval')
+        return _executor
+
+
+def get_semaphore(loop):
+    # a semaphore belongs to the event loop it is used in, e.g., the one of the notebook
+    with _lock:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = _semaphores[loop] = asyncio.Semaphore(_max_workers)
+        return semaphore
+
+
+async def ee_eval(ee_object, method='getInfo', *args, **kwargs):
+    """Evaluate an Earth Engine object on the thread pool.
+
+    Args:
+        ee_object (object): The object, e.g., collection.size() or an ee.Image.
+        method (str, optional): The method sending the request, e.g., 'getInfo', 'getThumbURL' or 'getDownloadURL'.
+            Defaults to 'getInfo'.
+        *args: The arguments of the method, e.g., the thumbnail parameters.
+        **kwargs: The keyword arguments of the method.
+
+    Returns:
+        object: The result of the method.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(getattr(ee_object, method), *args, **kwargs)
+    async with get_semaphore(loop):
+        return await loop.run_in_executor(get_executor(), call)
+
+
+async def ee_eval_all(ee_objects, method='getInfo', *args, **kwargs):
+    """Evaluate several Earth Engine objects concurrently.
+
+    Args:
+        ee_objects (list): The objects.
+        method (str, optional): The method sending the request. Defaults to 'getInfo'.
+        *args: The arguments of the method.
+        **kwargs: The keyword arguments of the method.
+
+    Returns:
+        list: The results, in the same order.
+    """
+    return await asyncio.gather(*[ee_eval(ee_object, method, *args, **kwargs) for ee_object in ee_objects])
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answer the requests of the ee client like Earth Engine would, after waiting for the latency of the server."""
+
+    protocol_version = 'HTTP/1.1'  # keep the connections open, so they can be reused
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        content = data if isinstance(data, bytes) else json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        self.answer()
+
+    def answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        path = urlsplit(self.path).path
+        name = path.rsplit('/', 1)[-1]
+
+        if '$discovery' in path:
+            return self.send_json(200, self.server.discovery_document())
+        if name == 'algorithms':
+            return self.send_json(200, self.server.algorithms())
+
+        server = self.server
+        server.count('requests', 1)
+        try:
+            time.sleep(server.latency)
+        finally:
+            server.count('requests', -1)
+        if name == 'value:compute':
+            result = server.count('computed')
+            if server.compute is not None:
+                result = server.compute(json.loads(body.decode('utf-8')))
+            self.send_json(200, {'result': result})
+        elif name in ('thumbnails', 'videoThumbnails', 'filmstripThumbnails'):
+            thumbnail = 'projects/ee-standin/thumbnails/{}'.format(server.count('thumbnails'))
+            server.thumbnails[thumbnail] = json.loads(body.decode('utf-8'))
+            self.send_json(200, {'name': thumbnail})
+        elif name.endswith(':getPixels') and server.pixels is not None:
+            if server.random.random() < server.failure_rate:
+                return self.send_json(503, {'error': {'code': 503, 'message': 'Service unavailable.',
+                                                      'status': 'UNAVAILABLE'}})
+            request = server.thumbnails.get(path[path.index('projects/'):-len(':getPixels')])
+            content = server.pixels(request)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/tiff')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        else:
+            self.send_json(404, {'error': {'code': 404, 'message': 'Not found: {}'.format(path),
+                                           'status': 'NOT_FOUND'}})
+
+
+class StandInServer(ThreadingHTTPServer):
+    """A local stand-in for the Earth Engine API, answering getInfo() and thumbnail requests after a fixed latency.
+
+    The discovery document and the algorithms are the ones shipped with the tests of the ee package.
+
+    Args:
+        latency (float, optional): Time in seconds the server takes to answer a request. Defaults to 0.2.
+        port (int, optional): The port. Defaults to 0, i.e., a free port.
+        compute (callable, optional): Called with the getInfo() request (a dict with the expression), returns its
+            result. Defaults to None, i.e., the number of getInfo() requests so far.
+        pixels (callable, optional): Called with the thumbnail request (a dict with the expression and fileFormat)
+            of a getThumbURL() or getDownloadURL() URL, returns the content served at the URL. Defaults to None,
+            i.e., the URLs are not served.
+        failure_rate (float, optional): Probability that fetching the pixels fails with a 503 error. Defaults to 0.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.2, port=0, compute=None, pixels=None, failure_rate=0):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.compute = compute
+        self.pixels = pixels
+        self.failure_rate = failure_rate
+        self.random = random.Random(0)
+        self.thumbnails = {}
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+        self.stats = {'connections': 0, 'requests': 0, 'max_requests': 0, 'computed': 0, 'thumbnails': 0}
+        self.stats_lock = threading.Lock()
+        self._documents = {}
+        self.thread = None
+
+    def count(self, key, step=1):
+        with self.stats_lock:
+            self.stats[key] += step
+            if key == 'requests':
+                self.stats['max_requests'] = max(self.stats['max_requests'], self.stats['requests'])
+            return self.stats[key]
+
+    def test_file(self, name):
+        if name not in self._documents:
+            import ee
+            with open(os.path.join(os.path.dirname(ee.__file__), 'tests', name), 'rb') as f:
+                self._documents[name] = f.read()
+        return self._documents[name]
+
+    def discovery_document(self):
+        document = json.loads(self.test_file('cloud_api_discovery_document.json'))
+        # send the API requests to this server
+        document['rootUrl'] = document['baseUrl'] = self.url + '/'
+        return document
+
+    def algorithms(self):
+        return self.test_file('algorithms.json')
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def initialize(self, max_workers=8):
+        """Initialize Earth Engine against this server, without credentials.
+
+        Args:
+            max_workers (int, optional): Number of requests in flight at the same time. Defaults to 8.
+        """
+        import ee
+
+        ee.data.reset()
+        initialize(max_workers, credentials=None, project='ee-standin', opt_url=self.url)
+
+
+async def benchmark(requests=100, latency=0.2, max_workers=8):
+    """Compare serial and concurrent getInfo() calls against a local stand-in server.
+
+    Args:
+        requests (int, optional): Number of getInfo() calls. Defaults to 100.
+        latency (float, optional): Time in seconds the server takes to answer a request. Defaults to 0.2.
+        max_workers (int, optional): Number of requests in flight at the same time. Defaults to 8.
+
+    Returns:
+        dict: The wall time in seconds of the serial and of the concurrent calls, the speedup, and the number of
+            connections opened and the maximum number of requests in flight for the concurrent calls.
+    """
+    import ee
+
+    server = StandInServer(latency).start()
+    try:
+        server.initialize(max_workers)
+        objects = [ee.Number(i).add(1) for i in range(requests)]
+
+        start = time.perf_counter()
+        for ee_object in objects:
+            ee_object.getInfo()
+        serial = time.perf_counter() - start
+
+        connections = server.stats['connections']
+        start = time.perf_counter()
+        await ee_eval_all(objects)
+        concurrent = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    return {
+        'serial': round(serial, 3),
+        'concurrent': round(concurrent, 3),
+        'speedup': round(serial / concurrent, 1),
+        'connections': server.stats['connections'] - connections,
+        'max_in_flight': server.stats['max_requests'],
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=100, help="Number of getInfo() calls")
+    parser.add_argument('--latency', type=float, default=0.2, help="Time in seconds the server takes per request")
+    parser.add_argument('--max_workers', type=int, default=8, help="Number of requests in flight at the same time")
+    args = parser.parse_args()
+
+    result = asyncio.run(benchmark(args.requests, args.latency, args.max_workers))
+    print('{} getInfo() calls with {}s latency: serial {}s, concurrent {}s ({}x faster), {} connections opened, '
+          '{} requests in flight at most'.format(args.requests, args.latency, result['serial'],
+                                                 result['concurrent'], result['speedup'], result['connections'],
+                                                 result['max_in_flight']))
@@ -0,0 +1,167 @@
+''' Fetch the values of several Earth Engine objects in a single request.
+
+Each getInfo() call is a round trip to the Earth Engine servers. Objects that are fetched together are packed into one
+ee.List, fetched with one getInfo() call and unpacked on the client:
+
+    size, names = get_info([collection.size(), collection.aggregate_array('system:index')])
+
+    batch = Batch()
+    size = batch.add(collection.size())
+    names = batch.add(collection.aggregate_array('system:index'))
+    batch.get_info()
+    print(size.value, names.value)
+
+If one of the objects fails to compute, the whole request fails.
+
+To get properties of every image in a collection as a table, with one request per page of images:
+
+    table = collection_table(collection, ['system:index', 'CLOUD_COVER', 'system:time_start'])
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+
+
+def get_info(objects, max_size=None):
+    """Fetch the values of several Earth Engine objects with as few requests as possible.
+
+    Args:
+        objects (list | dict): The objects, e.g., [image.bandNames(), collection.size()], or a dict of them.
+        max_size (int, optional): Maximum number of objects per request, to keep requests and responses small.
+            Defaults to None, i.e., a single request.
+
+    Returns:
+        list | dict: The values of the objects, in the same order or with the same keys.
+    """
+    if isinstance(objects, dict):
+        keys = list(objects)
+        return dict(zip(keys, get_info([objects[key] for key in keys], max_size)))
+
+    objects = list(objects)
+    if not objects:
+        return []
+    size = max_size or len(objects)
+    values = []
+    for start in range(0, len(objects), size):
+        values.extend(ee.List(objects[start:start + size]).getInfo())
+    return values
+
+
+class Pending(object):
+    """The value of an Earth Engine object added to a Batch, available after Batch.get_info()."""
+
+    def __init__(self, ee_object):
+        self.ee_object = ee_object
+        self.fetched = False
+        self._value = None
+
+    @property
+    def value(self):
+        if not self.fetched:
+            raise ValueError('The value is not fetched yet. Call get_info() of the batch first.')
+        return self._value
+
+
+class Batch(object):
+    """Collect Earth Engine objects and fetch their values together.
+
+    Args:
+        max_size (int, optional): Maximum number of objects per request. Defaults to None, i.e., a single request.
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.pending = []
+
+    def add(self, ee_object):
+        """Add an object to fetch.
+
+        Args:
+            ee_object (object): An Earth Engine object, e.g., image.bandNames().
+
+        Returns:
+            Pending: Its value, available after get_info().
+        """
+        pending = Pending(ee_object)
+        self.pending.append(pending)
+        return pending
+
+    def __len__(self):
+        return len(self.pending)
+
+    def get_info(self):
+        """Fetch the values of all objects added since the last call.
+
+        Returns:
+            list: The values, in the order the objects were added.
+        """
+        pending, self.pending = self.pending, []
+        values = get_info([item.ee_object for item in pending], self.max_size)
+        for item, value in zip(pending, values):
+            item._value = value
+            item.fetched = True
+        return values
+
+
+def collection_rows(collection, properties, page_size=1000, max_workers=4):
+    """Get properties of every element of a collection, with one request per page of elements.
+
+    The first page and the size of the collection come in the first request, the other pages are requested
+    concurrently. Each element is turned into a list of its properties, so a missing property is None in its row
+    (aggregate_array() and reduceColumns() skip missing values, which would misalign the columns).
+
+    Args:
+        collection (ee.Collection): The collection, e.g., an ee.ImageCollection.
+        properties (list): The property names, e.g., ['system:index', 'CLOUD_COVER'].
+        page_size (int, optional): Number of elements per request. Defaults to 1000.
+        max_workers (int, optional): Number of pages requested at the same time. Defaults to 4.
+
+    Returns:
+        list: One list of property values per element, in the order of the collection.
+    """
+    def page(offset):
+        elements = collection.toList(page_size, offset)
+        return elements.map(lambda element: ee.List([ee.Feature(element).get(name) for name in properties]))
+
+    first = ee.Dictionary({'size': collection.size(), 'rows': page(0)}).getInfo()
+    rows = first['rows']
+    offsets = range(page_size, first['size'], page_size)
+    if offsets:
+        with ThreadPoolExecutor(max_workers) as executor:
+            for page_rows in executor.map(lambda offset: page(offset).getInfo(), offsets):
+                rows.extend(page_rows)
+    return rows
+
+
+def collection_table(collection, properties, page_size=1000, max_workers=4):
+    """Get properties of every element of a collection as a table, with one request per page of elements.
+
+    Args:
+        collection (ee.Collection): The collection, e.g., an ee.ImageCollection.
+        properties (list): The property names, e.g., ['system:index', 'CLOUD_COVER'].
+        page_size (int, optional): Number of elements per request. Defaults to 1000.
+        max_workers (int, optional): Number of pages requested at the same time. Defaults to 4.
+
+    Returns:
+        pandas.DataFrame: One column per property and one row per element. A NumPy record array if pandas is not
+            installed.
+    """
+    rows = collection_rows(collection, properties, page_size, max_workers)
+    try:
+        import pandas as pd
+        return pd.DataFrame(rows, columns=properties)
+    except ImportError:
+        pass
+
+    try:
+        import numpy as np
+    except ImportError:
+        print('Please install pandas or numpy: pip install pandas')
+        return None
+    columns = [np.array([row[i] for row in rows]) for i in range(len(properties))]
+    return np.rec.fromarrays(columns, names=properties)
@@ -0,0 +1,279 @@
+''' Count the Earth Engine round trips of every example script and compare them with a saved baseline.
+
+Each script runs against the recorded Earth Engine responses (see ee_replay.py), so no network access is needed. For
+each script, the requests are counted by kind (getInfo, getMapId, getThumbURL, export, other), and the size of the
+serialized requests and of their expression graphs is measured. The results are compared with the baseline file and
+the run fails if a script makes more round trips, sends more bytes or larger expression graphs than before, fails
+where it used to run, or is not in the baseline.
+
+To compare all scripts with the baseline: python ee_benchmark.py
+To save the current results as the new baseline: python ee_benchmark.py --update
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import io
+import os
+import sys
+import json
+import argparse
+import contextlib
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import ee_replay
+
+
+# Results compared with the baseline. Each of them must not grow.
+METRICS = ['round_trips', 'request_bytes', 'graph_nodes']
+
+# Keys of the value nodes of a serialized expression.
+VALUE_NODE_KEYS = ('constantValue', 'integerValue', 'bytesValue', 'arrayValue', 'dictionaryValue',
+                   'functionDefinitionValue', 'functionInvocationValue', 'argumentReference', 'valueReference')
+
+
+def request_kind(method, uri):
+    """Find the ee client call that sent a request.
+
+    Args:
+        method (str): The HTTP method.
+        uri (str): The request URL.
+
+    Returns:
+        str: 'getInfo', 'getMapId', 'getThumbURL', 'export', 'initialize' or 'other'.
+    """
+    path = urlsplit(uri).path
+    name = path.rsplit('/', 1)[-1]
+    if '$discovery' in path or name == 'algorithms':
+        return 'initialize'
+    if name == 'value:compute':
+        return 'getInfo'
+    if method.upper() == 'POST' and name == 'maps':
+        return 'getMapId'
+    if method.upper() == 'POST' and name in ('thumbnails', 'videoThumbnails', 'filmstripThumbnails'):
+        return 'getThumbURL'
+    if name.endswith(':export'):
+        return 'export'
+    return 'other'
+
+
+def graph_size(node):
+    """Count the value nodes of a serialized expression.
+
+    Args:
+        node (dict | list): The expression, or a part of it.
+
+    Returns:
+        int: Number of value nodes.
+    """
+    count = 0
+    if isinstance(node, dict):
+        if any(key in node for key in VALUE_NODE_KEYS):
+            count += 1
+        for key, value in node.items():
+            if key != 'constantValue':
+                count += graph_size(value)
+    elif isinstance(node, list):
+        for value in node:
+            count += graph_size(value)
+    return count
+
+
+class CountingHttp(object):
+    """An HTTP transport counting the Earth Engine requests sent through another transport.
+
+    Args:
+        http (object): The transport sending the requests, e.g., ee_replay.ReplayHttp.
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self.reset()
+
+    def reset(self):
+        self.calls = {}
+        self.request_bytes = 0
+        self.graph_nodes = 0
+        self.max_graph_nodes = 0
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        kind = request_kind(method, uri)
+        if ee_replay.is_ee_request(uri) and kind != 'initialize':
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            if body:
+                data = body.encode('utf-8') if isinstance(body, str) else body
+                self.request_bytes += len(data)
+                try:
+                    nodes = graph_size(json.loads(data).get('expression'))
+                except (ValueError, AttributeError):
+                    nodes = 0
+                self.graph_nodes += nodes
+                self.max_graph_nodes = max(self.max_graph_nodes, nodes)
+        return self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+    def results(self):
+        return {
+            'round_trips': sum(self.calls.values()),
+            'calls': dict(sorted(self.calls.items())),
+            'request_bytes': self.request_bytes,
+            'graph_nodes': self.graph_nodes,
+            'max_graph_nodes': self.max_graph_nodes,
+        }
+
+
+def find_scripts(root_dir):
+    """Find the example scripts in a folder recursively.
+
+    Args:
+        root_dir (str): The root folder of the repo.
+
+    Returns:
+        list: The scripts, without the QGIS scripts and the scripts in the Template and hidden folders.
+    """
+    return sorted(str(f) for f in Path(root_dir).rglob('*.py')
+                  if not f.name.endswith('_qgis.py')
+                  and not any(part.startswith('.') or part == 'Template'
+                              for part in f.relative_to(root_dir).parent.parts))
+
+
+def benchmark_scripts(files, root_dir, mode='replay', cassette_dir=None, project=None):
+    """Run scripts one after another and count their Earth Engine requests.
+
+    Args:
+        files (list): The scripts.
+        root_dir (str): The scripts are keyed by their path relative to this folder.
+        mode (str, optional): 'replay' to use the recorded responses, or 'record' to send the requests to Earth Engine
+            and record the responses. Defaults to 'replay'.
+        cassette_dir (str, optional): The folder of the recorded responses. Defaults to the one of ee_replay.install().
+        project (str, optional): The Google Cloud project used when recording. Defaults to the one of the credentials.
+
+    Returns:
+        dict: The results of each script, see CountingHttp.results(), with the error message (None if the script ran
+            without errors) and the wall time in seconds.
+    """
+    counter = []
+
+    def wrapper(http):
+        counter.append(CountingHttp(http))
+        return counter[0]
+
+    ee_replay.install(mode, cassette_dir, project=project, wrapper=wrapper)
+
+    results = {}
+    for index, in_file in enumerate(files):
+        name = Path(os.path.relpath(in_file, root_dir)).as_posix()
+        counter[0].reset()
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, error, seconds = ee_replay.run_scripts([in_file])[0]
+        result = counter[0].results()
+        result['error'] = error
+        result['wall_time'] = round(seconds, 3)
+        results[name] = result
+        print('Processing {}/{}: {} ({} round trips){}'.format(index + 1, len(files), name, result['round_trips'],
+                                                               '' if error is None else ' ' + error))
+    return results
+
+
+def read_baseline(baseline_file):
+    if not os.path.exists(baseline_file):
+        return {}
+    with open(baseline_file) as f:
+        return json.load(f)['scripts']
+
+
+def write_baseline(results, baseline_file):
+    """Save results as the baseline. The wall times are left out because they are not reproducible.
+
+    Args:
+        results (dict): The results of each script, see benchmark_scripts().
+        baseline_file (str): Output JSON file.
+    """
+    scripts = {name: {key: value for key, value in result.items() if key != 'wall_time'}
+               for name, result in results.items()}
+    with open(baseline_file, 'w') as f:
+        json.dump({'metrics': METRICS, 'scripts': scripts}, f, indent=1, sort_keys=True)
+        f.write('\n')
+
+
+def compare(results, baseline, tolerance=0.0):
+    """Compare results with the baseline.
+
+    Args:
+        results (dict): The results of each script, see benchmark_scripts().
+        baseline (dict): The baseline results of each script.
+        tolerance (float, optional): Relative growth of request_bytes and graph_nodes that is not a regression.
+            Round trips must never grow. Defaults to 0.
+
+    Returns:
+        tuple: List of regressions and list of improvements, as messages.
+    """
+    regressions = []
+    improvements = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            regressions.append('{}: not in the baseline, run with --update to add it'.format(name))
+            continue
+        if result['error'] is not None and before.get('error') is None:
+            regressions.append('{}: fails with {}'.format(name, result['error']))
+            continue
+        for metric in METRICS:
+            allowed = before[metric] if metric == 'round_trips' else before[metric] * (1 + tolerance)
+            if result[metric] > allowed:
+                regressions.append('{}: {} {} -> {}'.format(name, metric, before[metric], result[metric]))
+            elif result[metric] < before[metric]:
+                improvements.append('{}: {} {} -> {}'.format(name, metric, before[metric], result[metric]))
+    return regressions, improvements
+
+
+if __name__ == '__main__':
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*', help="Scripts or folders of scripts (defaults to all example scripts)")
+    parser.add_argument('--baseline', type=str, default=os.path.join(root_dir, 'Template', 'ee_benchmark.json'),
+                        help="Baseline JSON file")
+    parser.add_argument('--update', action='store_true', help="Save the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.0,
+                        help="Relative growth of request bytes and expression graph size allowed")
+    parser.add_argument('--record', action='store_true',
+                        help="Send the requests to Earth Engine and record the responses instead of replaying them")
+    parser.add_argument('--cassette_dir', type=str, default=None,
+                        help="Folder of the recorded responses (defaults to .ee_cassettes in the repo)")
+    parser.add_argument('--project', type=str, default=None, help="Google Cloud project used when recording")
+    args = parser.parse_args()
+
+    if not args.update and not os.path.exists(args.baseline):
+        print('The baseline {} does not exist. Run with --update to create it.'.format(args.baseline))
+        sys.exit(1)
+
+    files = []
+    for path in args.paths or [root_dir]:
+        files.extend(find_scripts(path) if os.path.isdir(path) else [path])
+
+    results = benchmark_scripts(files, root_dir, 'record' if args.record else 'replay', args.cassette_dir,
+                                args.project)
+    failed = [name for name, result in results.items() if result['error'] is not None]
+    print('{} scripts, {} round trips in total, {} scripts failed'.format(
+        len(results), sum(result['round_trips'] for result in results.values()), len(failed)))
+
+    if args.update:
+        baseline = read_baseline(args.baseline) if args.paths else {}
+        baseline.update(results)
+        write_baseline(baseline, args.baseline)
+        print('Baseline saved at: {}'.format(args.baseline))
+        sys.exit(0)
+
+    regressions, improvements = compare(results, read_baseline(args.baseline), args.tolerance)
+    if improvements:
+        print('{} improvements, run with --update to save them:'.format(len(improvements)))
+        for message in improvements:
+            print('  {}'.format(message))
+    if regressions:
+        print('{} regressions:'.format(len(regressions)))
+        for message in regressions:
+            print('  {}'.format(message))
+        sys.exit(1)
@@ -0,0 +1,116 @@
+''' Check and import the packages used by the notebooks without paying for imports that are not needed yet.
+
+is_installed() finds a package without importing it, lazy_import() returns a module that is imported on first
+attribute access, and import_times() shows which modules make an import slow.
+
+To show the slowest modules imported by geemap: python ee_bootstrap.py geemap
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import sys
+import argparse
+import subprocess
+import importlib.util
+
+
+def is_installed(name):
+    """Check whether a package is installed without importing it.
+
+    Args:
+        name (str): The package name, e.g., 'geemap'.
+
+    Returns:
+        bool: True if the package can be imported.
+    """
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def ensure_installed(packages):
+    """Install the packages that are not installed yet with pip.
+
+    Args:
+        packages (list): Package names. Use 'import_name:pip_name' if the names differ, e.g., 'ee:earthengine-api'.
+
+    Returns:
+        list: The pip names of the installed packages.
+    """
+    missing = []
+    for package in packages:
+        name, _, pip_name = package.partition(':')
+        if not is_installed(name):
+            missing.append(pip_name or name)
+
+    if missing:
+        print('Installing {} ...'.format(', '.join(missing)))
+        subprocess.check_call([sys.executable, '-m', 'pip', 'install'] + missing)
+        importlib.invalidate_caches()
+    return missing
+
+
+def lazy_import(name):
+    """Import a module when one of its attributes is first used.
+
+    Args:
+        name (str): The module name, e.g., 'geemap'.
+
+    Returns:
+        module: The module. It is executed on first attribute access.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError('No module named {}'.format(name))
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def import_times(name, top=20):
+    """Measure the import time of a module and of each module it imports, in a new Python process.
+
+    Args:
+        name (str): The module name, e.g., 'geemap'.
+        top (int, optional): Number of modules to return. Defaults to 20.
+
+    Returns:
+        list: List of (module name, self time, cumulative time) tuples in seconds, slowest cumulative time first.
+            The first item is the total import time of the module.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(name)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, cumulative, module = line[len('import time:'):].split('|')
+        times.append((module.strip(), int(self_time) / 1e6, int(cumulative) / 1e6))
+
+    times.sort(key=lambda item: -item[2])
+    return times[:top]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('module', type=str, nargs='?', default='geemap', help="Module to import")
+    parser.add_argument('--top', type=int, default=20, help="Number of modules to show")
+    args = parser.parse_args()
+
+    print('{:>10} {:>10}  {}'.format('self (s)', 'total (s)', 'module'))
+    for module, self_time, cumulative in import_times(args.module, args.top):
+        print('{:10.3f} {:10.3f}  {}'.format(self_time, cumulative, module))
@@ -0,0 +1,280 @@
+''' Memoize the results of getInfo() in memory and on disk.
+
+Notebooks and pipelines evaluate the same deterministic expressions again and again, e.g., image.bandNames() or
+collection.size(). Once enabled, getInfo() results are keyed by the SHA-256 of the canonical serialized expression and
+kept in an in-memory LRU cache and in a folder on disk, where they expire after a time to live and the least recently
+used entries are removed once the folder grows beyond its size limit:
+
+    import ee_cache
+    ee_cache.enable()
+
+Expressions reading sources that change, e.g., .../current/... assets or NRTI (near real-time) collections, are not
+cached. Errors are never cached.
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import re
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ee_getinfo')
+
+# Expressions containing a string matching one of these patterns (e.g., an asset ID) are not cached.
+MUTABLE_PATTERNS = [r'/current/', r'NRTI']
+
+
+def expression_key(expression):
+    """Compute the key of a serialized expression.
+
+    Args:
+        expression (dict): The serialized expression, e.g., ee.serializer.encode(obj, for_cloud_api=True).
+
+    Returns:
+        str: The SHA-256 hex digest of the expression serialized with sorted keys.
+    """
+    text = json.dumps(expression, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def expression_strings(node):
+    """Yield the strings of a serialized expression, e.g., asset IDs and function names.
+
+    Args:
+        node (object): The expression, or a part of it.
+    """
+    if isinstance(node, str):
+        yield node
+    elif isinstance(node, dict):
+        for key, value in node.items():
+            yield key
+            for text in expression_strings(value):
+                yield text
+    elif isinstance(node, list):
+        for value in node:
+            for text in expression_strings(value):
+                yield text
+
+
+class GetInfoCache(object):
+    """getInfo() results in an in-memory LRU cache backed by a folder with time to live and size-bounded eviction.
+
+    Args:
+        cache_dir (str, optional): The folder used to store the results. Defaults to ~/.cache/ee_getinfo.
+        max_size (int, optional): Maximum total size of the folder in bytes. Defaults to 100 MB.
+        ttl (float, optional): Time to live of the results on disk in seconds. Defaults to 7 days.
+        max_items (int, optional): Maximum number of results kept in memory. Defaults to 1024.
+        mutable_patterns (list, optional): Regular expressions of the strings, e.g., asset IDs, of expressions that
+            are not cached. Defaults to MUTABLE_PATTERNS.
+    """
+
+    def __init__(self, cache_dir=None, max_size=100 * 1024 * 1024, ttl=7 * 24 * 3600, max_items=1024,
+                 mutable_patterns=None):
+        self.cache_dir = os.path.abspath(cache_dir or CACHE_DIR)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_items = max_items
+        self.mutable = re.compile('|'.join(MUTABLE_PATTERNS if mutable_patterns is None else mutable_patterns))
+        self.memory = OrderedDict()  # key: (expiry time, value)
+        self.size = None  # total size of the folder, computed on the first write
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def is_mutable(self, expression):
+        """Check whether an expression reads a source that changes over time.
+
+        Args:
+            expression (dict): The serialized expression.
+
+        Returns:
+            bool: True if one of its strings matches one of the mutable patterns.
+        """
+        if not self.mutable.pattern:
+            return False
+        return any(self.mutable.search(text) for text in expression_strings(expression))
+
+    def get(self, key):
+        """Get a cached result.
+
+        Args:
+            key (str): The expression key.
+
+        Returns:
+            tuple: (True, value) on a cache hit, (False, None) otherwise.
+        """
+        now = time.time()
+        cached = self.memory.get(key)
+        if cached is not None and cached[0] > now:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return True, cached[1]
+
+        cache_file = self.path(key)
+        try:
+            with open(cache_file, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return False, None
+        if cached['created'] + self.ttl <= now:
+            self.misses += 1
+            return False, None
+
+        os.utime(cache_file)  # mark as recently used
+        self.remember(key, cached['created'] + self.ttl, cached['value'])
+        self.hits += 1
+        return True, cached['value']
+
+    def remember(self, key, expiry, value):
+        self.memory[key] = (expiry, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def put(self, key, value):
+        """Store a result.
+
+        Args:
+            key (str): The expression key.
+            value (object): The result of getInfo().
+        """
+        now = time.time()
+        self.remember(key, now + self.ttl, value)
+
+        cache_file = self.path(key)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        old_size = os.path.getsize(cache_file) if os.path.exists(cache_file) else 0  # e.g., an expired entry
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({'created': now, 'value': value}, f)
+        os.replace(tmp_file, cache_file)
+
+        if self.size is None:
+            self.size = sum(entry[1] for entry in self.entries())
+        else:
+            self.size += os.path.getsize(cache_file) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """List the cache entries on disk.
+
+        Returns:
+            list: List of (last used time, size, path) tuples.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    cache_file = os.path.join(root, name)
+                    try:
+                        stat = os.stat(cache_file)
+                    except FileNotFoundError:  # removed by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, cache_file))
+
+        return entries
+
+    def evict(self):
+        """Remove the expired entries, then the least recently used entries until the folder fits in 90% of max_size.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        expired = time.time() - self.ttl
+        removed = 0
+        for last_used, entry_size, cache_file in entries:
+            # an entry is created before it is last used, so an entry not used within the time to live has expired
+            if size <= self.max_size * 0.9 and last_used > expired:
+                break
+            try:
+                os.remove(cache_file)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+        self.size = size
+        return removed
+
+    def clear(self):
+        """Remove all cached results."""
+        self.memory.clear()
+        for _, _, cache_file in self.entries():
+            try:
+                os.remove(cache_file)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+
+    def compute_value(self, compute_value, obj):
+        """Compute the value of an object through the cache.
+
+        Args:
+            compute_value (callable): The function of the ee client sending the request, ee.data.computeValue.
+            obj (ee.ComputedObject): The object.
+
+        Returns:
+            object: The value of the object.
+        """
+        from ee import serializer
+
+        expression = serializer.encode(obj, for_cloud_api=True)
+        if self.is_mutable(expression):
+            self.bypassed += 1
+            return compute_value(obj)
+
+        key = expression_key(expression)
+        found, value = self.get(key)
+        if not found:
+            value = compute_value(obj)
+            self.put(key, value)
+        return value
+
+
+def enable(cache_dir=None, **kwargs):
+    """Memoize the results of getInfo() from now on.
+
+    Args:
+        cache_dir (str, optional): The folder used to store the results. Defaults to ~/.cache/ee_getinfo.
+        **kwargs: Other arguments of GetInfoCache, e.g., ttl or max_size.
+
+    Returns:
+        GetInfoCache: The cache.
+    """
+    import ee
+
+    disable()
+    cache = GetInfoCache(cache_dir, **kwargs)
+    compute_value = ee.data.computeValue
+
+    def cached_compute_value(obj):
+        return cache.compute_value(compute_value, obj)
+    cached_compute_value.compute_value = compute_value
+
+    ee.data.computeValue = cached_compute_value
+    return cache
+
+
+def disable():
+    """Stop memoizing the results of getInfo()."""
+    import ee
+
+    compute_value = getattr(ee.data.computeValue, 'compute_value', None)
+    if compute_value is not None:
+        ee.data.computeValue = compute_value
@@ -0,0 +1,508 @@
+''' Download a large region of an Earth Engine image tile by tile and mosaic it into a Cloud-Optimized GeoTIFF.
+
+A single getDownloadURL() fails beyond the request size limit of the server, and a single stream is slow. The region is
+split into tiles on a fixed pixel grid, small enough for one request each. The tiles are downloaded in parallel with
+retries and streamed to disk, then copied block by block into a tiled GeoTIFF with overviews, so the mosaic is never
+held in memory. Tiles already downloaded are kept until the mosaic is written, so an interrupted download resumes:
+
+    download_region(ee.Image('USGS/SRTMGL1_003'), [-120, 34, -119, 35], 'dem.tif', scale=0.0002777777777777778,
+                    crs='EPSG:4326', dtype='int16')
+
+Tiles left in the folder by a download of another image, grid, tile size or data type are discarded.
+
+To download from the command line:
+    python ee_download.py dem.tif --asset USGS/SRTMGL1_003 --region -120 34 -119 35 --scale 0.0002777777777777778
+To test against a local stand-in server with synthetic pixels: python ee_download.py test.tif --stand_in
+
+Writing the GeoTIFF needs rasterio: pip install rasterio
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import json
+import math
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+
+import ee_async
+
+
+# Maximum size of the pixels of one request. Earth Engine refuses requests larger than 48 MB.
+MAX_BYTES = 32 * 1024 * 1024
+
+# Data types of the downloaded image: the ee.Image method casting to the type, and its size in bytes.
+DTYPES = {
+    'uint8': ('toUint8', 1),
+    'int8': ('toInt8', 1),
+    'uint16': ('toUint16', 2),
+    'int16': ('toInt16', 2),
+    'uint32': ('toUint32', 4),
+    'int32': ('toInt32', 4),
+    'float32': ('toFloat', 4),
+    'float64': ('toDouble', 8),
+}
+
+# HTTP status codes of failures that may not happen again.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+# File in the folder of the tiles with the key of the download they belong to.
+TILES_MANIFEST = 'tiles.json'
+
+
+def pixel_grid(bounds, scale):
+    """Compute the pixel grid covering a bounding box, aligned on multiples of the scale.
+
+    Args:
+        bounds (list): The bounding box, [xmin, ymin, xmax, ymax], in the units of the projection.
+        scale (float): The pixel size in the units of the projection.
+
+    Returns:
+        tuple: The affine transform [scale, 0, x0, 0, -scale, y0] of the grid, its width and its height in pixels.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    x0 = math.floor(xmin / scale) * scale
+    y0 = math.ceil(ymax / scale) * scale
+    width = max(1, int(math.ceil(round((xmax - x0) / scale, 6))))
+    height = max(1, int(math.ceil(round((y0 - ymin) / scale, 6))))
+    return [scale, 0, x0, 0, -scale, y0], width, height
+
+
+def tile_windows(width, height, tile_size):
+    """Split a grid into tiles.
+
+    Args:
+        width (int): The width of the grid in pixels.
+        height (int): The height of the grid in pixels.
+        tile_size (int): The width and height of a tile in pixels.
+
+    Returns:
+        list: The tiles, as (column offset, row offset, width, height) tuples.
+    """
+    return [(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+            for row_off in range(0, height, tile_size)
+            for col_off in range(0, width, tile_size)]
+
+
+def max_tile_size(band_count, dtype, max_bytes=MAX_BYTES, block_size=512):
+    """Compute the largest tile size whose pixels fit in one request.
+
+    Args:
+        band_count (int): Number of bands.
+        dtype (str): The data type, one of DTYPES.
+        max_bytes (int, optional): Maximum size of the pixels of one request. Defaults to MAX_BYTES.
+        block_size (int, optional): The tile size is a multiple of the block size of the GeoTIFF. Defaults to 512.
+
+    Returns:
+        int: The width and height of a tile in pixels.
+    """
+    size = int(math.sqrt(max_bytes / float(band_count * DTYPES[dtype][1])))
+    return max(block_size, size // block_size * block_size)
+
+
+def download_file(url, out_file, session=None, retries=5, backoff=1.0, timeout=300, chunk_size=1024 * 1024):
+    """Stream a URL to a file, retrying transient failures with exponential backoff.
+
+    The content is written to a .part file, which is renamed once complete, so an existing out_file is always complete.
+
+    Args:
+        url (str): The URL.
+        out_file (str): The output file.
+        session (requests.Session, optional): The session, to reuse its connections. Defaults to a new session.
+        retries (int, optional): Number of times a failed download is retried. Defaults to 5.
+        backoff (float, optional): Time in seconds before the first retry. It doubles after each retry. Defaults to 1.
+        timeout (float, optional): Timeout in seconds of connecting and of each read. Defaults to 300.
+        chunk_size (int, optional): Size in bytes of the chunks written to disk. Defaults to 1 MB.
+    """
+    import requests
+
+    session = session or requests.Session()
+    part_file = out_file + '.part'
+    for attempt in range(retries + 1):
+        try:
+            with session.get(url, stream=True, timeout=timeout) as response:
+                if response.status_code in RETRY_STATUS:
+                    raise IOError('HTTP {} for {}'.format(response.status_code, url))
+                if response.status_code != 200:
+                    # e.g., a request larger than the limit, which fails again when retried
+                    raise ValueError('HTTP {} for {}: {}'.format(response.status_code, url, response.text[:500]))
+                size = 0
+                with open(part_file, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size):
+                        f.write(chunk)
+                        size += len(chunk)
+                expected = response.headers.get('Content-Length')
+                if expected is not None and int(expected) != size:
+                    raise IOError('Incomplete download of {}: {} of {} bytes'.format(url, size, expected))
+            os.replace(part_file, out_file)
+            return
+        except (IOError, requests.exceptions.RequestException):
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def tiles_key(image, transform, tiles, crs):
+    """Compute the key of the tiles of a download.
+
+    Args:
+        image (ee.Image): The image, cast to its data type.
+        transform (list): The affine transform of the grid, see pixel_grid().
+        tiles (list): The tiles, see tile_windows().
+        crs (str): The projection of the grid.
+
+    Returns:
+        str: The SHA-256 hex digest of the serialized image expression (with its data type), the grid and the tiles.
+    """
+    text = json.dumps({
+        'image': ee.serializer.encode(image, for_cloud_api=True),
+        'transform': transform,
+        'tiles': tiles,
+        'crs': crs,
+    }, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def discard_stale_tiles(tile_dir, key):
+    """Delete the tiles of another download from a folder, and save the key of the current download in it.
+
+    Args:
+        tile_dir (str): The folder of the downloaded tiles.
+        key (str): The key of the current download, see tiles_key().
+    """
+    manifest_file = os.path.join(tile_dir, TILES_MANIFEST)
+    try:
+        with open(manifest_file) as f:
+            if json.load(f).get('key') == key:
+                return
+    except (OSError, ValueError):
+        pass
+
+    stale = [name for name in os.listdir(tile_dir)
+             if name.startswith('tile_') and name.endswith(('.tif', '.tif.part'))]
+    for name in stale:
+        os.remove(os.path.join(tile_dir, name))
+    if stale:
+        print('Discarded {} tiles of another download in {}'.format(len(stale), tile_dir))
+    with open(manifest_file, 'w') as f:
+        json.dump({'key': key}, f)
+
+
+def download_tiles(image, transform, tiles, tile_dir, crs, max_workers=8, retries=5, backoff=1.0):
+    """Download the tiles of an image in parallel. Tiles already in tile_dir are not downloaded again, unless they
+    belong to another image, grid or data type.
+
+    Args:
+        image (ee.Image): The image, cast to its data type.
+        transform (list): The affine transform of the grid, see pixel_grid().
+        tiles (list): The tiles, see tile_windows().
+        tile_dir (str): The folder of the downloaded tiles.
+        crs (str): The projection of the grid, e.g., 'EPSG:4326'.
+        max_workers (int, optional): Number of tiles downloaded at the same time. Defaults to 8.
+        retries (int, optional): Number of times a failed tile is retried. Defaults to 5.
+        backoff (float, optional): Time in seconds before the first retry. It doubles after each retry. Defaults to 1.
+
+    Returns:
+        tuple: List of (tile, file path) tuples of the downloaded tiles, and list of (tile, error message) tuples of
+            the tiles that failed.
+    """
+    if not os.path.exists(tile_dir):
+        os.makedirs(tile_dir)
+    discard_stale_tiles(tile_dir, tiles_key(image, transform, tiles, crs))
+    session = ee_async.pooled_session(max_workers)
+    scale, _, x0, _, _, y0 = transform
+
+    def download_tile(tile):
+        col_off, row_off, width, height = tile
+        tile_file = os.path.join(tile_dir, 'tile_{}_{}.tif'.format(row_off, col_off))
+        if os.path.exists(tile_file):
+            return tile_file
+
+        params = {
+            'crs': crs,
+            'crs_transform': [scale, 0, x0 + col_off * scale, 0, -scale, y0 - row_off * scale],
+            'dimensions': [width, height],
+            'format': 'GEO_TIFF',
+        }
+        for attempt in range(retries + 1):
+            try:
+                # the URL of a failed download is requested again, in case it expired
+                url = image.getDownloadURL(params)
+                download_file(url, tile_file, session, retries=0)
+                return tile_file
+            except ValueError:
+                raise
+            except Exception as e:
+                if attempt == retries or isinstance(e, ee.EEException) and 'must be less than' in str(e):
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+
+    done = []
+    failed = []
+    with ThreadPoolExecutor(max_workers) as executor:
+        futures = [(tile, executor.submit(download_tile, tile)) for tile in tiles]
+        for index, (tile, future) in enumerate(futures):
+            try:
+                done.append((tile, future.result()))
+                print('Downloaded tile {}/{}'.format(index + 1, len(tiles)))
+            except Exception as e:
+                failed.append((tile, str(e)))
+                print('Tile {}/{} failed: {}'.format(index + 1, len(tiles), e))
+    return done, failed
+
+
+def overview_factors(width, height, block_size=512):
+    """Compute the overview levels of a GeoTIFF, down to a level fitting in one block.
+
+    Args:
+        width (int): The width of the GeoTIFF in pixels.
+        height (int): The height of the GeoTIFF in pixels.
+        block_size (int, optional): The block size of the GeoTIFF. Defaults to 512.
+
+    Returns:
+        list: The decimation factors, e.g., [2, 4, 8].
+    """
+    factors = []
+    factor = 2
+    while max(width, height) / float(factor // 2) > block_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def write_cog(tiles, out_file, width, height, transform, crs, dtype, band_count, nodata=None, resampling='average',
+              block_size=512, compress='DEFLATE'):
+    """Mosaic downloaded tiles into a Cloud-Optimized GeoTIFF, one block row of a tile at a time.
+
+    The tiles are copied into an uncompressed tiled GeoTIFF next to out_file, overviews are added to it, and it is
+    copied to out_file with compression, its overviews and its blocks in the order of a Cloud-Optimized GeoTIFF.
+
+    Args:
+        tiles (list): The (tile, file path) tuples of the downloaded tiles, see download_tiles().
+        out_file (str): The output GeoTIFF.
+        width (int): The width of the mosaic in pixels.
+        height (int): The height of the mosaic in pixels.
+        transform (list): The affine transform of the mosaic, see pixel_grid().
+        crs (str): The projection of the mosaic, e.g., 'EPSG:4326'.
+        dtype (str): The data type, one of DTYPES.
+        band_count (int): Number of bands.
+        nodata (float, optional): The value of pixels without data. Defaults to None.
+        resampling (str, optional): The resampling of the overviews, e.g., 'average' for continuous values or
+            'nearest' for classes. Defaults to 'average'.
+        block_size (int, optional): The block size of the GeoTIFF. Defaults to 512.
+        compress (str, optional): The compression of the GeoTIFF. Defaults to 'DEFLATE'.
+
+    Returns:
+        str: The output GeoTIFF, None if rasterio is not installed.
+    """
+    try:
+        import rasterio
+        from affine import Affine
+        from rasterio.enums import Resampling
+        from rasterio.shutil import copy as copy_raster
+        from rasterio.windows import Window
+    except ImportError:
+        print('Please install rasterio using the following command:\n')
+        print('pip install rasterio')
+        return None
+
+    profile = {
+        'driver': 'GTiff',
+        'width': width,
+        'height': height,
+        'count': band_count,
+        'dtype': dtype,
+        'crs': crs,
+        'transform': Affine(*transform),
+        'nodata': nodata,
+        'tiled': True,
+        'blockxsize': block_size,
+        'blockysize': block_size,
+        'BIGTIFF': 'IF_SAFER',
+    }
+    tmp_file = out_file + '.tmp.tif'
+    with rasterio.open(tmp_file, 'w', **profile) as dst:
+        for (col_off, row_off, tile_width, tile_height), tile_file in tiles:
+            with rasterio.open(tile_file) as src:
+                for row in range(0, tile_height, block_size):
+                    rows = min(block_size, tile_height - row)
+                    data = src.read(window=Window(0, row, tile_width, rows))
+                    dst.write(data, window=Window(col_off, row_off + row, tile_width, rows))
+
+    with rasterio.open(tmp_file, 'r+') as dst:
+        dst.build_overviews(overview_factors(width, height, block_size), getattr(Resampling, resampling))
+
+    copy_raster(tmp_file, out_file, driver='GTiff', tiled=True, blockxsize=block_size, blockysize=block_size,
+                compress=compress, copy_src_overviews=True, BIGTIFF='IF_SAFER')
+    os.remove(tmp_file)
+    return out_file
+
+
+def download_region(image, region, out_file, scale, crs='EPSG:4326', dtype='float32', bands=None, nodata=None,
+                    tile_size=None, max_bytes=MAX_BYTES, max_workers=8, retries=5, tile_dir=None, keep_tiles=False,
+                    resampling='average'):
+    """Download a region of an image tile by tile and mosaic the tiles into a Cloud-Optimized GeoTIFF.
+
+    Args:
+        image (ee.Image): The image.
+        region (ee.Geometry | ee.Feature | ee.FeatureCollection | list): The region, or its bounding box
+            [xmin, ymin, xmax, ymax] in degrees.
+        out_file (str): The output GeoTIFF.
+        scale (float): The pixel size in the units of crs, e.g., degrees for EPSG:4326.
+        crs (str, optional): The projection of the GeoTIFF. Defaults to 'EPSG:4326'.
+        dtype (str, optional): The data type the image is cast to, one of DTYPES. Defaults to 'float32'.
+        bands (list, optional): The bands to download. Defaults to None, i.e., all bands.
+        nodata (float, optional): The value of the pixels outside the region or masked. Defaults to None, i.e., 0.
+        tile_size (int, optional): The width and height of a tile in pixels. Defaults to None, i.e., the largest
+            tile fitting in max_bytes.
+        max_bytes (int, optional): Maximum size of the pixels of one request. Defaults to MAX_BYTES.
+        max_workers (int, optional): Number of tiles downloaded at the same time. Defaults to 8.
+        retries (int, optional): Number of times a failed tile is retried. Defaults to 5.
+        tile_dir (str, optional): The folder of the downloaded tiles. Defaults to out_file + '.tiles'.
+        keep_tiles (bool, optional): Whether to keep the tiles after the mosaic is written. Defaults to False.
+        resampling (str, optional): The resampling of the overviews. Defaults to 'average'.
+
+    Returns:
+        str: The output GeoTIFF, None if a tile failed. Run again to download the failed tiles only.
+    """
+    if dtype not in DTYPES:
+        raise ValueError('Unknown data type {}. It must be one of {}.'.format(dtype, ', '.join(DTYPES)))
+    if isinstance(region, (list, tuple)):
+        region = ee.Geometry.Rectangle(list(region), 'EPSG:4326', False)
+    elif not isinstance(region, ee.Geometry):
+        region = region.geometry()
+
+    image = ee.Image(image)
+    if bands is not None:
+        image = image.select(bands)
+    image = image.clip(region)
+    if nodata is not None:
+        image = image.unmask(nodata)
+    image = getattr(image, DTYPES[dtype][0])()
+
+    info = ee.Dictionary({
+        'bands': image.bandNames(),
+        'bounds': region.bounds(ee.ErrorMargin(1), ee.Projection(crs)).coordinates(),
+    }).getInfo()
+    xs = [x for x, _ in info['bounds'][0]]
+    ys = [y for _, y in info['bounds'][0]]
+    transform, width, height = pixel_grid([min(xs), min(ys), max(xs), max(ys)], scale)
+    band_count = len(info['bands'])
+    tile_size = tile_size or max_tile_size(band_count, dtype, max_bytes)
+    tiles = tile_windows(width, height, tile_size)
+    print('Downloading {} x {} pixels, {} bands, in {} tiles'.format(width, height, band_count, len(tiles)))
+
+    tile_dir = tile_dir or out_file + '.tiles'
+    done, failed = download_tiles(image, transform, tiles, tile_dir, crs, max_workers, retries)
+    if failed:
+        print('{} of {} tiles failed. Run again to download them, the other tiles are kept in {}'.format(
+            len(failed), len(tiles), tile_dir))
+        return None
+
+    if write_cog(done, out_file, width, height, transform, crs, dtype, band_count, nodata, resampling) is None:
+        return None
+    if not keep_tiles:
+        for _, tile_file in done:
+            os.remove(tile_file)
+        if os.listdir(tile_dir) == [TILES_MANIFEST]:
+            os.remove(os.path.join(tile_dir, TILES_MANIFEST))
+        if not os.listdir(tile_dir):
+            os.rmdir(tile_dir)
+    print('Saved {}'.format(out_file))
+    return out_file
+
+
+def find_call(node, function_name):
+    """Find the first call of an algorithm in a serialized expression.
+
+    Args:
+        node (object): The expression, or a part of it.
+        function_name (str): The algorithm, e.g., 'Image.reproject'.
+
+    Returns:
+        dict: The arguments of the call, None if not found.
+    """
+    if isinstance(node, dict):
+        if node.get('functionName') == function_name:
+            return node['arguments']
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        found = find_call(child, function_name)
+        if found is not None:
+            return found
+    return None
+
+
+def synthetic_tiff(request):
+    """Create the GeoTIFF of a getDownloadURL() request with synthetic pixels, for the stand-in server.
+
+    The value of each pixel is the sum of its column and row in the pixel grid of the projection, so the values of a
+    mosaic can be checked.
+
+    Args:
+        request (dict): The thumbnail request, with the expression of the download.
+
+    Returns:
+        bytes: The GeoTIFF.
+    """
+    import numpy as np
+    from affine import Affine
+    from rasterio.io import MemoryFile
+
+    expression = request['expression']
+    scale, _, x, _, _, y = find_call(expression, 'Image.reproject')['crsTransform']['constantValue']
+    bounds = find_call(expression, 'Image.clipToBoundsAndScale')['geometry']['functionInvocationValue']
+    _, _, width, height = bounds['arguments']['coordinates']['constantValue']
+    col = int(round(x / scale))
+    row = int(round(-y / scale))
+    data = np.add.outer(np.arange(row, row + height), np.arange(col, col + width)).astype('float32')
+    with MemoryFile() as memory_file:
+        with memory_file.open(driver='GTiff', width=width, height=height, count=1, dtype='float32',
+                              transform=Affine(scale, 0, x, 0, -scale, y), crs='EPSG:3857') as dst:
+            dst.write(data, 1)
+        return memory_file.read()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out_file', type=str, help="The output GeoTIFF")
+    parser.add_argument('--asset', type=str, default=None, help="The image asset ID")
+    parser.add_argument('--region', type=float, nargs=4, default=[-120, 34, -119, 35],
+                        help="The bounding box xmin ymin xmax ymax in degrees")
+    parser.add_argument('--scale', type=float, default=0.0002777777777777778,
+                        help="The pixel size in the units of crs")
+    parser.add_argument('--crs', type=str, default='EPSG:4326', help="The projection of the GeoTIFF")
+    parser.add_argument('--dtype', type=str, default='float32', help="The data type of the GeoTIFF")
+    parser.add_argument('--bands', type=str, nargs='*', default=None, help="The bands to download")
+    parser.add_argument('--tile_size', type=int, default=None, help="The width and height of a tile in pixels")
+    parser.add_argument('--max_workers', type=int, default=8, help="Number of tiles downloaded at the same time")
+    parser.add_argument('--project', type=str, default=None, help="The Google Cloud project")
+    parser.add_argument('--stand_in', action='store_true',
+                        help="Download synthetic pixels from a local stand-in server with random failures")
+    args = parser.parse_args()
+
+    if args.stand_in:
+        # a 3000 x 2000 pixels region in meters, answered by the stand-in server with synthetic pixels
+        xmin, ymin, xmax, ymax = 0, 0, 90000, 60000
+        bounds = [[[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax], [xmin, ymin]]]
+        server = ee_async.StandInServer(latency=0.05, compute=lambda request: {'bands': ['constant'], 'bounds': bounds},
+                                        pixels=synthetic_tiff, failure_rate=0.2).start()
+        server.initialize(args.max_workers)
+        download_region(ee.Image(0), ee.Geometry.Rectangle([xmin, ymin, xmax, ymax], 'EPSG:3857', False),
+                        args.out_file, 30, 'EPSG:3857', 'float32', tile_size=args.tile_size or 512,
+                        max_workers=args.max_workers)
+    else:
+        ee_async.initialize(args.max_workers, project=args.project)
+        download_region(ee.Image(args.asset), args.region, args.out_file, args.scale, args.crs, args.dtype,
+                        args.bands, tile_size=args.tile_size, max_workers=args.max_workers)
@@ -0,0 +1,367 @@
+''' Run many Earth Engine export tasks with a limit on the tasks in flight, retries and a resume manifest.
+
+Starting thousands of exports in a loop hits the server-side task limits, and running the loop again starts them all
+again. An ExportQueue starts the exports lazily, at most max_in_flight at a time, polls their status with exponential
+backoff, restarts exports failing with a transient error and saves the state of every export in a manifest, so a run
+that was interrupted only starts the exports that did not complete:
+
+    queue = ExportQueue('exports.json', max_in_flight=20)
+    for name in names:
+        queue.add(name, lambda name=name: ee.batch.Export.table(vectors(name), name, {'driveFolder': 'image'}))
+    queue.run()
+
+To simulate a large backfill against a local fake task service: python ee_export.py --fake 1000
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import json
+import time
+import random
+import argparse
+from collections import deque
+
+
+# Error messages of failures that may not happen again, e.g., when the server is busy.
+TRANSIENT_ERRORS = ['internal error', 'deadline exceeded', 'backend error', 'service unavailable', 'timed out',
+                    'try again', 'too many tasks', 'rate limit', 'quota exceeded']
+
+ACTIVE_STATES = ('READY', 'RUNNING', 'CANCEL_REQUESTED')
+
+# Task state of each state of an Earth Engine operation.
+OPERATION_STATES = {'PENDING': 'READY', 'RUNNING': 'RUNNING', 'CANCELLING': 'CANCEL_REQUESTED',
+                    'SUCCEEDED': 'COMPLETED', 'FAILED': 'FAILED', 'CANCELLED': 'CANCELLED'}
+
+
+def is_transient(message):
+    """Check whether an error message describes a transient failure.
+
+    Args:
+        message (str): The error message.
+
+    Returns:
+        bool: True if the message contains one of TRANSIENT_ERRORS.
+    """
+    message = (message or '').lower()
+    return any(error in message for error in TRANSIENT_ERRORS)
+
+
+class EETaskService(object):
+    """Start and poll export tasks on Earth Engine."""
+
+    def new_id(self):
+        import ee
+        return ee.data.newTaskId()[0]
+
+    def start(self, task, request_id):
+        """Start a task.
+
+        Args:
+            task (ee.batch.Task): The task.
+            request_id (str): The request ID of the task. Starting again with the same request ID does not start a
+                second task.
+
+        Returns:
+            str: The ID of the operation started, used to poll its status.
+        """
+        # only the request ID is set, the ee client sets the task ID from the operation it started
+        task._request_id = request_id
+        task.start()
+        return task.id
+
+    def status(self, task_ids):
+        """Get the state of tasks.
+
+        Args:
+            task_ids (list): The task IDs, as returned by start().
+
+        Returns:
+            dict: The status (a dict with state and error_message) of each task, keyed by task ID. Tasks that are not
+                in the operations of the project are left out.
+        """
+        import ee
+
+        if not task_ids:
+            return {}
+
+        # one paged request for all the operations of the project, instead of one request per task
+        task_ids = set(task_ids)
+        statuses = {}
+        for operation in ee.data.listOperations():
+            task_id = operation['name'].rsplit('/', 1)[-1]
+            if task_id in task_ids:
+                status = {'id': task_id, 'state': OPERATION_STATES.get(operation['metadata'].get('state'), 'UNKNOWN')}
+                if operation.get('done') and 'error' in operation:
+                    status['error_message'] = operation['error'].get('message')
+                statuses[task_id] = status
+        return statuses
+
+
+class FakeTaskService(object):
+    """A local stand-in for the Earth Engine task service.
+
+    Args:
+        polls (int, optional): Number of status requests before a task finishes. Defaults to 3.
+        failure_rate (float, optional): Probability that a task fails with a transient error. Defaults to 0.1.
+        max_tasks (int, optional): Maximum number of active tasks. Starting more fails with a 'Too many tasks' error,
+            like on Earth Engine. Defaults to 50.
+        seed (int, optional): Seed of the random failures. Defaults to 0.
+    """
+
+    def __init__(self, polls=3, failure_rate=0.1, max_tasks=50, seed=0):
+        self.polls = polls
+        self.failure_rate = failure_rate
+        self.max_tasks = max_tasks
+        self.random = random.Random(seed)
+        self.tasks = {}
+        self.operations = {}
+        self.count = 0
+        self.started = 0
+        self.requests = 0
+
+    def new_id(self):
+        self.count += 1
+        return 'FAKE{:08d}'.format(self.count)
+
+    def start(self, task, request_id):
+        self.requests += 1
+        if request_id in self.operations:
+            return self.operations[request_id]
+        active = sum(1 for fake in self.tasks.values() if fake['state'] in ACTIVE_STATES)
+        if active >= self.max_tasks:
+            raise RuntimeError('Too many tasks already in the queue ({}). Please wait for some of them to '
+                               'complete.'.format(self.max_tasks))
+        task_id = 'OP{:08d}'.format(len(self.tasks) + 1)
+        self.operations[request_id] = task_id
+        self.tasks[task_id] = {'state': 'READY', 'polls': self.polls, 'task': task}
+        self.started += 1
+        return task_id
+
+    def status(self, task_ids):
+        self.requests += 1
+        statuses = {}
+        for task_id in task_ids:
+            fake = self.tasks.get(task_id)
+            if fake is None:
+                statuses[task_id] = {'id': task_id, 'state': 'UNKNOWN'}
+                continue
+            if fake['state'] in ACTIVE_STATES:
+                fake['polls'] -= 1
+                if fake['polls'] <= 0:
+                    if self.random.random() < self.failure_rate:
+                        fake['state'] = 'FAILED'
+                        fake['error_message'] = 'Internal error.'
+                    else:
+                        fake['state'] = 'COMPLETED'
+                else:
+                    fake['state'] = 'RUNNING'
+            statuses[task_id] = {'id': task_id, 'state': fake['state'], 'error_message': fake.get('error_message')}
+        return statuses
+
+
+class ExportQueue(object):
+    """Start export tasks with a limit on the tasks in flight, and save their state in a manifest to resume later.
+
+    Args:
+        manifest_file (str): File path of the manifest.
+        service (object, optional): The task service. Defaults to EETaskService().
+        max_in_flight (int, optional): Maximum number of started tasks that have not finished. Defaults to 10.
+        max_retries (int, optional): Number of times an export failing with a transient error is started again, and
+            number of transient errors starting an export before it is marked as failed. Defaults to 3.
+        poll_interval (float, optional): Time in seconds between two status requests. It doubles while no task
+            changes its state. Defaults to 5.
+        max_poll_interval (float, optional): Maximum time in seconds between two status requests. Defaults to 120.
+        sleep (callable, optional): The function waiting between status requests. Defaults to time.sleep.
+    """
+
+    def __init__(self, manifest_file, service=None, max_in_flight=10, max_retries=3, poll_interval=5,
+                 max_poll_interval=120, sleep=time.sleep):
+        self.manifest_file = manifest_file
+        self.service = service or EETaskService()
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.sleep = sleep
+        self.exports = self.read_manifest()
+        self.tasks = {}
+        self.pending = deque()
+        self.in_flight = []
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file) as f:
+                return json.load(f).get('exports', {})
+        except ValueError:
+            print('The manifest {} is invalid. All exports will be started.'.format(self.manifest_file))
+            return {}
+
+    def write_manifest(self):
+        out_dir = os.path.dirname(self.manifest_file)
+        if out_dir and not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'exports': self.exports}, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
+
+    def add(self, name, make_task):
+        """Add an export. Exports completed in an earlier run are skipped, and exports still running are polled.
+
+        Args:
+            name (str): A unique name of the export, e.g., its file name.
+            make_task (callable): Returns the ee.batch.Task of the export. It is only called when the task is started.
+        """
+        entry = self.exports.setdefault(name, {'state': 'PENDING', 'request_id': None, 'task_id': None,
+                                               'attempts': 0, 'start_errors': 0})
+        self.tasks[name] = make_task
+        if entry['state'] == 'COMPLETED':
+            return
+        if entry['state'] in ACTIVE_STATES and entry.get('task_id'):
+            self.in_flight.append(name)
+            return
+        if entry['state'] in ('FAILED', 'CANCELLED'):
+            entry.update(state='PENDING', request_id=None, task_id=None, attempts=0, start_errors=0, error=None)
+        # a task saved as SUBMITTING keeps its request ID, so starting it again does not start a second task
+        self.pending.append(name)
+
+    def counts(self):
+        counts = {}
+        for name in self.tasks:
+            state = self.exports[name]['state']
+            counts[state] = counts.get(state, 0) + 1
+        return counts
+
+    def start_tasks(self):
+        """Start pending tasks until max_in_flight tasks are in flight.
+
+        The request IDs of the tasks about to start are saved in the manifest once, before the first one is started.
+
+        Returns:
+            bool: True if a task was started or failed.
+        """
+        names = list(self.pending)[:max(self.max_in_flight - len(self.in_flight), 0)]
+        if not names:
+            return False
+        for name in names:
+            entry = self.exports[name]
+            if not entry.get('request_id'):
+                entry['request_id'] = self.service.new_id()
+            entry['state'] = 'SUBMITTING'
+        self.write_manifest()
+
+        changed = False
+        for index, name in enumerate(names):
+            entry = self.exports[name]
+            try:
+                entry['task_id'] = self.service.start(self.tasks[name](), entry['request_id'])
+            except Exception as e:
+                entry['start_errors'] = entry.get('start_errors', 0) + 1
+                if is_transient(str(e)) and entry['start_errors'] <= self.max_retries:
+                    # e.g., the server-side task limit: wait for tasks in flight to finish, the request IDs are kept
+                    entry['error'] = str(e)
+                    for name in names[index:]:
+                        self.exports[name]['state'] = 'PENDING'
+                    break
+                entry.update(state='FAILED', error=str(e))
+                self.pending.popleft()
+                changed = True
+                continue
+            entry['state'] = 'READY'
+            entry['start_errors'] = 0
+            entry['attempts'] += 1
+            self.pending.popleft()
+            self.in_flight.append(name)
+            changed = True
+        return changed
+
+    def poll(self):
+        """Update the state of the tasks in flight.
+
+        Returns:
+            bool: True if a task changed its state.
+        """
+        statuses = self.service.status([self.exports[name]['task_id'] for name in self.in_flight])
+        changed = False
+        for name in list(self.in_flight):
+            entry = self.exports[name]
+            status = statuses.get(entry['task_id'], {})
+            state = status.get('state', 'UNKNOWN')
+            if state == entry['state']:
+                continue
+            changed = True
+            if state in ('READY', 'RUNNING', 'CANCEL_REQUESTED'):
+                entry['state'] = state
+                continue
+
+            self.in_flight.remove(name)
+            message = status.get('error_message')
+            if state == 'UNKNOWN':
+                # not started after all, start it again with the same request ID
+                entry.update(state='PENDING', task_id=None)
+                self.pending.appendleft(name)
+            elif state == 'FAILED' and is_transient(message) and entry['attempts'] <= self.max_retries:
+                # a new request ID, starting again with the same one returns the failed task
+                entry.update(state='PENDING', request_id=None, task_id=None, error=message)
+                self.pending.append(name)
+            else:
+                entry.update(state=state, error=message)
+        return changed
+
+    def run(self):
+        """Start all exports and wait until they have finished.
+
+        Returns:
+            dict: Number of exports in each state, e.g., {'COMPLETED': 980, 'FAILED': 20}.
+        """
+        interval = self.poll_interval
+        while self.pending or self.in_flight:
+            changed = self.start_tasks()
+            if not self.in_flight and not self.pending:
+                break
+
+            self.sleep(interval)
+            changed = self.poll() or changed
+            # once per polling round, the request IDs of new tasks are saved by start_tasks() before they start
+            self.write_manifest()
+            if changed:
+                interval = self.poll_interval
+                print('Exports: {}'.format(', '.join('{} {}'.format(count, state.lower())
+                                                     for state, count in sorted(self.counts().items()))))
+            else:
+                interval = min(interval * 2, self.max_poll_interval)
+
+        self.write_manifest()
+        counts = self.counts()
+        failed = [name for name in self.tasks if self.exports[name]['state'] != 'COMPLETED']
+        print('{} of {} exports completed. Manifest saved at: {}'.format(counts.get('COMPLETED', 0), len(self.tasks),
+                                                                        self.manifest_file))
+        for name in failed[:20]:
+            print('  {}: {} {}'.format(name, self.exports[name]['state'], self.exports[name].get('error') or ''))
+        return counts
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fake', type=int, default=1000, help="Number of exports to simulate")
+    parser.add_argument('--manifest', type=str, default='fake_exports.json', help="File path of the manifest")
+    parser.add_argument('--max_in_flight', type=int, default=20, help="Maximum number of tasks in flight")
+    parser.add_argument('--max_tasks', type=int, default=50, help="Server-side limit of active tasks")
+    parser.add_argument('--failure_rate', type=float, default=0.1, help="Probability of a transient task failure")
+    args = parser.parse_args()
+
+    service = FakeTaskService(failure_rate=args.failure_rate, max_tasks=args.max_tasks)
+    queue = ExportQueue(args.manifest, service, max_in_flight=args.max_in_flight, poll_interval=0,
+                        sleep=lambda seconds: None)
+    for i in range(args.fake):
+        name = 'export_{:05d}'.format(i)
+        queue.add(name, lambda name=name: {'description': name})
+    queue.run()
+    print('{} tasks started with {} requests to the task service'.format(service.started, service.requests))
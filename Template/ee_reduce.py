@@ -0,0 +1,345 @@
+''' Reduce an image over a large region tile by tile, at full resolution.
+
+A single reduceRegion() over a large region either fails with 'Too many pixels' or 'Computation timed out', or needs
+bestEffort, which silently coarsens the scale. reduce_region_tiled() splits the region into a grid of tiles, reduces
+the tiles concurrently and merges the results on the client. The tiles are cells of the pixel grid of the reduction, so
+every pixel is in exactly one tile, and each tile returns mergeable partial results (sums, weights, means, variances,
+counts, minimums and maximums), so the merged statistics are the ones of the whole region.
+Means and variances are merged with the parallel formula of Chan et al., which does not lose precision like a sum of
+squares minus a squared mean. A tile failing because it is too large is split into four smaller tiles.
+
+    stats = reduce_region_tiled(nlDiff, region, ['mean', 'stdDev'], scale=1000, group_band='Land_Cover_Type_1')
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import ee
+
+
+# The partial results needed by each statistic.
+STATS = {
+    'sum': ['sum'],
+    'count': ['count'],
+    'mean': ['weight', 'mean'],
+    'stdDev': ['weight', 'mean', 'variance'],
+    'min': ['min'],
+    'max': ['max'],
+}
+
+# Error messages of tiles that are too large to be reduced in one request.
+SPLIT_ERRORS = ['too many pixels', 'timed out', 'memory limit', 'capacity exceeded']
+
+
+def snap_bounds(bounds, transform):
+    """Extend a bounding box to the edges of the pixels of a projection.
+
+    Args:
+        bounds (list): The bounding box in the units of the projection, [xmin, ymin, xmax, ymax].
+        transform (list): The affine transform of the projection, [xScale, xShearing, xTranslation, yShearing, yScale,
+            yTranslation].
+
+    Returns:
+        list: The bounding box, extended by one more pixel on each side to absorb the error of the bounds.
+    """
+    xmin, ymin, xmax, ymax = bounds
+    width, height = abs(transform[0]), abs(transform[4])
+    x0, y0 = transform[2], transform[5]
+    return [x0 + (math.floor((xmin - x0) / width) - 1) * width, y0 + (math.floor((ymin - y0) / height) - 1) * height,
+            x0 + (math.ceil((xmax - x0) / width) + 1) * width, y0 + (math.ceil((ymax - y0) / height) + 1) * height]
+
+
+def tile_grid(bounds, cols, rows, pixel_size):
+    """Split a bounding box into a grid of tiles whose edges are edges of pixels.
+
+    Args:
+        bounds (list): The bounding box, [xmin, ymin, xmax, ymax], on the edges of the pixels, see snap_bounds().
+        cols (int): Number of columns.
+        rows (int): Number of rows.
+        pixel_size (tuple): The width and height of a pixel.
+
+    Returns:
+        list: The bounding boxes of the tiles, row by row. Neighbouring tiles share the same edge coordinates, and
+            the tiles narrower than a pixel are left out.
+    """
+    def edges(start, end, count, size):
+        pixels = int(round((end - start) / size))
+        return [start + size * (pixels * index // count) for index in range(count + 1)]
+
+    xs = edges(bounds[0], bounds[2], cols, pixel_size[0])
+    ys = edges(bounds[1], bounds[3], rows, pixel_size[1])
+    tiles = []
+    for row in range(rows):
+        for col in range(cols):
+            if xs[col] < xs[col + 1] and ys[row] < ys[row + 1]:
+                tiles.append([xs[col], ys[row], xs[col + 1], ys[row + 1]])
+    return tiles
+
+
+def partial_reducer(band_count, parts, grouped=False):
+    """Create the reducer computing the partial results of a tile.
+
+    Args:
+        band_count (int): Number of bands reduced.
+        parts (list): The partial results, e.g., ['weight', 'mean'].
+        grouped (bool, optional): Whether the last input is the group band. Defaults to False.
+
+    Returns:
+        ee.Reducer: The reducer. Its outputs are named 'p<band index>_<part>', and its inputs are the inputs of each
+            part, one after another.
+    """
+    reducers = {
+        'sum': ee.Reducer.sum(),
+        'weight': ee.Reducer.sum(),
+        'mean': ee.Reducer.mean(),
+        'variance': ee.Reducer.variance(),
+        'count': ee.Reducer.count().unweighted(),
+        'min': ee.Reducer.min(),
+        'max': ee.Reducer.max(),
+    }
+    reducer = None
+    for part in parts:
+        names = ['p{}_{}'.format(index, part) for index in range(band_count)]
+        part_reducer = reducers[part].forEach(names)
+        reducer = part_reducer if reducer is None else reducer.combine(part_reducer, sharedInputs=False)
+    if grouped:
+        reducer = reducer.group(groupField=band_count * len(parts), groupName='group')
+    return reducer
+
+
+def partial_image(image, parts, group_band=None):
+    """Create the inputs of partial_reducer().
+
+    Args:
+        image (ee.Image): The bands reduced.
+        parts (list): The partial results, e.g., ['weight', 'mean'].
+        group_band (ee.Image, optional): The group band. Defaults to None.
+
+    Returns:
+        ee.Image: The inputs of each part, one after another, then the group band.
+    """
+    inputs = {
+        'sum': image,
+        # a band of ones with the mask of each band, its weighted sum is the sum of the weights of the pixels
+        'weight': image.multiply(0).add(1).toDouble(),
+        'mean': image.toDouble(),
+        'variance': image.toDouble(),
+        'count': image,
+        'min': image,
+        'max': image,
+    }
+    bands = [inputs[part] for part in parts]
+    if group_band is not None:
+        bands.append(group_band)
+    return ee.Image.cat(bands)
+
+
+def merge_moments(a, b):
+    """Merge the weights, means and sums of squared deviations from the mean of two sets of pixels.
+
+    Args:
+        a (tuple): The weight, mean and sum of squared deviations (M2) of the first set.
+        b (tuple): The weight, mean and M2 of the second set.
+
+    Returns:
+        tuple: The weight, mean and M2 of both sets, with the parallel formula of Chan et al.
+    """
+    weight_a, mean_a, m2_a = a
+    weight_b, mean_b, m2_b = b
+    weight = weight_a + weight_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * weight_b / weight
+    m2 = m2_a + m2_b + delta * delta * weight_a * weight_b / weight
+    return weight, mean, m2
+
+
+def merge_partials(partials, band_count, parts):
+    """Merge the partial results of several tiles.
+
+    Args:
+        partials (list): The partial results of each tile, dicts keyed by output name of partial_reducer().
+        band_count (int): Number of bands reduced.
+        parts (list): The partial results, e.g., ['weight', 'mean'].
+
+    Returns:
+        dict: The merged partial results, keyed by (band index, part). The weight, mean and variance of a tile are
+            merged into (band index, 'moments'), a (weight, mean, M2) tuple.
+    """
+    merged = {}
+    for partial in partials:
+        for index in range(band_count):
+            if 'mean' in parts:
+                weight = partial.get('p{}_weight'.format(index))
+                mean = partial.get('p{}_mean'.format(index))
+                if weight and mean is not None:
+                    variance = partial.get('p{}_variance'.format(index)) or 0.0
+                    moments = (weight, mean, variance * weight)
+                    key = (index, 'moments')
+                    merged[key] = moments if key not in merged else merge_moments(merged[key], moments)
+
+            for part in parts:
+                if part in ('weight', 'mean', 'variance'):
+                    continue
+                value = partial.get('p{}_{}'.format(index, part))
+                if value is None:  # no pixels in the tile
+                    continue
+                key = (index, part)
+                if key not in merged:
+                    merged[key] = value
+                elif part == 'min':
+                    merged[key] = min(merged[key], value)
+                elif part == 'max':
+                    merged[key] = max(merged[key], value)
+                else:
+                    merged[key] += value
+    return merged
+
+
+def finalize(merged, index, stat):
+    """Compute a statistic of a band from the merged partial results.
+
+    Args:
+        merged (dict): The merged partial results, see merge_partials().
+        index (int): The band index.
+        stat (str): The statistic, one of STATS.
+
+    Returns:
+        float: The statistic, None if there are no pixels.
+    """
+    if stat == 'count':
+        return merged.get((index, 'count'), 0)
+    if stat in ('sum', 'min', 'max'):
+        return merged.get((index, stat))
+
+    moments = merged.get((index, 'moments'))
+    if moments is None:
+        return None
+    weight, mean, m2 = moments
+    if stat == 'mean':
+        return mean
+    # the weighted population standard deviation, like ee.Reducer.stdDev()
+    return math.sqrt(max(m2 / weight, 0.0))
+
+
+def reduce_region_tiled(image, region, stats, scale, crs=None, group_band=None, group_name='group',
+                        tile_pixels=1e7, grid=None, max_pixels=1e9, max_workers=8, max_depth=3):
+    """Reduce an image over a large region tile by tile, and merge the results of the tiles exactly.
+
+    The tiles are half-open cells of the pixel grid of the reduction projection, i.e., crs at the given scale, and the
+    region is clipped to each tile in that projection without error margin. A pixel is thus entirely inside one tile:
+    weighted statistics (sum, mean and stdDev) weight it by the part of the pixel inside the region, like a single
+    reduceRegion(), and count, min and max use it in the one tile containing its center.
+
+    Args:
+        image (ee.Image): The image.
+        region (ee.Geometry | ee.Feature | ee.FeatureCollection): The region.
+        stats (str | list): The statistics, e.g., 'mean' or ['mean', 'stdDev']. See STATS.
+        scale (float): The scale in meters.
+        crs (str, optional): The projection of the reduction, e.g., 'EPSG:5070'. Defaults to None, i.e., the projection
+            of the first band.
+        group_band (str | int, optional): Name or index of the band of integer group codes. Defaults to None, i.e.,
+            no grouping.
+        group_name (str, optional): The key of the group code in the groups. Defaults to 'group'.
+        tile_pixels (float, optional): Approximate number of pixels per tile, used to choose the grid. Defaults to 1e7.
+        grid (tuple, optional): Number of columns and rows of the grid. Defaults to None, i.e., chosen from
+            tile_pixels and the area of the region.
+        max_pixels (float, optional): maxPixels of the reduction of a tile. Defaults to 1e9.
+        max_workers (int, optional): Number of tiles reduced at the same time. Defaults to 8.
+        max_depth (int, optional): Number of times a tile too large to be reduced is split into four tiles.
+            Defaults to 3.
+
+    Returns:
+        dict: The statistics, like reduceRegion().getInfo(). The keys are the band names for one statistic, and
+            '<band>_<stat>' otherwise. With a group band: {'groups': [...]} with one dict per group code, with the
+            keys of the statistics (the statistic names for a single band) and group_name.
+    """
+    if isinstance(stats, str):
+        stats = [stats]
+    for stat in stats:
+        if stat not in STATS:
+            raise ValueError('Unknown statistic {}. It must be one of {}.'.format(stat, ', '.join(STATS)))
+    parts = [part for part in ['sum', 'weight', 'mean', 'variance', 'count', 'min', 'max']
+             if any(part in STATS[stat] for stat in stats)]
+
+    if not isinstance(region, ee.Geometry):
+        region = region.geometry()
+    band_names = image.bandNames()
+    groups = None
+    if group_band is not None:
+        groups = image.select([group_band])
+        band_names = band_names.remove(groups.bandNames().get(0))
+    values = image.select(band_names)
+
+    # the projection reduceRegion() works in for this crs and scale
+    proj = (values.select(0).projection() if crs is None else ee.Projection(crs)).atScale(scale)
+
+    info = ee.Dictionary({
+        'bands': band_names,
+        'projection': proj,
+        'bounds': region.bounds(ee.ErrorMargin(1), proj).coordinates(),
+        'area': region.area(ee.ErrorMargin(1)),
+    }).getInfo()
+    names = info['bands']
+    transform = info['projection']['transform']
+    pixel_size = (abs(transform[0]), abs(transform[4]))
+    xs = [x for x, _ in info['bounds'][0]]
+    ys = [y for _, y in info['bounds'][0]]
+    bounds = snap_bounds([min(xs), min(ys), max(xs), max(ys)], transform)
+    if grid is None:
+        count = max(1, int(math.ceil(info['area'] / (scale * scale) / tile_pixels)))
+        cols = int(math.ceil(math.sqrt(count)))
+        grid = (cols, int(math.ceil(count / float(cols))))
+
+    reducer = partial_reducer(len(names), parts, groups is not None)
+    inputs = partial_image(values, parts, groups)
+
+    def reduce_tile(box, depth=0):
+        tile = ee.Geometry.Rectangle(box, proj, False)
+        try:
+            return [inputs.reduceRegion(reducer=reducer, geometry=region.intersection(tile, ee.ErrorMargin(0), proj),
+                                        crs=proj, maxPixels=max_pixels).getInfo()]
+        except ee.EEException as e:
+            if depth >= max_depth or not any(error in str(e).lower() for error in SPLIT_ERRORS):
+                raise
+            results = []
+            for sub_box in tile_grid(box, 2, 2, pixel_size):
+                results.extend(reduce_tile(sub_box, depth + 1))
+            return results
+
+    tiles = tile_grid(bounds, grid[0], grid[1], pixel_size)
+    partials = []
+    with ThreadPoolExecutor(max_workers) as executor:
+        for results in executor.map(reduce_tile, tiles):
+            partials.extend(results)
+
+    def statistics(merged):
+        result = {}
+        for index, name in enumerate(names):
+            for stat in stats:
+                if groups is None and len(stats) == 1:
+                    key = name
+                elif groups is not None and len(names) == 1:
+                    key = stat
+                else:
+                    key = '{}_{}'.format(name, stat)
+                result[key] = finalize(merged, index, stat)
+        return result
+
+    if groups is None:
+        return statistics(merge_partials(partials, len(names), parts))
+
+    by_group = {}
+    for partial in partials:
+        for group in partial.get('groups', []):
+            by_group.setdefault(group['group'], []).append(group)
+    output = []
+    for code in sorted(by_group):
+        merged = merge_partials(by_group[code], len(names), parts)
+        group = statistics(merged)
+        group[group_name] = code
+        output.append(group)
+    return {'groups': output}
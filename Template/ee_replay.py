@@ -0,0 +1,468 @@
+''' Record the Earth Engine requests of the notebooks and replay them offline.
+
+The ee client sends every request (the discovery document, the list of algorithms, getInfo(), getMapId(), ...) through
+an httplib2-like HTTP transport. In record mode the transport sends the requests to Earth Engine and saves the
+responses in a cassette folder. In replay mode it answers from the cassette without network access or credentials,
+optionally waiting as long as the recorded request took, so notebooks run deterministically in CI and the execution
+harnesses can be benchmarked. Requests are keyed by method, URL and the normalized serialized expression, without
+the request IDs of exports.
+
+To record the requests of a script or a folder of notebooks: python ee_replay.py record ../Image
+To run them offline: python ee_replay.py replay ../Image [--latency recorded]
+To use replay mode with the kernel pool, e.g., in build_gallery.py: EE_REPLAY=replay python build_gallery.py
+
+Note that map tiles and thumbnails are fetched by the browser or by other packages, not through the ee client, so
+they are not recorded.
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl
+
+
+CASSETTE_DIR = '.ee_cassettes'
+
+# Project used when replaying, so that ee.Initialize() does not need credentials.
+REPLAY_PROJECT = 'ee-replay'
+
+# Only requests to these hosts are recorded. Credential refreshes go through the same transport and are not.
+EE_HOSTS = ('earthengine.googleapis.com', 'earthengine-highvolume.googleapis.com')
+
+# Query parameters that carry credentials and are neither saved nor part of the key.
+SECRET_PARAMS = ('key', 'access_token')
+
+# The user project in the URL differs between users, e.g., projects/my-project/value:compute.
+# Asset paths such as projects/earthengine-public/assets/... are kept.
+USER_PROJECT = re.compile(r'/projects/[^/]+/(?!assets(/|$))')
+
+# Body fields that are new for each run of the same request, e.g., the request ID of an export. They are not part of
+# the key, and their recorded values are replaced by the new ones in the replayed responses.
+REQUEST_ID_FIELDS = ('requestId',)
+
+_cassette = None
+
+
+def normalize_request(method, uri, body=None):
+    """Normalize a request to the parts that determine its response.
+
+    Args:
+        method (str): The HTTP method.
+        uri (str): The request URL.
+        body (str | bytes, optional): The request body, e.g., the serialized expression of getInfo(). Defaults to None.
+
+    Returns:
+        dict: The method, the URL without the user project and the query, the sorted query parameters without
+            credentials and the body. A JSON body is parsed, so the order of its keys does not matter, and its
+            REQUEST_ID_FIELDS are removed.
+    """
+    parts = urlsplit(uri)
+    path = USER_PROJECT.sub('/projects/{project}/', parts.path)
+    query = sorted([key, value] for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key not in SECRET_PARAMS)
+
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    if body:
+        try:
+            body = json.loads(body)
+        except ValueError:
+            pass
+        else:
+            pop_request_ids(body)
+
+    return {
+        'method': method.upper(),
+        'url': '{}://{}{}'.format(parts.scheme, parts.netloc, path),
+        'query': query,
+        'body': body or None,
+    }
+
+
+def pop_request_ids(value, request_ids=None):
+    """Remove the REQUEST_ID_FIELDS from a parsed JSON body, at any depth.
+
+    Args:
+        value (object): The parsed body. It is modified.
+        request_ids (list, optional): The list the removed values are appended to. Defaults to None.
+
+    Returns:
+        list: The removed values, in the order of the body.
+    """
+    if request_ids is None:
+        request_ids = []
+    if isinstance(value, dict):
+        for key in sorted(value):
+            if key in REQUEST_ID_FIELDS:
+                request_ids.append(value.pop(key))
+            else:
+                pop_request_ids(value[key], request_ids)
+    elif isinstance(value, list):
+        for item in value:
+            pop_request_ids(item, request_ids)
+    return request_ids
+
+
+def request_ids(body):
+    """Get the values of the REQUEST_ID_FIELDS of a request body.
+
+    Args:
+        body (str | bytes): The request body.
+
+    Returns:
+        list: The string values, in the order of the body. Empty if the body is not JSON.
+    """
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', errors='replace')
+    try:
+        values = pop_request_ids(json.loads(body)) if body else []
+    except ValueError:
+        return []
+    return [value for value in values if isinstance(value, str)]
+
+
+def request_key(request):
+    """Compute the key of a normalized request.
+
+    Args:
+        request (dict): The normalized request, see normalize_request().
+
+    Returns:
+        str: The SHA-256 hex digest of the request.
+    """
+    text = json.dumps(request, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class Cassette(object):
+    """Recorded Earth Engine responses, one JSON file per request in cassette_dir/<key[:2]>/<key>.json.
+
+    A request sent several times, e.g., the status of an export task, keeps the responses in order (a response
+    repeated right away is saved once with a 'repeat' count), and replaying it returns them in the same order, then
+    the last one again.
+
+    Args:
+        cassette_dir (str): The folder of the recorded responses.
+    """
+
+    def __init__(self, cassette_dir):
+        self.cassette_dir = cassette_dir
+        self.counts = {}  # number of times each request was sent since the last rewind
+
+    def path(self, key):
+        return os.path.join(self.cassette_dir, key[:2], key + '.json')
+
+    def rewind(self):
+        """Start again from the first response of each request, e.g., before the next notebook."""
+        self.counts.clear()
+
+    def next_index(self, key):
+        index = self.counts.get(key, 0)
+        self.counts[key] = index + 1
+        return index
+
+    def load(self, key):
+        try:
+            with open(self.path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def record(self, request, status, content_type, content, elapsed, request_ids=None):
+        """Save a response.
+
+        Args:
+            request (dict): The normalized request.
+            status (int): The HTTP status code.
+            content_type (str): The content type of the response.
+            content (bytes): The response body.
+            elapsed (float): The time in seconds the request took.
+            request_ids (list, optional): The request IDs removed from the request, see request_ids(). Defaults to
+                None.
+        """
+        key = request_key(request)
+        # the first time a request is sent, its earlier recording is replaced
+        entry = self.load(key) if self.next_index(key) > 0 else None
+        if entry is None:
+            entry = {'request': request, 'responses': []}
+
+        try:
+            body, encoding = content.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+        responses = entry['responses']
+        if responses and responses[-1]['status'] == status and responses[-1]['body'] == body:
+            # the same response again, e.g., the discovery document for each API resource
+            responses[-1]['repeat'] = responses[-1].get('repeat', 1) + 1
+        else:
+            responses.append({'status': status, 'content_type': content_type, 'encoding': encoding, 'body': body,
+                              'elapsed': round(elapsed, 4)})
+            if request_ids:
+                responses[-1]['request_ids'] = request_ids
+
+        out_file = self.path(key)
+        os.makedirs(os.path.dirname(out_file), exist_ok=True)
+        tmp_file = '{}.{}.tmp'.format(out_file, os.getpid())
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, out_file)
+
+    def play(self, request, request_ids=None):
+        """Get the next recorded response of a request.
+
+        Args:
+            request (dict): The normalized request.
+            request_ids (list, optional): The request IDs removed from the request. They replace the recorded ones
+                in the response body. Defaults to None.
+
+        Returns:
+            dict: The status, content_type, body (bytes) and elapsed time of the response, or None if the request
+                was not recorded.
+        """
+        key = request_key(request)
+        index = self.next_index(key)
+        entry = self.load(key)
+        if entry is None or not entry['responses']:
+            return None
+
+        for response in entry['responses']:
+            index -= response.get('repeat', 1)
+            if index < 0:
+                break
+        response = dict(response)
+        if response['encoding'] == 'base64':
+            response['body'] = base64.b64decode(response['body'])
+        else:
+            body = response['body']
+            for recorded, new in zip(response.get('request_ids', []), request_ids or []):
+                body = body.replace(recorded, new)
+            response['body'] = body.encode('utf-8')
+        return response
+
+
+def is_ee_request(uri):
+    return urlsplit(uri).hostname in EE_HOSTS
+
+
+def http_response(status, content_type):
+    import httplib2
+    return httplib2.Response({'status': status, 'content-type': content_type})
+
+
+class RecordingHttp(object):
+    """An HTTP transport for the ee client that sends requests to Earth Engine and records the responses.
+
+    Args:
+        cassette (Cassette): Where the responses are saved.
+        http (object, optional): The transport sending the requests. Defaults to the one of the ee client.
+    """
+
+    def __init__(self, cassette, http=None):
+        if http is None:
+            import requests
+            from ee import _cloud_api_utils
+            http = _cloud_api_utils._Http(requests.Session())
+        self.cassette = cassette
+        self.http = http
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None, **kwargs):
+        start = time.perf_counter()
+        response, content = self.http.request(uri, method, body=body, headers=headers, redirections=redirections,
+                                              connection_type=connection_type, **kwargs)
+        elapsed = time.perf_counter() - start
+
+        # transient errors are retried by the client, so they are not part of the recording
+        if is_ee_request(uri) and response.status < 500 and response.status != 429:
+            self.cassette.record(normalize_request(method, uri, body), response.status,
+                                 response.get('content-type', 'application/json'), content, elapsed,
+                                 request_ids(body))
+        return response, content
+
+
+class ReplayHttp(object):
+    """An HTTP transport for the ee client that answers requests from recorded responses.
+
+    Args:
+        cassette (Cassette): The recorded responses.
+        latency (float | str, optional): Time in seconds to wait before each response, or 'recorded' to wait as long
+            as the recorded request took. Defaults to None, i.e., no waiting.
+    """
+
+    def __init__(self, cassette, latency=None):
+        self.cassette = cassette
+        self.latency = latency
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5, connection_type=None, **kwargs):
+        request = normalize_request(method, uri, body)
+        response = self.cassette.play(request, request_ids(body))
+        if response is None:
+            # 404 is not retried, so the ee client raises an EEException with this message right away
+            message = 'No recorded response for {} {}. Record it with: python ee_replay.py record <notebook>'.format(
+                request['method'], request['url'])
+            content = json.dumps({'error': {'code': 404, 'message': message, 'status': 'NOT_FOUND'}})
+            return http_response(404, 'application/json'), content.encode('utf-8')
+
+        if self.latency == 'recorded':
+            time.sleep(response['elapsed'])
+        elif self.latency:
+            time.sleep(float(self.latency))
+        return http_response(response['status'], response['content_type']), response['body']
+
+
+def install(mode=None, cassette_dir=None, latency=None, project=None, wrapper=None):
+    """Initialize Earth Engine with a recording or replaying transport.
+
+    ee.Initialize() and ee.Authenticate() are replaced, so that the notebooks (and geemap) calling them keep the
+    transport. In replay mode no credentials are needed.
+
+    Args:
+        mode (str, optional): 'record' or 'replay'. Defaults to the EE_REPLAY environment variable, or 'replay'.
+        cassette_dir (str, optional): The folder of the recorded responses. Defaults to the EE_REPLAY_DIR environment
+            variable, or .ee_cassettes in the root folder of the repo.
+        latency (float | str, optional): Time in seconds to wait before each replayed response, or 'recorded'.
+            Defaults to the EE_REPLAY_LATENCY environment variable, or no waiting.
+        project (str, optional): The Google Cloud project used when recording. Defaults to the EE_REPLAY_PROJECT
+            environment variable, or the project of the credentials.
+        wrapper (callable, optional): Called with the transport, returns the transport to use instead, e.g., one
+            counting the requests (see ee_benchmark.py). Defaults to None.
+
+    Returns:
+        Cassette: The cassette.
+    """
+    global _cassette
+    import ee
+
+    mode = mode or os.environ.get('EE_REPLAY') or 'replay'
+    if mode not in ('record', 'replay'):
+        raise ValueError("mode must be 'record' or 'replay', not {!r}".format(mode))
+    if cassette_dir is None:
+        root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        cassette_dir = os.environ.get('EE_REPLAY_DIR') or os.path.join(root_dir, CASSETTE_DIR)
+    if latency is None:
+        latency = os.environ.get('EE_REPLAY_LATENCY') or None
+    if project is None:
+        project = os.environ.get('EE_REPLAY_PROJECT') or None
+
+    _cassette = Cassette(cassette_dir)
+    if mode == 'record':
+        kwargs = {'http_transport': RecordingHttp(_cassette), 'project': project}
+    else:
+        kwargs = {'credentials': None, 'http_transport': ReplayHttp(_cassette, latency), 'project': REPLAY_PROJECT}
+    if wrapper is not None:
+        kwargs['http_transport'] = wrapper(kwargs['http_transport'])
+
+    initialize = getattr(ee.Initialize, 'initialize', ee.Initialize)
+
+    def replay_initialize(*args, **unused_kwargs):
+        if not ee.data.is_initialized():
+            initialize(**kwargs)
+    replay_initialize.initialize = initialize
+
+    ee.data.reset()
+    initialize(**kwargs)
+    ee.Initialize = replay_initialize
+    if mode == 'replay':
+        ee.Authenticate = lambda *args, **kwargs: True
+    return _cassette
+
+
+def rewind():
+    """Start again from the first recorded response of each request."""
+    if _cassette is not None:
+        _cassette.rewind()
+
+
+def run_scripts(files):
+    """Run Python scripts one after another in this process, with Earth Engine already initialized by install().
+
+    Args:
+        files (list): The scripts.
+
+    Returns:
+        list: List of (script, error message or None, wall time in seconds) tuples.
+    """
+    import runpy
+
+    results = []
+    cwd = os.getcwd()
+    for in_file in files:
+        rewind()
+        start = time.perf_counter()
+        error = None
+        path = os.path.abspath(in_file)
+        try:
+            os.chdir(os.path.dirname(path))
+            runpy.run_path(path, run_name='__main__')
+        except BaseException as e:
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            lines = str(e).strip().splitlines()
+            error = '{}: {}'.format(type(e).__name__, lines[-1] if lines else '')
+        finally:
+            os.chdir(cwd)
+        results.append((in_file, error, time.perf_counter() - start))
+    return results
+
+
+def find_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(str(f) for f in sorted(Path(path).rglob('*.ipynb'))
+                         if not any(part.startswith('.') for part in f.relative_to(path).parts))
+        else:
+            files.append(path)
+    return files
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('mode', choices=['record', 'replay'], help="Record or replay Earth Engine requests")
+    parser.add_argument('paths', nargs='+', help="Python scripts, notebooks or folders of notebooks")
+    parser.add_argument('--cassette_dir', type=str, default=None,
+                        help="Folder of the recorded responses (defaults to .ee_cassettes in the repo)")
+    parser.add_argument('--latency', type=str, default=None,
+                        help="Seconds to wait before each replayed response, or 'recorded'")
+    parser.add_argument('--project', type=str, default=None, help="Google Cloud project used when recording")
+    parser.add_argument('--kernels', type=int, default=None, help="Number of kernels executing notebooks")
+    parser.add_argument('--timeout', type=int, default=600, help="Maximum time (in seconds) to execute a cell")
+    args = parser.parse_args()
+
+    files = find_files(args.paths)
+    scripts = [f for f in files if f.endswith('.py')]
+    notebooks = [f for f in files if f.endswith('.ipynb')]
+
+    results = []
+    if scripts:
+        install(args.mode, args.cassette_dir, args.latency, args.project)
+        results.extend(run_scripts(scripts))
+    if notebooks:
+        # the kernels install the transport themselves when EE_REPLAY is set, see kernel_pool.py
+        from kernel_pool import execute_notebooks
+        os.environ['EE_REPLAY'] = args.mode
+        if args.cassette_dir:
+            os.environ['EE_REPLAY_DIR'] = os.path.abspath(args.cassette_dir)
+        if args.latency:
+            os.environ['EE_REPLAY_LATENCY'] = args.latency
+        if args.project:
+            os.environ['EE_REPLAY_PROJECT'] = args.project
+        results.extend(execute_notebooks(notebooks, args.kernels, args.timeout))
+
+    failed = [(in_file, error) for in_file, error, _ in results if error is not None]
+    print('{} {} of {} files in {:.1f} s'.format('Recorded' if args.mode == 'record' else 'Replayed',
+                                                len(results) - len(failed), len(results),
+                                                sum(seconds for _, _, seconds in results)))
+    for in_file, error in failed:
+        print('  {}: {}'.format(in_file, error))
+    sys.exit(1 if failed else 0)
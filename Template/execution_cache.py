@@ -0,0 +1,237 @@
+''' Cache the outputs of executed Jupyter notebooks.
+
+Outputs are stored under a key computed from the ordered code-cell sources of the notebook and the kernel environment,
+so a notebook only needs to be executed again when one of its code cells or the environment changes.
+The least recently used entries are removed once the cache grows beyond its size limit. The size of the cache is
+tracked as entries are stored, so the folder is only scanned when it is over the limit.
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import sys
+import json
+import hashlib
+
+
+# Packages whose versions are part of the kernel environment.
+ENV_PACKAGES = ['earthengine-api', 'geemap', 'ipykernel']
+
+
+def kernel_env(kernel_name='python3', packages=ENV_PACKAGES):
+    """Describe the environment notebooks are executed in.
+
+    Args:
+        kernel_name (str, optional): Name of the kernel spec. Defaults to 'python3'.
+        packages (list, optional): Packages whose versions are included. Defaults to ENV_PACKAGES.
+
+    Returns:
+        str: The kernel name, the Python version, the versions of the given packages and the EE_REPLAY mode if set.
+    """
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+    except ImportError:
+        version = None
+
+    env = [kernel_name, sys.version.split()[0]]
+    for package in packages:
+        package_version = None
+        if version is not None:
+            try:
+                package_version = version(package)
+            except PackageNotFoundError:
+                pass
+        env.append('{}={}'.format(package, package_version))
+    if os.environ.get('EE_REPLAY'):
+        # outputs of replayed Earth Engine requests are kept apart from live ones (see ee_replay.py)
+        env.append('ee_replay={}'.format(os.environ['EE_REPLAY']))
+
+    return ' '.join(env)
+
+
+def code_cells(notebook):
+    """Return the code cells of a notebook.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+
+    Returns:
+        list: The code cells in order.
+    """
+    return [cell for cell in notebook['cells'] if cell['cell_type'] == 'code']
+
+
+def cell_source(cell):
+    source = cell['source']
+    if isinstance(source, list):
+        source = ''.join(source)
+    return source
+
+
+def notebook_key(notebook, env=''):
+    """Compute the cache key of a notebook.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+        env (str, optional): The kernel environment, see kernel_env(). Defaults to ''.
+
+    Returns:
+        str: The sha256 hex digest of the environment and the ordered code-cell sources.
+    """
+    digest = hashlib.sha256(env.encode('utf-8'))
+    for cell in code_cells(notebook):
+        source = cell_source(cell).encode('utf-8')
+        digest.update(str(len(source)).encode('ascii') + b'\n' + source)
+
+    return digest.hexdigest()
+
+
+def has_errors(notebook):
+    """Check whether any code cell of an executed notebook has an error output.
+
+    Args:
+        notebook (dict): The notebook in nbformat 4.
+
+    Returns:
+        bool: True if the notebook has an error output.
+    """
+    for cell in code_cells(notebook):
+        for output in cell.get('outputs', []):
+            if output.get('output_type') == 'error':
+                return True
+    return False
+
+
+class ExecutionCache(object):
+    """A folder of executed notebook outputs with size-bounded least recently used eviction.
+
+    Args:
+        cache_dir (str): The folder used to store the outputs.
+        max_size (int, optional): Maximum total size of the cache in bytes. Defaults to 500 MB.
+        env (str, optional): The kernel environment. Defaults to kernel_env().
+    """
+
+    def __init__(self, cache_dir, max_size=500 * 1024 * 1024, env=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self.env = kernel_env() if env is None else env
+        self.hits = 0
+        self.misses = 0
+        self.size = None  # total size of the folder, computed on the first write
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, notebook):
+        """Splice cached outputs into a notebook.
+
+        Args:
+            notebook (dict): The notebook in nbformat 4. Its code cells are updated in place on a cache hit.
+
+        Returns:
+            bool: True on a cache hit.
+        """
+        cache_file = self.path(notebook_key(notebook, self.env))
+        try:
+            with open(cache_file, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return False
+
+        cells = code_cells(notebook)
+        if len(cells) != len(cached['cells']):
+            self.misses += 1
+            return False
+
+        for cell, entry in zip(cells, cached['cells']):
+            cell['outputs'] = entry['outputs']
+            cell['execution_count'] = entry['execution_count']
+            if entry.get('performance'):
+                cell.setdefault('metadata', {})['performance'] = entry['performance']
+
+        os.utime(cache_file)  # mark as recently used
+        self.hits += 1
+        return True
+
+    def put(self, notebook):
+        """Store the outputs of an executed notebook. Notebooks with error outputs are not stored.
+
+        Args:
+            notebook (dict): The executed notebook in nbformat 4.
+
+        Returns:
+            bool: True if the outputs were stored.
+        """
+        if has_errors(notebook):
+            return False
+
+        cached = {
+            'env': self.env,
+            'cells': [{'outputs': cell.get('outputs', []), 'execution_count': cell.get('execution_count'),
+                       'performance': cell.get('metadata', {}).get('performance')}
+                      for cell in code_cells(notebook)]
+        }
+
+        cache_file = self.path(notebook_key(notebook, self.env))
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        old_size = os.path.getsize(cache_file) if os.path.exists(cache_file) else 0
+        tmp_file = cache_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cached, f)
+        os.replace(tmp_file, cache_file)
+
+        if self.size is None:
+            self.size = sum(entry[1] for entry in self.entries())
+        else:
+            self.size += os.path.getsize(cache_file) - old_size
+        if self.size > self.max_size:
+            self.evict()
+        return True
+
+    def entries(self):
+        """List the cache entries.
+
+        Returns:
+            list: List of (last used time, size, path) tuples.
+        """
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    cache_file = os.path.join(root, name)
+                    try:
+                        stat = os.stat(cache_file)
+                    except FileNotFoundError:  # removed by another process
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, cache_file))
+
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in 90% of max_size.
+
+        Returns:
+            int: Number of removed entries.
+        """
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for _, entry_size, cache_file in entries:
+            # below the limit, so that the next entries stored do not scan the folder again right away
+            if size <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(cache_file)
+                removed += 1
+            except FileNotFoundError:  # removed by another process
+                pass
+            size -= entry_size
+
+        self.size = size
+        return removed
@@ -0,0 +1,397 @@
+''' Execute Jupyter notebooks concurrently in a pool of warm kernels.
+
+Each kernel is started once, imports ee and geemap and initializes Earth Engine, then executes notebooks one after
+another. The user namespace is reset between notebooks, so only the imported modules are shared.
+The wall time, peak RSS and number of Earth Engine requests of each code cell are saved in its 'performance' metadata
+(see performance_report.py).
+With the EE_REPLAY environment variable set to 'record' or 'replay', the Earth Engine requests are recorded or replayed
+offline (see ee_replay.py).
+
+To execute all notebooks in a folder: execute_notebooks(files, kernels=4)
+To execute one notebook in a new kernel, like jupyter nbconvert --execute --inplace: execute_notebook(in_file)
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import re
+import ast
+import json
+import time
+import asyncio
+import importlib.util
+from pathlib import Path
+
+
+# Runs once when a kernel is started.
+WARMUP_CODE = '''
+try:
+    import ee
+    import geemap
+    ee.Initialize()
+except Exception as e:
+    print(e)
+'''
+
+# Runs before WARMUP_CODE if the EE_REPLAY environment variable is set to 'record' or 'replay': Earth Engine requests
+# are then recorded or answered from recorded responses (see ee_replay.py).
+REPLAY_CODE = '''
+import sys
+sys.path.insert(0, {path!r})
+import ee_replay
+ee_replay.install()
+'''
+
+# Runs before each notebook: clears the variables left by the previous notebook, starts a new history session so the
+# cells are numbered from 1, and changes to the notebook folder. It runs without storing history, so it does not count
+# as a cell itself.
+RESET_CODE = '''
+get_ipython().reset(new_session=True)
+try:
+    import ee
+    import geemap
+except ImportError:
+    pass
+__import__('os').chdir({path!r})
+if 'ee_replay' in __import__('sys').modules:
+    __import__('ee_replay').rewind()
+'''
+
+# Runs once when a kernel is started if cells are profiled. The hooks live in a module so that '%reset' keeps them.
+PROFILE_CODE = """
+import sys, types
+_module = types.ModuleType('_cell_profile')
+exec(compile({source!r}, '_cell_profile', 'exec'), _module.__dict__)
+sys.modules['_cell_profile'] = _module
+_module.install(get_ipython())
+del _module
+"""
+
+PROFILE_SOURCE = '''
+import sys
+import json
+import time
+
+stats = {}
+ee_calls = [0]
+
+
+def read_rss():
+    # current and peak resident set size in MB
+    rss = peak = None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) / 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return rss, peak
+
+
+def count_calls(function):
+    def wrapper(*args, **kwargs):
+        ee_calls[0] += 1
+        return function(*args, **kwargs)
+    wrapper.counted = True
+    return wrapper
+
+
+def patch_ee():
+    # every request to the Earth Engine servers goes through one of these functions
+    ee = sys.modules.get('ee')
+    if ee is None:
+        return
+    for name in ['_execute_cloud_call', 'send_']:
+        function = getattr(ee.data, name, None)
+        if function is not None and not getattr(function, 'counted', False):
+            setattr(ee.data, name, count_calls(function))
+
+
+def pre_run_cell(*args):
+    patch_ee()
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')  # reset the peak resident set size
+    except OSError:
+        pass
+    stats.clear()
+    ee_calls[0] = 0
+    stats['start'] = time.perf_counter()
+
+
+def post_run_cell(*args):
+    patch_ee()
+    if 'start' not in stats:
+        return
+    rss, peak = read_rss()
+    stats['wall_time'] = round(time.perf_counter() - stats.pop('start'), 4)
+    stats['peak_rss_mb'] = round(peak, 1) if peak is not None else None
+    stats['ee_calls'] = ee_calls[0]
+
+
+def report():
+    return json.dumps(stats)
+
+
+def install(ip):
+    ip.events.register('pre_run_cell', pre_run_cell)
+    ip.events.register('post_run_cell', post_run_cell)
+'''
+
+
+async def install_profile(kc, timeout=60):
+    """Install the hooks recording the performance of each cell in a kernel (see PROFILE_SOURCE).
+
+    Args:
+        kc (jupyter_client.AsyncKernelClient): The kernel client.
+        timeout (int, optional): Maximum time (in seconds) to install the hooks. Defaults to 60.
+    """
+    await kc.execute_interactive(PROFILE_CODE.format(source=PROFILE_SOURCE), timeout=timeout,
+                                 output_hook=lambda msg: None)
+
+
+async def cell_stats(kc):
+    """Read the performance of the last cell executed in a kernel with the hooks of install_profile().
+
+    Args:
+        kc (jupyter_client.AsyncKernelClient): The kernel client.
+
+    Returns:
+        dict: The wall_time, peak_rss_mb and ee_calls of the cell, or None if they are not available.
+    """
+    # a silent request does not trigger the cell hooks, so it does not change the stats of the last cell
+    reply = await kc.execute_interactive('', silent=True, store_history=False, timeout=60,
+                                         user_expressions={'stats': "__import__('_cell_profile').report()"},
+                                         output_hook=lambda msg: None)
+    result = reply['content'].get('user_expressions', {}).get('stats', {})
+    if result.get('status') != 'ok':
+        return None
+    return json.loads(ast.literal_eval(result['data']['text/plain']))
+
+
+def profile_hooks(client, install=True):
+    """Set the hooks of a NotebookClient that record the performance of each code cell in its 'performance' metadata.
+
+    Args:
+        client (nbclient.NotebookClient): The notebook client.
+        install (bool, optional): Whether to install the hooks in the kernel when it is started. Defaults to True. Use
+            False for a kernel where install_profile() already ran.
+    """
+    async def on_notebook_start(notebook):
+        await install_profile(client.kc)
+
+    async def on_cell_executed(cell, cell_index, execute_reply):
+        stats = await cell_stats(client.kc)
+        if stats:
+            cell.metadata['performance'] = stats
+
+    if install:
+        client.on_notebook_start = on_notebook_start
+    client.on_cell_executed = on_cell_executed
+
+
+class KernelPool(object):
+    """A pool of pre-started Jupyter kernels with ee and geemap already imported.
+
+    Args:
+        size (int, optional): Number of kernels. Defaults to the number of CPUs.
+        kernel_name (str, optional): Name of the kernel spec. Defaults to 'python3'.
+        timeout (int, optional): Maximum time (in seconds) to execute a cell. Defaults to 600.
+        warmup_code (str, optional): Code executed once in each new kernel. Defaults to WARMUP_CODE.
+        profile (bool, optional): Whether to record the wall time, peak RSS and number of Earth Engine requests of each
+            code cell in its 'performance' metadata. Defaults to True.
+    """
+
+    def __init__(self, size=None, kernel_name='python3', timeout=600, warmup_code=WARMUP_CODE, profile=True):
+        self.size = size or os.cpu_count() or 1
+        self.kernel_name = kernel_name
+        self.timeout = timeout
+        self.warmup_code = warmup_code
+        self.profile = profile
+        self.kernels = []
+        self.idle = None
+
+    async def start(self):
+        """Start and warm up all kernels concurrently."""
+        self.idle = asyncio.Queue()
+        await asyncio.gather(*[self._start_kernel() for _ in range(self.size)])
+
+    async def _start_kernel(self):
+        from jupyter_client import AsyncKernelManager
+
+        km = AsyncKernelManager(kernel_name=self.kernel_name)
+        await km.start_kernel()
+        kc = km.client()
+        kc.start_channels()
+        await kc.wait_for_ready(timeout=60)
+        await self._warmup(kc)
+
+        self.kernels.append((km, kc))
+        self.idle.put_nowait((km, kc))
+
+    async def _warmup(self, kc):
+        if os.environ.get('EE_REPLAY'):
+            await self._run(kc, REPLAY_CODE.format(path=os.path.dirname(os.path.abspath(__file__))))
+        await self._run(kc, self.warmup_code)
+        if self.profile:
+            await install_profile(kc, self.timeout)
+
+    async def _run(self, kc, code, store_history=True):
+        reply = await kc.execute_interactive(code, store_history=store_history, timeout=self.timeout,
+                                             output_hook=lambda msg: None)
+        return reply['content']['status'] == 'ok'
+
+    async def execute(self, in_file):
+        """Execute a notebook in the next idle kernel and save the output cells in place.
+
+        Args:
+            in_file (str): Input Jupyter notebook.
+
+        Returns:
+            tuple: The notebook path, the error message (None if the notebook ran without errors) and the wall time in seconds.
+        """
+        import nbformat
+        from nbclient import NotebookClient
+
+        km, kc = await self.idle.get()
+        start = time.perf_counter()
+        error = None
+        try:
+            path = os.path.dirname(os.path.abspath(in_file))
+            await self._run(kc, RESET_CODE.format(path=path), store_history=False)
+
+            nb = nbformat.read(in_file, as_version=4)
+            client = NotebookClient(nb, km=km, timeout=self.timeout, kernel_name=self.kernel_name)
+            client.kc = kc  # reuse the warm kernel client instead of starting a new one
+            if self.profile:
+                profile_hooks(client, install=False)
+            await client.async_execute()
+            nbformat.write(nb, in_file)
+        except Exception as e:
+            lines = re.sub(r'\x1b\[[0-9;]*m', '', str(e)).strip().splitlines()
+            error = '{}: {}'.format(type(e).__name__, lines[-1] if lines else '')
+        finally:
+            if not await km.is_alive():
+                await km.restart_kernel(now=True)
+                await kc.wait_for_ready(timeout=60)
+                await self._warmup(kc)
+            self.idle.put_nowait((km, kc))
+
+        return in_file, error, time.perf_counter() - start
+
+    async def shutdown(self):
+        """Shut down all kernels."""
+        for km, kc in self.kernels:
+            kc.stop_channels()
+            await km.shutdown_kernel(now=True)
+        self.kernels = []
+
+
+async def _execute_notebooks(files, kernels, timeout):
+    pool = KernelPool(min(kernels or os.cpu_count() or 1, len(files)), timeout=timeout)
+    start = time.perf_counter()
+    await pool.start()
+    print('Started {} kernels in {:.2f} s'.format(pool.size, time.perf_counter() - start))
+
+    count = len(files)
+    done = [0]
+
+    async def execute(in_file):
+        result = await pool.execute(in_file)
+        done[0] += 1
+        _, error, elapsed = result
+        if error is None:
+            print('Executed {}/{}: {} ({:.2f} s)'.format(done[0], count, in_file, elapsed))
+        else:
+            print('Failed {}/{}: {} ({:.2f} s) {}'.format(done[0], count, in_file, elapsed, error))
+        return result
+
+    try:
+        return await asyncio.gather(*[execute(in_file) for in_file in files])
+    finally:
+        await pool.shutdown()
+
+
+def execute_notebook(in_file, timeout=600, kernel_name='python3', profile=True):
+    """Execute a Jupyter notebook in a new kernel and save the output cells in place, like nbconvert --execute --inplace.
+
+    Args:
+        in_file (str): Input Jupyter notebook.
+        timeout (int, optional): Maximum time (in seconds) to execute a cell. Defaults to 600.
+        kernel_name (str, optional): Name of the kernel spec. Defaults to 'python3'.
+        profile (bool, optional): Whether to record the wall time, peak RSS and number of Earth Engine requests of each
+            code cell in its 'performance' metadata. Defaults to True.
+
+    Returns:
+        str: The error message, None if the notebook ran without errors. The notebook is only saved without errors.
+    """
+    import nbformat
+    from nbclient import NotebookClient
+
+    nb = nbformat.read(in_file, as_version=4)
+    path = os.path.dirname(os.path.abspath(in_file))
+    client = NotebookClient(nb, timeout=timeout, kernel_name=kernel_name, resources={'metadata': {'path': path}})
+    if profile:
+        profile_hooks(client)
+    try:
+        client.execute()
+    except Exception as e:
+        lines = re.sub(r'\x1b\[[0-9;]*m', '', str(e)).strip().splitlines()
+        return '{}: {}'.format(type(e).__name__, lines[-1] if lines else '')
+    nbformat.write(nb, in_file)
+    return None
+
+
+def execute_notebooks(files, kernels=None, timeout=600):
+    """Execute Jupyter notebooks concurrently in a pool of warm kernels and save output cells.
+
+    Args:
+        files (list): List of notebook paths.
+        kernels (int, optional): Number of kernels. Defaults to the number of CPUs.
+        timeout (int, optional): Maximum time (in seconds) to execute a cell. Defaults to 600.
+
+    Returns:
+        list: List of (in_file, error, seconds) tuples in the same order as files. error is None for successful notebooks.
+    """
+    if importlib.util.find_spec('nbclient') is None:
+        print('Please install nbclient using the following command:\n')
+        print('pip install nbclient')
+        return []
+
+    files = [str(f) for f in files]
+    if not files:
+        return []
+
+    start = time.perf_counter()
+    results = asyncio.run(_execute_notebooks(files, kernels, timeout))
+    elapsed = time.perf_counter() - start
+
+    failures = [result for result in results if result[1] is not None]
+    print('Executed {}/{} notebooks in {:.2f} s'.format(len(results) - len(failures), len(results), elapsed))
+    for in_file, error, _ in failures:
+        print('  {}: {}'.format(in_file, error))
+
+    return results
+
+
+if __name__ == '__main__':
+
+    import argparse
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--in_dir', type=str, default=os.path.join(root_dir, 'JavaScripts'),
+                        help="Folder containing Jupyter notebooks")
+    parser.add_argument('--kernels', type=int, default=None,
+                        help="Number of kernels")
+    parser.add_argument('--timeout', type=int, default=600,
+                        help="Maximum time (in seconds) to execute a cell")
+    args = parser.parse_args()
+    execute_notebooks(sorted(Path(args.in_dir).rglob('*.ipynb')), args.kernels, args.timeout)
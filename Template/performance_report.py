@@ -0,0 +1,287 @@
+''' Report how long each executed notebook and code cell takes, how much memory it uses and how many Earth Engine
+requests it makes, and how this changed since the previous report.
+
+The statistics are read from the 'performance' metadata recorded when the notebooks are executed (see kernel_pool.py).
+For notebooks executed by the nbconvert command line without it, the wall time is computed from the execution
+timestamps in the cell metadata.
+
+Usage: python performance_report.py [--in_dir ../JavaScripts] [--out_file performance.html]
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import csv
+import html
+import json
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+
+COLUMNS = ['notebook', 'cell', 'wall_time', 'previous_wall_time', 'change', 'peak_rss_mb', 'ee_calls']
+
+
+def parse_time(text):
+    return datetime.strptime(text.rstrip('Z')[:26], '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def cell_stats(cell):
+    """Get the performance statistics of an executed code cell.
+
+    Args:
+        cell (dict): The code cell.
+
+    Returns:
+        dict: The wall time in seconds, the peak RSS in MB and the number of Earth Engine requests. Statistics that
+            were not recorded are None. Returns None if the cell has no statistics at all.
+    """
+    metadata = cell.get('metadata', {})
+    stats = dict(metadata.get('performance') or {})
+    execution = metadata.get('execution', {})
+    if stats.get('wall_time') is None and 'iopub.execute_input' in execution and 'shell.execute_reply' in execution:
+        elapsed = parse_time(execution['shell.execute_reply']) - parse_time(execution['iopub.execute_input'])
+        stats['wall_time'] = round(elapsed.total_seconds(), 4)
+    if not stats:
+        return None
+
+    return {key: stats.get(key) for key in ['wall_time', 'peak_rss_mb', 'ee_calls']}
+
+
+def collect_stats(in_dir):
+    """Collect the statistics of all code cells of the notebooks in a folder recursively.
+
+    Args:
+        in_dir (str): Input folder containing executed notebooks.
+
+    Returns:
+        list: One dict per code cell with the notebook path relative to in_dir, the cell number (counting all cells
+            from 1) and the cell statistics.
+    """
+    rows = []
+    for in_file in sorted(Path(in_dir).rglob('*.ipynb')):
+        if '.ipynb_checkpoints' in in_file.parts:
+            continue
+        with open(in_file, encoding='utf-8') as f:
+            notebook = json.load(f)
+        name = in_file.relative_to(in_dir).as_posix()
+        for index, cell in enumerate(notebook['cells']):
+            if cell['cell_type'] != 'code':
+                continue
+            stats = cell_stats(cell)
+            if stats is not None:
+                rows.append(dict(notebook=name, cell=index + 1, **stats))
+    return rows
+
+
+def notebook_totals(rows):
+    """Aggregate cell statistics per notebook.
+
+    Args:
+        rows (list): Cell statistics, see collect_stats().
+
+    Returns:
+        list: One dict per notebook with the total wall time, the highest peak RSS and the total number of
+            Earth Engine requests of its cells.
+    """
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['notebook'], {'notebook': row['notebook'], 'cell': '',
+                                                     'wall_time': 0, 'peak_rss_mb': None, 'ee_calls': None})
+        total['wall_time'] = round(total['wall_time'] + (row['wall_time'] or 0), 4)
+        if row['peak_rss_mb'] is not None:
+            total['peak_rss_mb'] = max(total['peak_rss_mb'] or 0, row['peak_rss_mb'])
+        if row['ee_calls'] is not None:
+            total['ee_calls'] = (total['ee_calls'] or 0) + row['ee_calls']
+    return list(totals.values())
+
+
+def read_previous(previous_file):
+    """Read the wall times saved by the previous report.
+
+    Args:
+        previous_file (str): File path of the saved statistics.
+
+    Returns:
+        dict: The wall time keyed by (notebook, cell). The cell is '' for notebook totals.
+    """
+    previous = {}
+    if not os.path.exists(previous_file):
+        return previous
+    with open(previous_file, newline='') as f:
+        for row in csv.DictReader(f):
+            if row['wall_time']:
+                previous[(row['notebook'], row['cell'])] = float(row['wall_time'])
+    return previous
+
+
+def compare(rows, previous):
+    """Add the previous wall time and the relative change to each row, updating the rows in place.
+
+    Args:
+        rows (list): Cell statistics or notebook totals.
+        previous (dict): The previous wall times, see read_previous().
+    """
+    for row in rows:
+        before = previous.get((row['notebook'], str(row['cell'])))
+        row['previous_wall_time'] = before
+        row['change'] = None
+        if before and row['wall_time'] is not None:
+            row['change'] = round((row['wall_time'] - before) / before, 4)
+
+
+def write_csv(rows, out_file):
+    """Write statistics to a CSV file.
+
+    Args:
+        rows (list): Cell statistics and notebook totals.
+        out_file (str): Output CSV file.
+    """
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: '' if row.get(key) is None else row[key] for key in COLUMNS})
+
+
+def html_table(rows, title):
+    lines = ['<h2>{}</h2>'.format(html.escape(title)), '<table class="sortable">', '<tr>']
+    lines.extend('<th>{}</th>'.format(column) for column in COLUMNS)
+    lines.append('</tr>')
+    for row in rows:
+        cells = []
+        for column in COLUMNS:
+            value = row.get(column)
+            if value is None:
+                text = ''
+            elif column == 'change':
+                text = '{:+.1f}%'.format(value * 100)
+            else:
+                text = html.escape(str(value))
+            style = ' class="slower"' if column == 'change' and value is not None and value > 0.2 else ''
+            cells.append('<td{}>{}</td>'.format(style, text))
+        lines.append('<tr>{}</tr>'.format(''.join(cells)))
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+HTML_TEMPLATE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Notebook performance</title>
+<style>
+body {{ font-family: sans-serif; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 2px 8px; text-align: right; }}
+td:first-child {{ text-align: left; }}
+th {{ cursor: pointer; background: #eee; }}
+.slower {{ color: #c00; font-weight: bold; }}
+</style>
+</head>
+<body>
+<h1>Notebook performance</h1>
+<p>{summary}</p>
+{tables}
+<script>
+// click a column header to sort the table by that column
+document.querySelectorAll('table.sortable th').forEach(function (th, column) {{
+  th.addEventListener('click', function () {{
+    var table = th.closest('table');
+    var rows = Array.from(table.rows).slice(1);
+    var descending = th.dataset.order !== 'desc';
+    th.dataset.order = descending ? 'desc' : 'asc';
+    rows.sort(function (a, b) {{
+      var x = a.cells[th.cellIndex].textContent, y = b.cells[th.cellIndex].textContent;
+      var nx = parseFloat(x), ny = parseFloat(y);
+      var result = (isNaN(nx) || isNaN(ny)) ? x.localeCompare(y) : nx - ny;
+      return descending ? -result : result;
+    }});
+    rows.forEach(function (row) {{ table.appendChild(row); }});
+  }});
+}});
+</script>
+</body>
+</html>
+'''
+
+
+def write_html(notebooks, cells, out_file, top=50):
+    """Write statistics to an HTML file with sortable tables of the slowest notebooks and cells.
+
+    Args:
+        notebooks (list): Notebook totals.
+        cells (list): Cell statistics.
+        out_file (str): Output HTML file.
+        top (int, optional): Number of cells in the table of the slowest cells. Defaults to 50.
+    """
+    total = sum(row['wall_time'] or 0 for row in notebooks)
+    slower = [row for row in notebooks if row['change'] is not None and row['change'] > 0.2]
+    summary = '{} notebooks, {} code cells, {:.1f} s in total. {} notebooks are more than 20% slower than in the previous report.'.format(
+        len(notebooks), len(cells), total, len(slower))
+    tables = [
+        html_table(notebooks, 'Notebooks'),
+        html_table(cells[:top], 'Slowest cells'),
+    ]
+    with open(out_file, 'w', encoding='utf-8') as f:
+        f.write(HTML_TEMPLATE.format(summary=html.escape(summary), tables='\n'.join(tables)))
+
+
+def performance_report(in_dir, out_file, previous_file=None, top=50):
+    """Create a performance report of the executed notebooks in a folder recursively.
+    The statistics are saved to previous_file, so the next report shows the change since this one.
+
+    Args:
+        in_dir (str): Input folder containing executed notebooks.
+        out_file (str): Output report, either an HTML or a CSV file.
+        previous_file (str, optional): File path of the statistics of the previous report. Defaults to in_dir/.performance.csv.
+        top (int, optional): Number of cells in the table of the slowest cells of the HTML report. Defaults to 50.
+
+    Returns:
+        list: The notebook totals, slowest first.
+    """
+    if previous_file is None:
+        previous_file = os.path.join(in_dir, '.performance.csv')
+
+    cells = collect_stats(in_dir)
+    notebooks = notebook_totals(cells)
+    previous = read_previous(previous_file)
+    compare(cells, previous)
+    compare(notebooks, previous)
+
+    def slowest(row):
+        return -(row['wall_time'] or 0)
+    cells.sort(key=slowest)
+    notebooks.sort(key=slowest)
+
+    if out_file.endswith('.csv'):
+        write_csv(notebooks + cells, out_file)
+    else:
+        write_html(notebooks, cells, out_file, top)
+    write_csv(notebooks + cells, previous_file)
+
+    print('Performance report of {} notebooks saved at: {}'.format(len(notebooks), out_file))
+    for row in notebooks[:10]:
+        change = '' if row['change'] is None else ' ({:+.1f}%)'.format(row['change'] * 100)
+        print('  {:8.2f} s{}  {}'.format(row['wall_time'], change, row['notebook']))
+
+    return notebooks
+
+
+if __name__ == '__main__':
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--in_dir', type=str, default=os.path.join(root_dir, 'JavaScripts'),
+                        help="Folder containing executed Jupyter notebooks")
+    parser.add_argument('--out_file', type=str, default='performance.html',
+                        help="Output report, either an HTML or a CSV file")
+    parser.add_argument('--previous', type=str, default=None,
+                        help="Statistics of the previous report (defaults to in_dir/.performance.csv)")
+    parser.add_argument('--top', type=int, default=50,
+                        help="Number of cells in the table of the slowest cells")
+    args = parser.parse_args()
+    performance_report(args.in_dir, args.out_file, args.previous, args.top)
@@ -0,0 +1,174 @@
+''' Regenerate every notebook script (X.py) and notebook (X.ipynb) in the repo from the current notebook template.
+
+The header and footer cells of each script made from the template are replaced with the ones of Template/template.py,
+keeping the Earth Engine code in between. Only the template cells of the notebook are replaced: the other cells keep
+their outputs and execution counts, and the notebook keeps its JSON formatting, so its diff only shows the template.
+Template/template.ipynb is regenerated from Template/template.py too. Scripts not made from the template are left
+unchanged.
+
+Usage: python update_notebooks.py [--root_dir ..]
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import json
+import difflib
+import argparse
+from pathlib import Path
+
+from convert_js_to_python import load_template, template_sections, py_to_notebook, write_notebook
+
+
+def keep_cells(cells, existing_cells):
+    """Use the existing cells whose type and source did not change, with their outputs and execution counts.
+
+    Args:
+        cells (list): The new cells.
+        existing_cells (list): The cells of the existing notebook.
+
+    Returns:
+        list: The new cells, where the cells matching an existing cell are replaced with the existing cell.
+    """
+    def keys(cells):
+        return [(cell.get('cell_type'), ''.join(cell.get('source', ''))) for cell in cells]
+
+    cells = list(cells)
+    matcher = difflib.SequenceMatcher(None, keys(existing_cells), keys(cells), autojunk=False)
+    for existing_index, index, size in matcher.get_matching_blocks():
+        cells[index:index + size] = existing_cells[existing_index:existing_index + size]
+    return cells
+
+
+def dump_notebook(notebook, like_text=None):
+    """Serialize a notebook with the JSON formatting of an existing notebook file.
+
+    Args:
+        notebook (dict): The notebook.
+        like_text (str, optional): The text of the existing notebook. Defaults to None, i.e., like write_notebook().
+
+    Returns:
+        str: The notebook JSON.
+    """
+    if like_text is None:
+        return json.dumps(notebook, indent=2)
+    # the indent of the first key, e.g., ' "cells": [' for nbformat's 1-space indent
+    second_line = like_text.split('\n', 2)[1] if like_text.count('\n') > 1 else ''
+    indent = len(second_line) - len(second_line.lstrip(' ')) or None
+    ensure_ascii = like_text.isascii()
+    # notebooks saved by Jupyter have sorted keys, the ones written by write_notebook() do not
+    sort_keys = json.dumps(json.loads(like_text), indent=indent, ensure_ascii=ensure_ascii,
+                           sort_keys=True) == like_text.rstrip('\n')
+    text = json.dumps(notebook, indent=indent, ensure_ascii=ensure_ascii, sort_keys=sort_keys)
+    return text + '\n' if like_text.endswith('\n') else text
+
+
+def update_notebook(in_file, template_file, root_dir, github_username=None, github_repo=None):
+    """Replace the template cells of a notebook script and write its notebook.
+
+    Args:
+        in_file (str): The notebook script (X.py).
+        template_file (str): Input Jupyter notebook template.
+        root_dir (str): The root folder of the repo, used for the GitHub links.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+
+    Returns:
+        bool: True if the script or the notebook changed, None if the script is not made from the template.
+    """
+    with open(in_file) as f:
+        lines = f.readlines()
+
+    header_end_index, footer_start_index = template_sections(lines)
+    if header_end_index == 0 or footer_start_index < header_end_index:
+        return None
+
+    template = load_template(template_file)
+    if github_repo is not None:
+        # github_header() finds the path of the script in the repo after the repo name
+        repo_file = '/'.join([github_repo, Path(os.path.relpath(in_file, root_dir)).as_posix()])
+        header = template.github_header(repo_file, github_username, github_repo)
+    else:
+        header = template.header_text
+    # keep the blank lines between the code and the footer cells as they are
+    code_end_index = footer_start_index + 1
+    footer = template.footer_text[template.footer_text.index('# %%'):]
+    text = header + ''.join(lines[header_end_index:code_end_index]) + footer
+
+    out_file = os.path.splitext(in_file)[0] + '.ipynb'
+    notebook = py_to_notebook(text)
+    notebook_text = None
+    if os.path.exists(out_file):
+        with open(out_file, encoding='utf-8') as f:
+            existing_text = f.read()
+        existing = json.loads(existing_text)
+        # only the cells that changed, i.e., the template cells, are replaced, the notebook keeps its metadata
+        existing['cells'] = keep_cells(notebook['cells'], existing.get('cells', []))
+        notebook_text = dump_notebook(existing, existing_text)
+        changed = notebook_text != existing_text
+    else:
+        changed = True
+    if text != ''.join(lines):
+        with open(in_file, 'w') as f:
+            f.write(text)
+        changed = True
+    if changed:
+        if notebook_text is None:
+            write_notebook(notebook, out_file)
+        else:
+            with open(out_file, 'w', encoding='utf-8') as f:
+                f.write(notebook_text)
+    return changed
+
+
+def update_notebooks(root_dir, template_file, github_username=None, github_repo=None):
+    """Regenerate all notebook scripts and notebooks in a folder recursively from the template.
+
+    Args:
+        root_dir (str): The root folder of the repo.
+        template_file (str): Input Jupyter notebook template.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+
+    Returns:
+        list: The scripts that changed.
+    """
+    template_file = os.path.abspath(template_file)
+    files = sorted(str(f) for f in Path(root_dir).rglob('*.py')
+                   if not f.name.endswith('_qgis.py')
+                   and not any(part.startswith('.') for part in f.relative_to(root_dir).parts)
+                   and os.path.abspath(str(f.parent)) != os.path.dirname(template_file))
+    # the template notebook is made from the template like the other notebooks
+    files.insert(0, template_file)
+
+    changed = []
+    skipped = []
+    for in_file in files:
+        result = update_notebook(in_file, template_file, root_dir, github_username, github_repo)
+        if result is None:
+            skipped.append(in_file)
+        elif result:
+            changed.append(in_file)
+
+    print('Updated {} of {} notebooks from {}'.format(len(changed), len(files) - len(skipped), template_file))
+    if skipped:
+        print('{} scripts are not made from the template and were left unchanged:'.format(len(skipped)))
+        for in_file in skipped:
+            print('  {}'.format(in_file))
+    return changed
+
+
+if __name__ == '__main__':
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root_dir', type=str, default=root_dir, help="Root folder of the repo")
+    parser.add_argument('--template', type=str, default=os.path.join(root_dir, 'Template', 'template.py'),
+                        help="Jupyter notebook template")
+    parser.add_argument('--github_username', type=str, default='giswqs', help="GitHub username")
+    parser.add_argument('--github_repo', type=str, default='earthengine-py-notebooks', help="GitHub repo name")
+    args = parser.parse_args()
+    update_notebooks(args.root_dir, args.template, args.github_username, args.github_repo)
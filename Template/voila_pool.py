@@ -0,0 +1,187 @@
+''' Keep pre-heated Voila kernels for the most requested notebooks.
+
+With --preheat_kernel=True, Voila renders a notebook in a kernel before anyone asks for it, so a visitor gets a kernel
+that has already imported ee and geemap, called ee.Initialize() and run the notebook. This kernel manager decides how
+many of these kernels each notebook gets from its recent request rate, instead of the same number for every notebook:
+
+    voila --preheat_kernel=True --VoilaConfiguration.multi_kernel_manager_class=voila_pool.AdaptivePoolKernelManager
+
+The request counts are saved to a file, so the busiest notebooks are pre-heated right after a restart.
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import json
+import math
+import time
+from collections import deque
+
+from tornado.ioloop import PeriodicCallback
+from traitlets import Float, Int, Unicode
+from jupyter_server.services.kernels.kernelmanager import AsyncMappingKernelManager
+
+
+class RequestRates(object):
+    """Count the requests of each notebook in a sliding time window.
+
+    Args:
+        window (float, optional): Length of the window in seconds. Defaults to 600.
+    """
+
+    def __init__(self, window=600):
+        self.window = window
+        self.requests = {}
+
+    def record(self, name, now=None):
+        """Record a request.
+
+        Args:
+            name (str): The notebook path.
+            now (float, optional): Time of the request (time.time()). Defaults to now.
+        """
+        self.requests.setdefault(name, deque()).append(time.time() if now is None else now)
+
+    def rates(self, now=None):
+        """Compute the request rate of each notebook, forgetting the requests older than the window.
+
+        Args:
+            now (float, optional): The current time (time.time()). Defaults to now.
+
+        Returns:
+            dict: Requests per minute keyed by notebook path, for the notebooks requested within the window.
+        """
+        now = time.time() if now is None else now
+        rates = {}
+        for name in list(self.requests):
+            times = self.requests[name]
+            while times and times[0] < now - self.window:
+                times.popleft()
+            if times:
+                rates[name] = len(times) * 60.0 / self.window
+            else:
+                del self.requests[name]
+        return rates
+
+    def save(self, out_file):
+        with open(out_file + '.tmp', 'w') as f:
+            json.dump({name: list(times) for name, times in self.requests.items()}, f)
+        os.replace(out_file + '.tmp', out_file)
+
+    def load(self, in_file):
+        try:
+            with open(in_file) as f:
+                requests = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, times in requests.items():
+            self.requests[name] = deque(sorted(times))
+
+
+def pool_sizes(rates, max_kernels=8, max_pool_size=4, start_time=20):
+    """Share pre-heated kernels between notebooks according to their request rates.
+
+    A notebook gets enough kernels for the requests expected while a used kernel is replaced, i.e.,
+    rate * start_time, at least one and at most max_pool_size. The busiest notebooks are served first until
+    max_kernels kernels are used.
+
+    Args:
+        rates (dict): Requests per minute keyed by notebook path.
+        max_kernels (int, optional): Total number of pre-heated kernels. Defaults to 8.
+        max_pool_size (int, optional): Maximum number of pre-heated kernels per notebook. Defaults to 4.
+        start_time (float, optional): Time in seconds to start a kernel and render the notebook. Defaults to 20.
+
+    Returns:
+        dict: Number of pre-heated kernels keyed by notebook path, for the notebooks getting at least one.
+    """
+    sizes = {}
+    left = max_kernels
+    for name, rate in sorted(rates.items(), key=lambda item: (-item[1], item[0])):
+        if left <= 0:
+            break
+        size = min(max_pool_size, left, max(1, int(math.ceil(rate * start_time / 60.0))))
+        sizes[name] = size
+        left -= size
+    return sizes
+
+
+class AdaptivePoolKernelManager(AsyncMappingKernelManager):
+    """A kernel manager for Voila with pre-heated kernel pools sized by the recent request rate of each notebook.
+    Voila adds the pools on top of this class when it runs with --preheat_kernel=True.
+    """
+
+    max_kernels = Int(8, config=True, help="Total number of pre-heated kernels")
+    max_pool_size = Int(4, config=True, help="Maximum number of pre-heated kernels per notebook")
+    rate_window = Float(600, config=True, help="Time window in seconds for computing request rates")
+    adapt_interval = Float(30, config=True, help="Time in seconds between two updates of the pool sizes")
+    start_time = Float(20, config=True, help="Estimated time in seconds to start a kernel and render a notebook")
+    requests_file = Unicode('.voila_requests.json', config=True,
+                            help="File keeping the request times between restarts, relative to the root folder")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rates = RequestRates(self.rate_window)
+        if not hasattr(self, 'kernel_pools_config'):
+            self.log.warning('Start Voila with --preheat_kernel=True to use pre-heated kernels.')
+            return
+
+        self.requests_path = os.path.join(self.parent.root_dir, self.requests_file)
+        self.rates.load(self.requests_path)
+        self.pool_sizes = pool_sizes(self.rates.rates(), self.max_kernels, self.max_pool_size, self.start_time)
+        self.kernel_pools_config = self.pools_config(self.pool_sizes)
+        self.log.info('Pre-heated kernel pools: %s', self.pool_sizes)
+
+        # Voila asks for the pool size of a notebook on every request to it, so that is where requests are counted.
+        get_pool_size = self.get_pool_size
+
+        def count_request(notebook_name):
+            self.rates.record(notebook_name)
+            return get_pool_size(notebook_name)
+
+        self.get_pool_size = count_request
+        self.adapt_callback = PeriodicCallback(self.adapt, self.adapt_interval * 1000)
+        self.adapt_callback.start()
+
+    def pools_config(self, sizes):
+        config = dict(self.kernel_pools_config)
+        default = dict(config.get('default', {}))
+        default['pool_size'] = 0
+        config['default'] = default
+        for name in list(config):
+            if name != 'default' and name not in sizes:
+                del config[name]
+        for name, size in sizes.items():
+            config[name] = dict(config.get(name, {}), pool_size=size)
+        return config
+
+    async def adapt(self):
+        """Resize the kernel pools to the current request rates."""
+        sizes = pool_sizes(self.rates.rates(), self.max_kernels, self.max_pool_size, self.start_time)
+        self.rates.save(self.requests_path)
+        if sizes == self.pool_sizes:
+            return
+
+        self.log.info('Resizing pre-heated kernel pools: %s', sizes)
+        self.kernel_pools_config = self.pools_config(sizes)
+        self.pool_sizes = sizes
+
+        for name, pool in list(self._pools.items()):
+            size = sizes.get(name, 0)
+            # only kernels that have finished pre-heating are shut down, the others are used first anyway
+            while len(pool) > size and pool[-1].done():
+                task = pool.pop()
+                try:
+                    kernel_id = task.result()['kernel_id']
+                except Exception:
+                    continue
+                await self.shutdown_kernel(kernel_id)
+        for name in sizes:
+            self.fill_if_needed(delay=0, notebook_name=name)
+
+    async def shutdown_all(self, *args, **kwargs):
+        if hasattr(self, 'adapt_callback'):
+            self.adapt_callback.stop()
+            self.rates.save(self.requests_path)
+        await super().shutdown_all(*args, **kwargs)
@@ -0,0 +1,211 @@
+''' Serve gallery notebooks from pre-rendered static HTML snapshots, starting a Voila kernel only on request.
+
+Most visitors only look at a notebook, so its executed outputs (including the saved widget state of the map) are
+rendered to static HTML once and served as is. Snapshots are keyed by the hash of the notebook file, so a changed
+notebook gets a new snapshot. Each snapshot has a button that reloads the page with ?live=1, which is served by Voila
+with a kernel as usual.
+
+To render all snapshots in advance: python voila_snapshots.py --build [root_dir]
+To serve the folder (takes the same arguments as voila): python voila_snapshots.py --port=8866 --no-browser ./
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import sys
+import hashlib
+import threading
+from pathlib import Path
+
+
+SNAPSHOT_DIR = '.snapshots'
+
+INTERACT_BUTTON = '''
+<a href="?live=1" style="position: fixed; top: 12px; right: 12px; z-index: 1000; padding: 8px 14px;
+   background: #1976d2; color: #fff; border-radius: 4px; font-family: sans-serif; text-decoration: none;">
+   Run interactively</a>
+'''
+
+
+def has_outputs(notebook):
+    return any(cell.get('outputs') for cell in notebook['cells'] if cell['cell_type'] == 'code')
+
+
+class SnapshotStore(object):
+    """Static HTML snapshots of notebooks, keyed by the SHA-256 of the notebook file.
+
+    Args:
+        root_dir (str): The folder served by Voila.
+        snapshot_dir (str, optional): The folder of the snapshots. Defaults to root_dir/.snapshots.
+    """
+
+    def __init__(self, root_dir, snapshot_dir=None):
+        self.root_dir = os.path.realpath(root_dir)
+        self.snapshot_dir = snapshot_dir or os.path.join(self.root_dir, SNAPSHOT_DIR)
+        self.hashes = {}  # (modification time, size) and hash of each notebook
+        self.exporter = None
+        self.lock = threading.Lock()  # the exporter is shared by the threads rendering snapshots
+
+    def notebook_hash(self, in_file):
+        stat = os.stat(in_file)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.hashes.get(in_file)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(in_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self.hashes[in_file] = (key, digest)
+        return digest
+
+    def path(self, digest):
+        return os.path.join(self.snapshot_dir, digest + '.html')
+
+    def render(self, in_file):
+        """Render an executed notebook to static HTML.
+
+        Args:
+            in_file (str): Input Jupyter notebook.
+
+        Returns:
+            str: The HTML page, or None if the notebook has no outputs.
+        """
+        import nbformat
+        from nbconvert import HTMLExporter
+
+        notebook = nbformat.read(in_file, as_version=4)
+        if not has_outputs(notebook):
+            return None
+        with self.lock:
+            if self.exporter is None:
+                self.exporter = HTMLExporter(template_name='lab', exclude_input=True, exclude_input_prompt=True,
+                                             exclude_output_prompt=True)
+            body, _ = self.exporter.from_notebook_node(notebook)
+        return body.replace('</body>', INTERACT_BUTTON + '</body>', 1)
+
+    def resolve(self, notebook_path):
+        """Find the file of a notebook served from root_dir.
+
+        Args:
+            notebook_path (str): The notebook path relative to root_dir.
+
+        Returns:
+            str: The notebook file, or None if the path is outside root_dir, in a hidden folder or not a notebook.
+        """
+        in_file = os.path.realpath(os.path.join(self.root_dir, notebook_path))
+        relative_path = os.path.relpath(in_file, self.root_dir)
+        if os.path.isabs(relative_path) or relative_path.split(os.sep)[0] == os.pardir:
+            return None
+        if any(part.startswith('.') for part in relative_path.split(os.sep)):
+            return None
+        if not in_file.endswith('.ipynb') or not os.path.isfile(in_file):
+            return None
+        return in_file
+
+    def get(self, notebook_path):
+        """Get the snapshot of a notebook, rendering it if the notebook changed since the last snapshot.
+
+        Args:
+            notebook_path (str): The notebook path relative to root_dir.
+
+        Returns:
+            str: The HTML page, or None if the notebook does not exist or has no outputs.
+        """
+        in_file = self.resolve(notebook_path)
+        if in_file is None:
+            return None
+
+        snapshot_file = self.path(self.notebook_hash(in_file))
+        if os.path.exists(snapshot_file):
+            with open(snapshot_file, encoding='utf-8') as f:
+                return f.read()
+
+        html = self.render(in_file)
+        if html is not None:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            with open(snapshot_file + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(snapshot_file + '.tmp', snapshot_file)
+        return html
+
+    def build(self):
+        """Render the snapshots of all notebooks in root_dir and delete the snapshots of notebooks that changed.
+
+        Returns:
+            int: Number of notebooks with a snapshot.
+        """
+        files = sorted(str(f) for f in Path(self.root_dir).rglob('*.ipynb')
+                       if not any(part.startswith('.') for part in f.relative_to(self.root_dir).parts))
+        current = set()
+        for index, in_file in enumerate(files):
+            print('Processing {}/{}: {}'.format(index + 1, len(files), in_file))
+            if self.get(os.path.relpath(in_file, self.root_dir)) is not None:
+                current.add(self.path(self.notebook_hash(in_file)))
+
+        if os.path.isdir(self.snapshot_dir):
+            for name in os.listdir(self.snapshot_dir):
+                snapshot_file = os.path.join(self.snapshot_dir, name)
+                if snapshot_file not in current:
+                    os.remove(snapshot_file)
+
+        print('{} snapshots saved at: {}'.format(len(current), self.snapshot_dir))
+        return len(current)
+
+
+def snapshot_voila():
+    """Create the Voila application class serving snapshots.
+
+    Returns:
+        class: A subclass of voila.app.Voila.
+    """
+    import tornado.web
+    from tornado.ioloop import IOLoop
+    from voila.app import Voila
+    try:
+        from voila.tornado.handler import TornadoVoilaHandler as VoilaHandler
+    except ImportError:
+        from voila.handler import VoilaHandler
+
+    class SnapshotVoilaHandler(VoilaHandler):
+
+        @tornado.web.authenticated
+        async def get(self, path=None):
+            notebook_path = getattr(self, 'notebook_path', None) or path
+            if notebook_path and not self.get_argument('live', None):
+                store = self.settings['voila_snapshots']
+                if store.resolve(notebook_path) is None:
+                    raise tornado.web.HTTPError(404)
+                # rendering a snapshot takes a while, it must not block the other requests
+                html = await IOLoop.current().run_in_executor(None, store.get, notebook_path)
+                if html is not None:
+                    self.set_header('Content-Type', 'text/html; charset=UTF-8')
+                    self.finish(html)
+                    return
+            await super().get(path)
+
+    class SnapshotVoila(Voila):
+
+        def init_settings(self):
+            settings = super().init_settings()
+            settings['voila_snapshots'] = SnapshotStore(self.root_dir)
+            return settings
+
+        def init_handlers(self):
+            handlers = []
+            for handler in super().init_handlers():
+                if handler[1] is VoilaHandler:
+                    handler = (handler[0], SnapshotVoilaHandler) + tuple(handler[2:])
+                handlers.append(handler)
+            return handlers
+
+    return SnapshotVoila
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--build':
+        root_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        SnapshotStore(root_dir).build()
+    else:
+        snapshot_voila().launch_instance()
@@ -0,0 +1,475 @@
+''' Watch a folder and rebuild the files derived from each Earth Engine script as soon as it is saved.
+
+    X.js        ->  X.py, X_qgis.py, X.ipynb
+    X.py        ->  X.ipynb
+    template.py ->  every notebook in the folder
+
+The converter and the parsed notebook template stay loaded between rebuilds, so a rebuild only costs the conversion
+of the changed files. File changes are detected with inotify on Linux and by polling file modification times elsewhere.
+
+Usage: python watch_gallery.py [--in_dir ../JavaScripts] [--execute]
+
+'''
+
+# Authors: Dr. Qiusheng Wu (https://wetlands.io)
+# License: MIT
+
+import os
+import sys
+import json
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+import traceback
+
+from convert_js_to_python import js_to_targets, py_to_ipynb, py_to_notebook, write_notebook, load_template
+from update_notebooks import update_notebook
+
+
+# inotify event masks, see /usr/include/linux/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x00004000
+EVENT_HEADER = struct.Struct('iIII')
+
+SKIP_DIRS = ['__pycache__', 'node_modules']
+
+
+def watched_dirs(in_dir):
+    """List a folder and its subfolders, skipping hidden and cache folders.
+
+    Args:
+        in_dir (str): The folder to watch.
+
+    Returns:
+        list: The folder paths.
+    """
+    dirs = []
+    for root, sub_dirs, _ in os.walk(in_dir):
+        sub_dirs[:] = [d for d in sub_dirs if not d.startswith('.') and d not in SKIP_DIRS]
+        dirs.append(root)
+    return dirs
+
+
+class InotifyWatcher(object):
+    """Report changed files in a folder recursively with Linux inotify.
+
+    Args:
+        in_dir (str): The folder to watch.
+    """
+
+    def __init__(self, in_dir):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        for path in watched_dirs(in_dir):
+            self.add_dir(path)
+
+    def add_dir(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd >= 0:
+            self.dirs[wd] = path
+
+    def changes(self, timeout=None):
+        """Wait for file changes.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds. Defaults to None, which waits forever.
+
+        Returns:
+            set: Paths of the changed files. Empty if nothing changed within the timeout.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                print('Too many file changes at once. Some changes may be missed.')
+                continue
+            if wd not in self.dirs:
+                continue
+            path = os.path.join(self.dirs[wd], name)
+            if mask & IN_ISDIR:
+                if mask & IN_CREATE and not name.startswith('.') and name not in SKIP_DIRS:
+                    for sub_dir in watched_dirs(path):
+                        self.add_dir(sub_dir)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.add(path)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """Report changed files in a folder recursively by comparing file modification times.
+
+    Args:
+        in_dir (str): The folder to watch.
+        interval (float, optional): Time between two scans in seconds. Defaults to 0.5.
+    """
+
+    def __init__(self, in_dir, interval=0.5):
+        self.in_dir = in_dir
+        self.interval = interval
+        self.mtimes = self.scan()
+
+    def scan(self):
+        mtimes = {}
+        for path in watched_dirs(self.in_dir):
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        try:
+                            mtimes[entry.path] = entry.stat().st_mtime_ns
+                        except FileNotFoundError:
+                            pass
+        return mtimes
+
+    def changes(self, timeout=None):
+        """Wait for file changes.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds. Defaults to None, which waits forever.
+
+        Returns:
+            set: Paths of the changed files. Empty if nothing changed within the timeout.
+        """
+        start = time.monotonic()
+        while True:
+            mtimes = self.scan()
+            changed = set(path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime)
+            self.mtimes = mtimes
+            if changed:
+                return changed
+            if timeout is not None and time.monotonic() - start >= timeout:
+                return changed
+            time.sleep(self.interval if timeout is None else max(0, min(self.interval, timeout)))
+
+    def close(self):
+        pass
+
+
+def create_watcher(in_dir, poll_interval=0.5):
+    """Create an inotify watcher, or a polling watcher if inotify is not available.
+
+    Args:
+        in_dir (str): The folder to watch.
+        poll_interval (float, optional): Time between two scans of the polling watcher in seconds. Defaults to 0.5.
+
+    Returns:
+        object: An InotifyWatcher or a PollingWatcher.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(in_dir)
+        except OSError as e:
+            print('inotify is not available ({}). Polling for file changes instead.'.format(e))
+    return PollingWatcher(in_dir, poll_interval)
+
+
+class GalleryWatcher(object):
+    """Rebuild the files derived from changed Earth Engine scripts.
+
+    Args:
+        in_dir (str): The folder containing Earth Engine JavaScripts and Python scripts.
+        template_file (str): Input Jupyter notebook template.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+        execute (bool, optional): Whether to execute rebuilt notebooks. Defaults to False.
+        cache_dir (str, optional): Folder of the execution cache. Defaults to None.
+        debounce (float, optional): Time in seconds without new changes before a rebuild starts. Defaults to 0.2.
+        poll_interval (float, optional): Time between two scans if inotify is not available. Defaults to 0.5.
+    """
+
+    def __init__(self, in_dir, template_file, github_username=None, github_repo=None, execute=False,
+                 cache_dir=None, debounce=0.2, poll_interval=0.5):
+        self.in_dir = os.path.abspath(in_dir)
+        self.template_file = os.path.abspath(template_file)
+        self.github_username = github_username
+        self.github_repo = github_repo
+        self.execute = execute
+        self.cache_dir = cache_dir
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.written = {}  # modification time of each file written by the last rebuilds
+        # the template is in the Template folder of the repo, the GitHub links are relative to the repo
+        self.root_dir = os.path.dirname(os.path.dirname(self.template_file))
+        load_template(self.template_file)
+
+    def targets(self, path, template_changed=False):
+        """Find the build function for a changed file.
+
+        Args:
+            path (str): Path of the changed file.
+            template_changed (bool, optional): Whether the file is rebuilt because the template changed.
+                Defaults to False.
+
+        Returns:
+            list: List of (function, args) tuples.
+        """
+        if path == self.template_file:
+            return [task for in_file in self.sources() for task in self.targets(in_file, True)]
+
+        base, ext = os.path.splitext(path)
+        if ext == '.js':
+            return [(js_to_targets, (path, self.template_file, self.github_username, self.github_repo))]
+        if ext == '.py' and not base.endswith('_qgis'):
+            if os.path.exists(base + '.js'):
+                # X.py is the notebook script generated from X.js, so it only needs to be split into cells.
+                return [(script_to_ipynb, (path,))]
+            if not is_qgis_script(path):
+                # a notebook script: its template cells are replaced, keeping its Earth Engine code
+                return [(retemplate_script, (path, self.template_file, self.root_dir, self.github_username,
+                                             self.github_repo, not template_changed))]
+            return [(py_to_ipynb, (path, self.template_file, base + '.ipynb', self.github_username, self.github_repo))]
+        return []
+
+    def sources(self):
+        sources = []
+        for path in watched_dirs(self.in_dir):
+            for name in sorted(os.listdir(path)):
+                base, ext = os.path.splitext(name)
+                if ext == '.js' or (ext == '.py' and not base.endswith('_qgis')
+                                    and not os.path.exists(os.path.join(path, base + '.js'))):
+                    sources.append(os.path.join(path, name))
+        return sources
+
+    def outputs(self, path, function=None):
+        base = os.path.splitext(path)[0]
+        if path.endswith('.js'):
+            return [base + '.py', base + '_qgis.py', base + '.ipynb']
+        if function is retemplate_script:
+            return [path, base + '.ipynb']
+        return [base + '.ipynb']
+
+    def is_own_write(self, path):
+        try:
+            return self.written.get(path) == os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return True
+
+    def rebuild(self, changed):
+        """Rebuild the files derived from the changed files.
+
+        Args:
+            changed (set): Paths of the changed files.
+
+        Returns:
+            list: Paths of the rebuilt files.
+        """
+        changed = sorted(path for path in changed if not self.is_own_write(path))
+        tasks = []
+        for path in changed:
+            for task in self.targets(path):
+                if task not in tasks:
+                    tasks.append(task)
+        if not tasks:
+            return []
+
+        start = time.perf_counter()
+        rebuilt = []
+        for function, args in tasks:
+            outputs = self.outputs(args[0], function)
+            previous = read_files(outputs)
+            try:
+                function(*args)
+                # the notebook script, or the QGIS-style script the notebook was made from
+                script = outputs[0] if args[0].endswith('.js') else args[0]
+                dropped = dropped_code(script, outputs[-1])
+                if dropped:
+                    raise ValueError('The rebuilt notebook {} lacks {} code lines of {}, e.g., {!r}. The previous files '
+                                     'were restored.'.format(outputs[-1], len(dropped), script, dropped[0]))
+            except Exception:
+                restore_files(previous)
+                print('Failed to rebuild from {}:\n{}'.format(args[0], traceback.format_exc().rstrip()))
+                continue
+
+            if self.execute:
+                from build_gallery import execute_notebook_cached
+                try:
+                    execute_notebook_cached(outputs[-1], self.cache_dir)
+                except Exception as e:
+                    print(e)
+            for out_file in outputs:
+                self.written[out_file] = os.stat(out_file).st_mtime_ns
+            rebuilt.extend(outputs)
+
+        print('Rebuilt {} files from {} changed files in {:.0f} ms'.format(
+            len(rebuilt), len(changed), (time.perf_counter() - start) * 1000))
+        return rebuilt
+
+    def watch(self, watcher=None):
+        """Watch the folder and rebuild changed files until interrupted with Ctrl+C.
+
+        Args:
+            watcher (object, optional): An InotifyWatcher or a PollingWatcher. Defaults to create_watcher(in_dir).
+        """
+        if watcher is None:
+            watcher = create_watcher(self.in_dir, self.poll_interval)
+        template_dir = os.path.dirname(self.template_file)
+        template_watcher = None
+        if not (template_dir + os.sep).startswith(self.in_dir + os.sep):
+            template_watcher = PollingWatcher(template_dir, self.poll_interval)
+
+        print('Watching {} for changes. Press Ctrl+C to stop.'.format(self.in_dir))
+        try:
+            while True:
+                changed = watcher.changes(self.poll_interval if template_watcher else None)
+                if template_watcher is not None:
+                    changed |= set(path for path in template_watcher.changes(0) if path == self.template_file)
+                if not changed:
+                    continue
+
+                # wait until the editor has finished saving, e.g., several files or a write followed by a rename
+                while True:
+                    more = watcher.changes(self.debounce)
+                    if not more:
+                        break
+                    changed |= more
+
+                self.rebuild(changed)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
+
+
+def is_qgis_script(in_file):
+    """Check whether a Python script is a QGIS-style script importing Map from ee_plugin, without cell markers.
+
+    Args:
+        in_file (str): Input Python script.
+
+    Returns:
+        bool: True if the notebook has to be made from the script and the template with py_to_ipynb().
+    """
+    with open(in_file) as f:
+        lines = f.readlines()
+    if any(line.startswith('# %%') for line in lines):
+        return False
+    return any('from ee_plugin import Map' in line for line in lines)
+
+
+def code_lines(text):
+    return [line.strip() for line in text.splitlines()
+            if line.strip() and not line.strip().startswith('#') and 'ee_plugin' not in line]
+
+
+def notebook_code(notebook):
+    return '\n'.join(''.join(cell['source']) for cell in notebook['cells'] if cell['cell_type'] == 'code')
+
+
+def dropped_code(script_file, notebook_file):
+    """Find the code lines of a script missing from the code cells of the notebook made from it.
+
+    Args:
+        script_file (str): The notebook script, or the QGIS-style script the notebook is made from.
+        notebook_file (str): The notebook.
+
+    Returns:
+        list: The missing lines. The import of ee_plugin is left out, it is removed on purpose.
+    """
+    with open(script_file) as f:
+        text = f.read()
+    if any(line.startswith('# %%') for line in text.splitlines()):
+        # the markdown cells of a notebook script are docstrings, only its code cells become code
+        text = notebook_code(py_to_notebook(text))
+    with open(notebook_file, encoding='utf-8') as f:
+        code = set(code_lines(notebook_code(json.load(f))))
+    return [line for line in code_lines(text) if line not in code]
+
+
+def read_files(files):
+    contents = {}
+    for path in files:
+        try:
+            with open(path, 'rb') as f:
+                contents[path] = f.read()
+        except FileNotFoundError:
+            contents[path] = None
+    return contents
+
+
+def restore_files(contents):
+    for path, content in contents.items():
+        if content is None:
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            with open(path, 'wb') as f:
+                f.write(content)
+
+
+def retemplate_script(in_file, template_file, root_dir, github_username=None, github_repo=None, split=True):
+    """Replace the template cells of a notebook script (X.py) with the ones of the template and write its notebook.
+
+    Args:
+        in_file (str): Input notebook script.
+        template_file (str): Input Jupyter notebook template.
+        root_dir (str): The root folder of the repo, used for the GitHub links.
+        github_username (str, optional): GitHub username. Defaults to None.
+        github_repo (str, optional): GitHub repo name. Defaults to None.
+        split (bool, optional): Whether to split a script not made from the template into cells, e.g., when the
+            script changed. Such scripts are left unchanged otherwise. Defaults to True.
+    """
+    if update_notebook(in_file, template_file, root_dir, github_username, github_repo) is None and split:
+        script_to_ipynb(in_file)
+
+
+def script_to_ipynb(in_file):
+    """Convert a notebook script with '# %%' cell markers (X.py) to a Jupyter notebook (X.ipynb).
+
+    Args:
+        in_file (str): Input notebook script.
+    """
+    with open(in_file) as f:
+        text = f.read()
+    write_notebook(py_to_notebook(text), os.path.splitext(in_file)[0] + '.ipynb')
+
+
+if __name__ == '__main__':
+
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--in_dir', type=str, default=os.path.join(root_dir, 'JavaScripts'),
+                        help="Folder containing Earth Engine scripts")
+    parser.add_argument('--template', type=str, default=os.path.join(root_dir, 'Template', 'template.py'),
+                        help="Jupyter notebook template")
+    parser.add_argument('--github_username', type=str, default='giswqs', help="GitHub username")
+    parser.add_argument('--github_repo', type=str, default='earthengine-py-notebooks', help="GitHub repo name")
+    parser.add_argument('--execute', action='store_true', help="Execute rebuilt notebooks")
+    parser.add_argument('--debounce', type=float, default=0.2,
+                        help="Time in seconds without new changes before a rebuild starts")
+    parser.add_argument('--poll', action='store_true', help="Poll for file changes instead of using inotify")
+    args = parser.parse_args()
+
+    in_dir = os.path.abspath(args.in_dir)
+    gallery = GalleryWatcher(in_dir, args.template, args.github_username, args.github_repo, args.execute,
+                             cache_dir=os.path.join(in_dir, '.execution_cache'), debounce=args.debounce)
+    gallery.watch(PollingWatcher(in_dir) if args.poll else None)